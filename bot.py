@@ -12,14 +12,26 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-from aiogram import Bot, Dispatcher
+from aiogram import Bot
 from aiogram.fsm.storage.memory import MemoryStorage
 from config import settings
-from database.db import init_db
+from database.db import init_db_async, close_db
+from database.write_behind import user_write_queue
+from database.backup import backup_manager
+from database.stats import stats_reconciler
+from database.updates import update_log
 from middleware.rate_limit_middleware import RateLimitMiddleware
+from middleware.load_shedding import LoadSheddingMiddleware, load_monitor
+from middleware.update_dedup import DeduplicatingDispatcher
+from utils.rate_limit import rate_limit_sweeper
+from utils.subscription_sweeper import subscription_sweeper
+from utils.roster import roster_service
+from utils.broadcast_worker import broadcast_worker
+from utils.channel_helper import get_bot_info, resolve_required_channels
 from handlers.start import router as start_router
 from handlers.registration import router as registration_router
 from handlers.subscription import router as subscription_router
+from handlers.channel_members import router as channel_members_router
 from handlers.menu import router as menu_router
 from handlers.info import router as info_router
 from handlers.quiz import router as quiz_router
@@ -38,23 +50,43 @@ async def main():
     try:
         # Инициализация БД
         logger.info("📦 Инициализация базы данных...")
-        init_db()
+        await init_db_async()
+        user_write_queue.start()
+        backup_manager.start()
+        stats_reconciler.start()
         logger.info("✅ База данных готова")
         
         # Создание бота и диспетчера
         logger.info("🤖 Создание бота...")
         bot = Bot(token=settings.BOT_TOKEN)
-        bot_info = await bot.get_me()
+        bot_info = await get_bot_info(bot)
         logger.info(f"✅ Бот авторизован: @{bot_info.username} (ID: {bot_info.id})")
         
-        dp = Dispatcher(storage=MemoryStorage())
+        # Каналы проверяются один раз: дальше проверки подписки идут по готовым ID
+        logger.info("📡 Проверка обязательных каналов...")
+        await resolve_required_channels(bot, strict=settings.CHANNELS_STRICT)
+        if roster_service is not None:
+            roster_service.start()
+        subscription_sweeper.start(bot)
+        # Рассылки, прерванные перезапуском, продолжаются с последней контрольной точки
+        broadcast_worker.start(bot)
+        
+        # Уже обработанные апдейты (после перезапуска) отбрасываются до middleware
+        await update_log.load()
+        dp = DeduplicatingDispatcher(storage=MemoryStorage())
         
         # Регистрация middleware для защиты от спама
         logger.info("🛡️ Регистрация middleware защиты...")
         # В aiogram 3.x используем outer_middleware для глобальной защиты
+        # Сброс нагрузки — первым, чтобы под перегрузкой не тратить даже проверку лимита
+        load_shedding_middleware = LoadSheddingMiddleware(load_monitor)
+        dp.message.outer_middleware(load_shedding_middleware)
+        dp.callback_query.outer_middleware(load_shedding_middleware)
         rate_limit_middleware = RateLimitMiddleware()
         dp.message.outer_middleware(rate_limit_middleware)
         dp.callback_query.outer_middleware(rate_limit_middleware)
+        rate_limit_sweeper.start()
+        load_monitor.start()
         logger.info("✅ Middleware защиты зарегистрированы")
         
         # Регистрация роутеров
@@ -63,6 +95,7 @@ async def main():
         dp.include_router(start_router)
         dp.include_router(registration_router)
         dp.include_router(subscription_router)
+        dp.include_router(channel_members_router)
         dp.include_router(menu_router)
         dp.include_router(info_router)
         dp.include_router(demo_projects_router)
@@ -75,11 +108,23 @@ async def main():
         logger.info("✅ Бот запущен и готов к работе!")
         logger.info("=" * 50)
         
-        # Запуск polling
-        await dp.start_polling(bot)
+        # Запуск polling (chat_member Telegram присылает только по явному запросу)
+        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     except Exception as e:
         logger.error(f"❌ Критическая ошибка: {e}", exc_info=True)
         raise
+    finally:
+        # Сбрасываем отложенные записи до закрытия соединений
+        await broadcast_worker.stop()
+        await subscription_sweeper.stop()
+        if roster_service is not None:
+            await roster_service.stop()
+        await load_monitor.stop()
+        await rate_limit_sweeper.stop()
+        await backup_manager.stop()
+        await stats_reconciler.stop()
+        await user_write_queue.stop()
+        await close_db()
 
 
 if __name__ == "__main__":
@@ -2,10 +2,11 @@
 Конфигурация бота
 """
 import os
+import json
 import logging
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from pydantic_settings import BaseSettings
-from pydantic import Field, field_validator
+from pydantic import Field, field_validator, model_validator
 
 logger = logging.getLogger(__name__)
 
@@ -20,12 +21,83 @@ class Settings(BaseSettings):
     
     BOT_TOKEN: str = Field(..., description="Токен Telegram бота")
     ADMIN_IDS: str = Field(..., description="ID администраторов через запятую")
-    CHANNEL1_ID: str = Field(..., description="ID первого канала")
-    CHANNEL2_ID: str = Field(..., description="ID второго канала")
-    CHANNEL1_USERNAME: str = Field(..., description="Username первого канала")
-    CHANNEL2_USERNAME: str = Field(..., description="Username второго канала")
+    REQUIRED_CHANNELS: str = Field(default="", description="Обязательные каналы через запятую: ID:@username, @username или ID; пусто — CHANNEL1/CHANNEL2")
+    CHANNEL1_ID: str = Field(default="", description="ID первого канала (если не задан REQUIRED_CHANNELS)")
+    CHANNEL2_ID: str = Field(default="", description="ID второго канала (если не задан REQUIRED_CHANNELS)")
+    CHANNEL1_USERNAME: str = Field(default="", description="Username первого канала")
+    CHANNEL2_USERNAME: str = Field(default="", description="Username второго канала")
+    CHANNELS_STRICT: bool = Field(default=False, description="Не запускать бота, если обязательный канал не найден или бот в нём не администратор")
     SITE_URL: str = Field(default="https://example.com", description="URL сайта")
     DB_PATH: str = Field(default="./data/bot.db", description="Путь к БД")
+    DATABASE_URL: str = Field(default="", description="URL БД (sqlite+aiosqlite:///... или postgresql+asyncpg://...); пусто — SQLite по DB_PATH")
+    
+    # Пул соединений PostgreSQL
+    DB_POOL_SIZE: int = Field(default=10, description="Размер пула соединений PostgreSQL")
+    DB_MAX_OVERFLOW: int = Field(default=5, description="Дополнительные соединения сверх пула")
+    DB_STATEMENT_CACHE_SIZE: int = Field(default=100, description="Кэш подготовленных запросов asyncpg (0 — для pgbouncer)")
+    
+    # Профиль SQLite
+    SQLITE_JOURNAL_MODE: str = Field(default="WAL", description="Режим журнала SQLite")
+    SQLITE_SYNCHRONOUS: str = Field(default="NORMAL", description="Уровень synchronous SQLite")
+    SQLITE_MMAP_SIZE: int = Field(default=256 * 1024 * 1024, description="Размер mmap в байтах (0 — выключен)")
+    SQLITE_CACHE_SIZE: int = Field(default=-64000, description="Размер кэша страниц (отрицательное — в КиБ)")
+    SQLITE_BUSY_TIMEOUT: int = Field(default=5000, description="Ожидание блокировки в мс")
+    DB_READ_POOL_SIZE: int = Field(default=4, description="Количество соединений только для чтения")
+    
+    # Отложенная запись изменений пользователей
+    WRITE_BEHIND_FLUSH_MS: int = Field(default=200, description="Интервал сброса очереди записи в мс")
+    WRITE_BEHIND_MAX_BATCH: int = Field(default=500, description="Размер пакета для досрочного сброса")
+    
+    # Профилирование запросов
+    DB_PROFILER_ENABLED: bool = Field(default=True, description="Собирать статистику SQL-запросов")
+    DB_SLOW_QUERY_MS: int = Field(default=1000, description="Порог логирования медленного запроса в мс")
+    
+    # Резервное копирование
+    BACKUP_DIR: str = Field(default="", description="Каталог резервных копий (по умолчанию backups рядом с БД)")
+    BACKUP_KEEP: int = Field(default=7, description="Сколько последних копий хранить")
+    BACKUP_INTERVAL_HOURS: float = Field(default=24, description="Интервал копирования по расписанию в часах (0 — выключено)")
+    BACKUP_PAGES_PER_STEP: int = Field(default=256, description="Страниц БД за один шаг копирования")
+    
+    # Rate limit
+    RATE_LIMIT_BACKEND: str = Field(default="memory", description="Хранилище rate limit: memory (в процессе) или database (общее для процессов, только PostgreSQL)")
+    RATE_LIMIT_POLICIES: str = Field(default="", description="Дополнительные правила rate limit в JSON (см. utils/rate_limit_policy.py)")
+    
+    # Сброс нагрузки
+    LOAD_SHED_LAG_MS: int = Field(default=250, description="Задержка цикла событий в мс, после которой второстепенные события сбрасываются")
+    LOAD_SHED_MAX_IN_FLIGHT: int = Field(default=200, description="Апдейтов в обработке, после которых второстепенные события сбрасываются (0 — без порога)")
+    
+    # Защита от повторной обработки апдейтов
+    UPDATE_DEDUP_RING_SIZE: int = Field(default=10000, description="Сколько последних update_id помнить (в памяти и в БД)")
+    
+    # Кэш членства в каналах
+    MEMBERSHIP_POSITIVE_TTL: int = Field(default=3600, description="Сколько секунд помнить ответ «подписан»")
+    MEMBERSHIP_NEGATIVE_TTL: int = Field(default=30, description="Сколько секунд помнить ответ «не подписан»")
+    
+    # Фоновая перепроверка подписок
+    BOT_API_RATE: float = Field(default=30.0, description="Общий бюджет вызовов Bot API в секунду")
+    SUBSCRIPTION_SWEEP_API_SHARE: float = Field(default=0.1, description="Доля бюджета Bot API, которую может занять перепроверка подписок (0–1)")
+    SUBSCRIPTION_SWEEP_INTERVAL_HOURS: float = Field(default=24.0, description="Интервал между перепроверками подписок в часах (0 — выключено)")
+    SUBSCRIPTION_SWEEP_BATCH: int = Field(default=200, description="Пользователей в одной пачке перепроверки")
+    
+    # Состав каналов через MTProto (Telethon, необязательно)
+    TELETHON_API_ID: int = Field(default=0, description="api_id с my.telegram.org; 0 — состав каналов не загружается")
+    TELETHON_API_HASH: str = Field(default="", description="api_hash с my.telegram.org")
+    TELETHON_SESSION: str = Field(default="", description="StringSession пользователя-администратора каналов")
+    ROSTER_REFRESH_MINUTES: int = Field(default=30, description="Интервал дозагрузки новых участников каналов в минутах")
+    ROSTER_FULL_REFRESH_HOURS: int = Field(default=24, description="Интервал полной перезагрузки состава каналов в часах")
+    
+    # Рассылки
+    BROADCAST_LEASE_SECONDS: int = Field(default=60, description="Срок аренды задания рассылки: после падения процесса задание продолжит другой через это время")
+    BROADCAST_RATE: float = Field(default=25.0, description="Максимум сообщений рассылки в секунду (лимит Telegram — около 30 на бота, часть остаётся ответам пользователям)")
+    BROADCAST_CONCURRENCY: int = Field(default=10, description="Одновременных отправок рассылки")
+    BROADCAST_PROGRESS_INTERVAL: float = Field(default=3.0, description="Не чаще чем раз в столько секунд обновлять сообщение с прогрессом рассылки")
+    
+    # Кэш состояния пользователей
+    USER_CACHE_SIZE: int = Field(default=10000, description="Максимум пользователей в кэше состояния")
+    USER_CACHE_TTL: int = Field(default=300, description="Время жизни записи кэша в секундах")
+    
+    # Статистика
+    STATS_REBUILD_INTERVAL_HOURS: float = Field(default=6, description="Интервал сверки daily_stats с таблицей users в часах (0 — выключено)")
     
     @field_validator('ADMIN_IDS')
     @classmethod
@@ -42,6 +114,116 @@ class Settings(BaseSettings):
                 raise ValueError(f"ADMIN_IDS должен содержать числа, разделенные запятыми: {e}")
         raise ValueError("ADMIN_IDS должен быть строкой")
     
+    @field_validator('SQLITE_JOURNAL_MODE')
+    @classmethod
+    def validate_journal_mode(cls, v) -> str:
+        """Валидация режима журнала (значение подставляется в PRAGMA)"""
+        v = v.strip().upper()
+        if v not in ('WAL', 'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'OFF'):
+            raise ValueError(f"Недопустимый SQLITE_JOURNAL_MODE: {v}")
+        return v
+    
+    @field_validator('SQLITE_SYNCHRONOUS')
+    @classmethod
+    def validate_synchronous(cls, v) -> str:
+        """Валидация уровня synchronous (значение подставляется в PRAGMA)"""
+        v = v.strip().upper()
+        if v not in ('OFF', 'NORMAL', 'FULL', 'EXTRA'):
+            raise ValueError(f"Недопустимый SQLITE_SYNCHRONOUS: {v}")
+        return v
+    
+    @field_validator('RATE_LIMIT_BACKEND')
+    @classmethod
+    def validate_rate_limit_backend(cls, v) -> str:
+        """Валидация хранилища rate limit"""
+        v = v.strip().lower()
+        if v not in ('memory', 'database'):
+            raise ValueError(f"Недопустимый RATE_LIMIT_BACKEND: {v}")
+        return v
+    
+    @field_validator('SUBSCRIPTION_SWEEP_API_SHARE')
+    @classmethod
+    def validate_sweep_api_share(cls, v) -> float:
+        """Валидация доли бюджета Bot API для перепроверки подписок"""
+        if not 0 < v <= 1:
+            raise ValueError(f"SUBSCRIPTION_SWEEP_API_SHARE должен быть в диапазоне (0, 1]: {v}")
+        return v
+    
+    @field_validator('RATE_LIMIT_POLICIES')
+    @classmethod
+    def validate_rate_limit_policies(cls, v) -> str:
+        """Валидация правил rate limit (должен быть JSON-список)"""
+        if v.strip():
+            try:
+                rules = json.loads(v)
+            except ValueError as e:
+                raise ValueError(f"RATE_LIMIT_POLICIES должен быть JSON: {e}")
+            if not isinstance(rules, list):
+                raise ValueError("RATE_LIMIT_POLICIES должен быть JSON-списком правил")
+        return v
+    
+    @model_validator(mode='after')
+    def validate_rate_limit_backend_db(self) -> "Settings":
+        """Общее хранилище rate limit — только на PostgreSQL"""
+        if self.RATE_LIMIT_BACKEND == 'database' and self.is_sqlite:
+            # В SQLite каждый апдейт ждал бы единственное пишущее соединение
+            # за сбросом очереди записи, резервной копией и импортом
+            raise ValueError("RATE_LIMIT_BACKEND=database требует PostgreSQL (DATABASE_URL); для SQLite используйте memory")
+        return self
+    
+    @property
+    def database_url(self) -> str:
+        """URL БД для асинхронного движка"""
+        url = self.DATABASE_URL.strip()
+        if not url:
+            return f"sqlite+aiosqlite:///{self.DB_PATH}"
+        # Подставляем асинхронный драйвер, если указан URL без него
+        if url.startswith("postgres://"):
+            url = "postgresql://" + url[len("postgres://"):]
+        if url.startswith("postgresql://"):
+            url = "postgresql+asyncpg://" + url[len("postgresql://"):]
+        elif url.startswith("sqlite://") and not url.startswith("sqlite+"):
+            url = "sqlite+aiosqlite://" + url[len("sqlite://"):]
+        return url
+    
+    @property
+    def is_sqlite(self) -> bool:
+        """Используется ли SQLite"""
+        return self.database_url.startswith("sqlite")
+    
+    @property
+    def sqlite_path(self) -> Optional[str]:
+        """Путь к файлу SQLite (None для других СУБД)"""
+        if not self.is_sqlite:
+            return None
+        return self.database_url.split(":///", 1)[1].split("?", 1)[0] or self.DB_PATH
+    
+    @property
+    def roster_enabled(self) -> bool:
+        """Заданы ли данные для загрузки состава каналов через Telethon"""
+        return bool(self.TELETHON_API_ID and self.TELETHON_API_HASH and self.TELETHON_SESSION)
+    
+    @property
+    def required_channel_specs(self) -> List[Tuple[str, str]]:
+        """Обязательные каналы: [(ID или @username, @username или пусто)]"""
+        specs = []
+        if self.REQUIRED_CHANNELS.strip():
+            for entry in self.REQUIRED_CHANNELS.split(','):
+                entry = entry.strip()
+                if not entry:
+                    continue
+                chat_id, _, username = entry.partition(':')
+                chat_id, username = chat_id.strip(), username.strip()
+                if not username and chat_id.startswith('@'):
+                    username = chat_id
+                specs.append((chat_id, username))
+            return specs
+        for chat_id, username in ((self.CHANNEL1_ID, self.CHANNEL1_USERNAME), (self.CHANNEL2_ID, self.CHANNEL2_USERNAME)):
+            chat_id, username = chat_id.strip(), username.strip()
+            if chat_id or username:
+                specs.append((chat_id or username, username))
+        return specs
+    
     @property
     def admin_ids_list(self) -> List[int]:
         """Список ID администраторов"""
@@ -71,7 +253,10 @@ def load_settings() -> Settings:
             logger.info(f"   • Админов: {admin_count}")
         except Exception:
             logger.warning("   • Админов: не удалось определить")
-        logger.info(f"   • Каналы: {settings.CHANNEL1_USERNAME}, {settings.CHANNEL2_USERNAME}")
+        channels = settings.required_channel_specs
+        if not channels:
+            raise ValueError("Не задан ни один обязательный канал (REQUIRED_CHANNELS или CHANNEL1_ID/CHANNEL2_ID)")
+        logger.info(f"   • Каналы: {', '.join(username or chat_id for chat_id, username in channels)}")
         return settings
     except Exception as e:
         logger.error(f"❌ Ошибка загрузки конфигурации: {e}")
@@ -84,6 +269,7 @@ settings = load_settings()
 
 # Удобный доступ к списку админов
 ADMIN_IDS = settings.admin_ids_list
+ADMIN_ID_SET = frozenset(ADMIN_IDS)  # Для проверок на каждом апдейте
 
 # ===============================
 # КРУЖОЧКИ ДЛЯ ВОПРОСОВ РЕГИСТРАЦИИ
@@ -0,0 +1,199 @@
+"""
+Онлайн-резервное копирование SQLite
+
+Копирование идёт через sqlite3 backup API в фоновом потоке порциями
+страниц с паузами между шагами. Источник открывается только для чтения:
+в режиме WAL шаг копирования держит лишь снимок для чтения и не мешает
+писателям. Снимки ротируются в каталоге резервных копий.
+"""
+import os
+import time
+import glob
+import asyncio
+import sqlite3
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_BACKUP_PREFIX = "bot-"
+_BACKUP_SUFFIX = ".db"
+
+
+class _TooManyRestarts(Exception):
+    """Порционное копирование перезапускалось слишком часто"""
+
+
+@dataclass
+class BackupResult:
+    """Результат резервного копирования"""
+    path: str
+    size: int
+    duration: float
+    pages: int
+    restarts: int
+
+
+class BackupManager:
+    """Резервное копирование БД по запросу и по расписанию"""
+
+    def __init__(self, db_path: str, backup_dir: str, keep: int = 7,
+                 interval_hours: float = 24, pages_per_step: int = 256,
+                 step_pause: float = 0.005, max_restarts: int = 3, enabled: bool = True):
+        """
+        Args:
+            db_path: Путь к файлу БД
+            backup_dir: Каталог для снимков
+            keep: Сколько последних снимков хранить
+            interval_hours: Интервал копирования по расписанию (0 — выключено)
+            pages_per_step: Страниц за один шаг копирования
+            step_pause: Пауза между шагами в секундах
+            max_restarts: Сколько перезапусков из-за записи терпеть до копирования одним шагом
+            enabled: Доступно ли копирование (только для SQLite)
+        """
+        self.enabled = enabled
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.interval_hours = interval_hours
+        self.pages_per_step = pages_per_step
+        self.step_pause = step_pause
+        self.max_restarts = max_restarts
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.last_result: Optional[BackupResult] = None
+
+    @property
+    def is_running(self) -> bool:
+        """Идёт ли сейчас копирование"""
+        return self._lock.locked()
+
+    async def create_backup(self) -> BackupResult:
+        """
+        Создать снимок БД и удалить устаревшие
+
+        Returns:
+            Результат копирования
+        """
+        if not self.enabled:
+            raise RuntimeError("Резервное копирование доступно только для SQLite, для PostgreSQL используйте pg_dump")
+
+        async with self._lock:
+            os.makedirs(self.backup_dir, exist_ok=True)
+            name = f"{_BACKUP_PREFIX}{datetime.utcnow():%Y%m%d-%H%M%S-%f}{_BACKUP_SUFFIX}"
+            target = os.path.join(self.backup_dir, name)
+
+            logger.info(f"💾 Резервное копирование БД в {target}...")
+            result = await asyncio.to_thread(self._backup_sync, target)
+            removed = self._rotate()
+
+            self.last_result = result
+            logger.info(
+                f"✅ Резервная копия готова: {result.size / 1024 / 1024:.1f} МБ "
+                f"за {result.duration:.2f} с ({result.pages} страниц, перезапусков: {result.restarts}, "
+                f"удалено старых: {removed})"
+            )
+            return result
+
+    def _backup_sync(self, target: str) -> BackupResult:
+        """Копирование в потоке: порциями страниц, затем атомарное переименование"""
+        started = time.perf_counter()
+        temp_path = target + ".tmp"
+        progress = {'remaining': None, 'restarts': 0, 'pages': 0}
+
+        def on_progress(status, remaining, total):
+            # Если остаток вырос, источник изменили и копирование началось заново
+            if progress['remaining'] is not None and remaining > progress['remaining']:
+                progress['restarts'] += 1
+                if progress['restarts'] > self.max_restarts:
+                    # Под постоянной записью порционное копирование не закончится никогда
+                    raise _TooManyRestarts()
+            progress['remaining'] = remaining
+            progress['pages'] = total
+            # sleep в backup() срабатывает только при BUSY/LOCKED — пауза между шагами здесь
+            if remaining and self.step_pause:
+                time.sleep(self.step_pause)
+
+        source = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=settings.SQLITE_BUSY_TIMEOUT / 1000)
+        destination = sqlite3.connect(temp_path)
+        try:
+            try:
+                source.backup(destination, pages=self.pages_per_step, progress=on_progress)
+            except _TooManyRestarts:
+                # Копируем одним шагом: в WAL это снимок для чтения без блокировки писателей
+                logger.warning(f"⚠️ Копирование перезапускалось {progress['restarts']} раз, повтор одним шагом")
+                source.backup(destination, pages=-1)
+        except Exception:
+            destination.close()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        finally:
+            destination.close()
+            source.close()
+
+        os.replace(temp_path, target)
+        return BackupResult(
+            path=target,
+            size=os.path.getsize(target),
+            duration=time.perf_counter() - started,
+            pages=progress['pages'],
+            restarts=progress['restarts'],
+        )
+
+    def list_backups(self) -> List[str]:
+        """Снимки от новых к старым"""
+        pattern = os.path.join(self.backup_dir, f"{_BACKUP_PREFIX}*{_BACKUP_SUFFIX}")
+        return sorted(glob.glob(pattern), reverse=True)
+
+    def _rotate(self) -> int:
+        """Удалить снимки сверх лимита"""
+        removed = 0
+        for path in self.list_backups()[self.keep:]:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError as e:
+                logger.warning(f"⚠️ Не удалось удалить старую копию {path}: {e}")
+        return removed
+
+    def start(self):
+        """Запустить копирование по расписанию"""
+        if not self.enabled or self.interval_hours <= 0:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"💾 Резервное копирование по расписанию: каждые {self.interval_hours} ч, хранить {self.keep}")
+
+    async def stop(self):
+        """Остановить копирование по расписанию"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        """Цикл копирования по расписанию"""
+        while True:
+            await asyncio.sleep(self.interval_hours * 3600)
+            try:
+                await self.create_backup()
+            except Exception as e:
+                logger.error(f"❌ Ошибка резервного копирования: {e}", exc_info=True)
+
+
+# Глобальный менеджер резервных копий
+backup_manager = BackupManager(
+    db_path=settings.sqlite_path or settings.DB_PATH,
+    backup_dir=settings.BACKUP_DIR or os.path.join(os.path.dirname(settings.sqlite_path or settings.DB_PATH), "backups"),
+    keep=settings.BACKUP_KEEP,
+    interval_hours=settings.BACKUP_INTERVAL_HOURS,
+    pages_per_step=settings.BACKUP_PAGES_PER_STEP,
+    enabled=settings.is_sqlite
+)
@@ -0,0 +1,248 @@
+"""
+Задания рассылки: хранение, аренда и контрольные точки
+
+Задание хранит курсор — users.id последнего обработанного получателя —
+и счётчики; обработчик периодически записывает их вместе с продлением
+аренды. Аренда (владелец и срок) гарантирует, что одно задание выполняет
+только один процесс: чужое задание можно забрать, лишь когда его аренда
+истекла (процесс-владелец упал).
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import select, update, case, func, or_, and_
+from database.db import get_async_session, get_read_session
+from database.models import Broadcast, BroadcastJob
+
+logger = logging.getLogger(__name__)
+
+# Задания, которые ждут обработчика или выполняются
+RUNNABLE_STATUSES = ('queued', 'running')
+FINAL_STATUSES = ('cancelled', 'done', 'failed')
+
+# Допустимые переходы по кнопкам администратора: действие -> (из каких статусов, в какой)
+TRANSITIONS = {
+    'pause': (('draft', 'queued', 'running'), 'paused'),
+    'resume': (('paused',), 'queued'),
+    'cancel': (('draft', 'queued', 'running', 'paused'), 'cancelled'),
+}
+
+
+def _lease_free(owner: str, now: datetime):
+    """Условие: аренда свободна, истекла или уже принадлежит owner"""
+    return or_(
+        BroadcastJob.lease_owner.is_(None),
+        BroadcastJob.lease_owner == owner,
+        BroadcastJob.lease_expires_at < now,
+    )
+
+
+async def create_job(admin_id: int, content_type: str, text: Optional[str],
+                     file_id: Optional[str], total: int) -> BroadcastJob:
+    """
+    Создать задание рассылки (черновик: обработчик его не возьмёт до queue_job)
+
+    Args:
+        admin_id: ID администратора
+        content_type: Тип контента
+        text: Текст или подпись
+        file_id: File ID медиа
+        total: Ожидаемое число получателей
+
+    Returns:
+        Созданное задание
+    """
+    job = BroadcastJob(
+        admin_id=admin_id,
+        content_type=content_type,
+        text=text,
+        file_id=file_id,
+        total=total,
+        status='draft'
+    )
+    async with get_async_session() as db:
+        db.add(job)
+        await db.commit()
+    return job
+
+
+async def get_job(job_id: int) -> Optional[BroadcastJob]:
+    """Получить задание по ID"""
+    async with get_read_session() as db:
+        return await db.get(BroadcastJob, job_id)
+
+
+async def queue_job(job_id: int, chat_id: int, message_id: int):
+    """
+    Запомнить сообщение с прогрессом и поставить черновик в очередь
+
+    Одним UPDATE: обработчик не увидит задание без сообщения с прогрессом.
+    """
+    async with get_async_session() as db:
+        await db.execute(
+            update(BroadcastJob)
+            .where(BroadcastJob.id == job_id)
+            .values(
+                # Если черновик уже поставили на паузу или отменили, статус не трогаем
+                status=case((BroadcastJob.status == 'draft', 'queued'), else_=BroadcastJob.status),
+                progress_chat_id=chat_id,
+                progress_message_id=message_id
+            )
+        )
+        await db.commit()
+
+
+async def apply_action(job_id: int, action: str) -> Optional[BroadcastJob]:
+    """
+    Пауза, продолжение или отмена задания
+
+    Выполняющий обработчик увидит новый статус на ближайшей контрольной точке.
+
+    Args:
+        job_id: ID задания
+        action: pause, resume или cancel
+
+    Returns:
+        Задание после изменения или None, если переход недопустим
+    """
+    from_statuses, to_status = TRANSITIONS[action]
+    values = {'status': to_status}
+    if to_status in FINAL_STATUSES:
+        values['finished_at'] = datetime.utcnow()
+    async with get_async_session() as db:
+        result = await db.execute(
+            update(BroadcastJob)
+            .where(BroadcastJob.id == job_id, BroadcastJob.status.in_(from_statuses))
+            .values(**values)
+        )
+        await db.commit()
+        if result.rowcount != 1:
+            return None
+        return await db.get(BroadcastJob, job_id)
+
+
+async def claim_job(owner: str, lease_ttl: float) -> Optional[BroadcastJob]:
+    """
+    Взять в работу следующее задание
+
+    Args:
+        owner: Идентификатор обработчика
+        lease_ttl: Срок аренды в секундах
+
+    Returns:
+        Задание (статус running, аренда у owner) или None
+    """
+    now = datetime.utcnow()
+    async with get_async_session() as db:
+        job_id = await db.scalar(
+            select(BroadcastJob.id)
+            .where(BroadcastJob.status.in_(RUNNABLE_STATUSES), _lease_free(owner, now))
+            .order_by(BroadcastJob.id)
+            .limit(1)
+        )
+        if job_id is None:
+            return None
+        # Условие аренды повторяется в UPDATE: из двух процессов задание получит один
+        result = await db.execute(
+            update(BroadcastJob)
+            .where(
+                BroadcastJob.id == job_id,
+                BroadcastJob.status.in_(RUNNABLE_STATUSES),
+                _lease_free(owner, now)
+            )
+            .values(
+                status='running',
+                lease_owner=owner,
+                lease_expires_at=now + timedelta(seconds=lease_ttl),
+                started_at=func.coalesce(BroadcastJob.started_at, now)
+            )
+        )
+        await db.commit()
+        if result.rowcount != 1:
+            return None
+        return await db.get(BroadcastJob, job_id)
+
+
+async def checkpoint(job: BroadcastJob, owner: str, lease_ttl: float) -> bool:
+    """
+    Записать курсор и счётчики задания и продлить аренду
+
+    Args:
+        job: Задание с актуальными cursor_id, sent_count, failed_count
+        owner: Идентификатор обработчика
+        lease_ttl: Срок аренды в секундах
+
+    Returns:
+        False, если задание больше не выполняется этим обработчиком
+        (пауза, отмена или аренда перешла к другому процессу)
+    """
+    async with get_async_session() as db:
+        result = await db.execute(
+            update(BroadcastJob)
+            .where(
+                BroadcastJob.id == job.id,
+                BroadcastJob.status == 'running',
+                BroadcastJob.lease_owner == owner
+            )
+            .values(
+                cursor_id=job.cursor_id,
+                sent_count=job.sent_count,
+                failed_count=job.failed_count,
+                lease_expires_at=datetime.utcnow() + timedelta(seconds=lease_ttl)
+            )
+        )
+        await db.commit()
+        return result.rowcount == 1
+
+
+async def release_job(job: BroadcastJob, owner: str, status: Optional[str] = None):
+    """
+    Сохранить итог и освободить аренду
+
+    Счётчики и курсор записываются в любом случае (если аренда ещё у owner),
+    статус — только если задан (завершение); иначе остаётся выставленный
+    администратором (пауза, отмена).
+
+    Args:
+        job: Задание
+        owner: Идентификатор обработчика
+        status: Итоговый статус (done, failed) или None
+    """
+    values = {
+        'cursor_id': job.cursor_id,
+        'sent_count': job.sent_count,
+        'failed_count': job.failed_count,
+        'lease_owner': None,
+        'lease_expires_at': None,
+    }
+    conditions = [BroadcastJob.id == job.id, BroadcastJob.lease_owner == owner]
+    if status is not None:
+        values['status'] = status
+        values['finished_at'] = datetime.utcnow()
+        # Отмена, нажатая в последний момент, важнее завершения
+        conditions.append(BroadcastJob.status == 'running')
+    async with get_async_session() as db:
+        result = await db.execute(update(BroadcastJob).where(and_(*conditions)).values(**values))
+        if result.rowcount != 1 and status is not None:
+            # Статус успел смениться — сохраняем только прогресс
+            del values['status'], values['finished_at']
+            await db.execute(
+                update(BroadcastJob)
+                .where(BroadcastJob.id == job.id, BroadcastJob.lease_owner == owner)
+                .values(**values)
+            )
+        await db.commit()
+
+
+async def record_history(job: BroadcastJob):
+    """Добавить завершённое задание в историю рассылок"""
+    async with get_async_session() as db:
+        db.add(Broadcast(
+            admin_id=job.admin_id,
+            content_type=job.content_type,
+            text=job.text,
+            file_id=job.file_id,
+            sent_count=job.sent_count,
+            failed_count=job.failed_count
+        ))
+        await db.commit()
@@ -0,0 +1,257 @@
+"""
+Массовые операции с пользователями: экспорт, импорт и обход
+
+Экспорт читает users потоково (yield_per) и пишет в файл построчно,
+поэтому память не зависит от количества пользователей. Импорт
+выполняет upsert пачками, каждая пачка — отдельная транзакция.
+"""
+import csv
+import json
+import logging
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import select, Boolean, Integer, BigInteger, DateTime
+from database.db import get_async_session, get_read_session, insert_for_dialect
+from database.models import User
+from database.write_behind import user_write_queue
+from database.user_cache import user_state_cache
+from database.stats import rebuild_daily_stats
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+EXPORT_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 5000
+
+# Все колонки users, кроме внутреннего id
+USER_COLUMNS = [column for column in User.__table__.columns if column.name != 'id']
+_COLUMNS_BY_NAME = {column.name: column for column in USER_COLUMNS}
+_TRUE_VALUES = {'1', 'true', 'yes', 'да', 't', 'y'}
+
+
+def _export_value(value: Any, fmt: str) -> Any:
+    """Значение колонки в формате выгрузки"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if fmt == 'csv' and isinstance(value, bool):
+        return int(value)
+    return value
+
+
+async def export_users(path: str, fmt: str = 'csv') -> int:
+    """
+    Выгрузить всех пользователей в файл
+
+    Args:
+        path: Путь к файлу результата
+        fmt: Формат: csv или jsonl
+
+    Returns:
+        Количество выгруженных пользователей
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат выгрузки: {fmt}")
+
+    # Незаписанные изменения тоже должны попасть в выгрузку
+    await user_write_queue.flush()
+
+    names = [column.name for column in USER_COLUMNS]
+    query = select(*USER_COLUMNS).order_by(User.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    exported = 0
+
+    with open(path, 'w', encoding='utf-8', newline='') as output:
+        writer = csv.writer(output) if fmt == 'csv' else None
+        if writer:
+            writer.writerow(names)
+
+        async with get_read_session() as db:
+            result = await db.stream(query)
+            async for rows in result.partitions():
+                for row in rows:
+                    values = [_export_value(value, fmt) for value in row]
+                    if writer:
+                        writer.writerow(values)
+                    else:
+                        output.write(json.dumps(dict(zip(names, values)), ensure_ascii=False) + '\n')
+                exported += len(rows)
+
+    logger.info(f"📤 Выгружено пользователей: {exported} ({fmt})")
+    return exported
+
+
+def _parse_value(column, value: Any) -> Any:
+    """Привести значение из файла к типу колонки"""
+    if value is None or value == '':
+        return None
+    column_type = column.type
+    if isinstance(column_type, Boolean):
+        if isinstance(value, bool):
+            return value
+        return str(value).strip().lower() in _TRUE_VALUES
+    if isinstance(column_type, (Integer, BigInteger)):
+        return int(value)
+    if isinstance(column_type, DateTime):
+        return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+    return str(value)
+
+
+def _read_records(path: str, fmt: str) -> Iterator[Dict[str, Any]]:
+    """Построчно читать записи файла импорта"""
+    with open(path, encoding='utf-8-sig', newline='') as source:
+        if fmt == 'csv':
+            yield from csv.DictReader(source)
+        else:
+            for line in source:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+def _normalize_record(record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Оставить известные колонки и привести типы; None — запись без telegram_id
+
+    Пустая ячейка означает «нет данных»: колонка не попадает в запись, поэтому
+    новый пользователь получает значение по умолчанию, а существующий — не
+    теряет сохранённое. Очистить поле можно явным null в jsonl.
+    """
+    row = {}
+    for name, value in record.items():
+        column = _COLUMNS_BY_NAME.get(name)
+        if column is not None and value != '':
+            row[name] = _parse_value(column, value)
+    if row.get('telegram_id') is None:
+        return None
+    return row
+
+
+async def _upsert_batch(batch: Dict[int, Dict[str, Any]]):
+    """Upsert пачки пользователей одной транзакцией"""
+    groups: Dict[frozenset, List[Dict[str, Any]]] = {}
+    for row in batch.values():
+        groups.setdefault(frozenset(row), []).append(row)
+
+    async with get_async_session() as db:
+        for keys, rows in groups.items():
+            stmt = insert_for_dialect(User)
+            update_keys = [key for key in keys if key not in ('telegram_id', 'created_at')]
+            if update_keys:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[User.telegram_id],
+                    set_={key: stmt.excluded[key] for key in update_keys}
+                )
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=[User.telegram_id])
+            await db.execute(stmt, rows)
+        await db.commit()
+
+
+async def import_users(path: str, fmt: str = 'csv', batch_size: int = IMPORT_BATCH_SIZE) -> Tuple[int, int]:
+    """
+    Загрузить пользователей из файла (upsert по telegram_id)
+
+    Записи без telegram_id или с некорректными значениями пропускаются.
+    Пустые ячейки не перезаписывают сохранённые значения.
+    После загрузки сбрасывается кэш состояния и пересчитывается статистика.
+
+    Args:
+        path: Путь к файлу
+        fmt: Формат: csv или jsonl
+        batch_size: Размер пачки (одна транзакция на пачку)
+
+    Returns:
+        (загружено, пропущено)
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат импорта: {fmt}")
+
+    # Сначала записываем очередь, чтобы импорт и отложенные изменения не перемешались
+    await user_write_queue.flush()
+
+    imported = skipped = 0
+    # Пачка с дедупликацией по telegram_id: одна строка не может обновляться дважды за запрос
+    batch: Dict[int, Dict[str, Any]] = {}
+    try:
+        for record in _read_records(path, fmt):
+            try:
+                row = _normalize_record(record)
+            except (ValueError, TypeError):
+                row = None
+            if row is None:
+                skipped += 1
+                continue
+            batch[row['telegram_id']] = row
+            if len(batch) >= batch_size:
+                await _upsert_batch(batch)
+                imported += len(batch)
+                batch = {}
+        if batch:
+            await _upsert_batch(batch)
+            imported += len(batch)
+    finally:
+        user_state_cache.clear()
+        if imported:
+            await rebuild_daily_stats()
+
+    logger.info(f"📥 Импортировано пользователей: {imported}, пропущено записей: {skipped}")
+    return imported, skipped
+
+
+async def iter_user_rows(*conditions, after_id: int = 0,
+                         batch_size: int = 500) -> AsyncIterator[List[Tuple[int, int]]]:
+    """
+    Обойти пользователей пачками (id, telegram_id) в порядке id
+
+    Каждая пачка читается отдельным коротким запросом по id (keyset),
+    поэтому долгий обход не держит транзакцию открытой.
+
+    Args:
+        *conditions: Условия отбора пользователей
+        after_id: Начать после этого users.id (продолжение обхода)
+        batch_size: Размер пачки
+
+    Yields:
+        Список пар (users.id, telegram_id)
+    """
+    last_id = after_id
+    while True:
+        async with get_read_session() as db:
+            rows = (await db.execute(
+                select(User.id, User.telegram_id)
+                .where(*conditions, User.id > last_id)
+                .order_by(User.id)
+                .limit(batch_size)
+            )).all()
+        if not rows:
+            return
+        last_id = rows[-1].id
+        yield [(row.id, row.telegram_id) for row in rows]
+
+
+async def iter_user_ids(*conditions, batch_size: int = 500) -> AsyncIterator[List[int]]:
+    """
+    Обойти telegram_id пользователей пачками
+
+    Args:
+        *conditions: Условия отбора пользователей
+        batch_size: Размер пачки
+
+    Yields:
+        Список telegram_id
+    """
+    async for rows in iter_user_rows(*conditions, batch_size=batch_size):
+        yield [telegram_id for _, telegram_id in rows]
+
+
+async def iter_active_user_ids(batch_size: int = 500) -> AsyncIterator[List[int]]:
+    """
+    Обойти telegram_id активных пользователей пачками
+
+    Args:
+        batch_size: Размер пачки
+
+    Yields:
+        Список telegram_id
+    """
+    async for batch in iter_user_ids(User.is_active == True, batch_size=batch_size):
+        yield batch
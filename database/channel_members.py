@@ -0,0 +1,107 @@
+"""
+Локальная таблица членства в обязательных каналах
+
+Если бот — администратор канала, Telegram присылает события chat_member
+о вступлении и выходе участников. Они записываются в channel_members,
+и проверка подписки отвечает по таблице; getChatMember нужен только
+для пользователей, о которых ещё ничего не известно. Записи копятся
+в памяти и пишутся пачками вместе с очередью отложенной записи.
+"""
+import logging
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.db import get_read_session, insert_for_dialect
+from database.models import ChannelMember
+from database.write_behind import user_write_queue
+
+logger = logging.getLogger(__name__)
+
+# (chat_id, user_id) -> (status, is_member, updated_at)
+PendingMembers = Dict[Tuple[int, int], Tuple[str, bool, datetime]]
+
+
+class ChannelMemberStore:
+    """Членство в каналах: чтение из БД, запись через очередь отложенной записи"""
+
+    def __init__(self):
+        self._pending: PendingMembers = {}
+        self.local_hits = 0
+        self.unknown = 0
+        self.events = 0
+
+    def record(self, chat_id: int, user_id: int, status: str, is_member: bool):
+        """
+        Запомнить статус участника (запишется при следующем сбросе очереди)
+
+        Args:
+            chat_id: ID канала
+            user_id: ID пользователя
+            status: Статус участника из Telegram
+            is_member: Считается ли пользователь подписанным
+        """
+        self._pending[(chat_id, user_id)] = (status, is_member, datetime.utcnow())
+
+    async def get(self, chat_id: int, user_id: int) -> Optional[bool]:
+        """
+        Членство по таблице
+
+        Returns:
+            True/False или None, если о пользователе ничего не известно
+        """
+        pending = self._pending.get((chat_id, user_id))
+        if pending is not None:
+            self.local_hits += 1
+            return pending[1]
+        async with get_read_session() as db:
+            is_member = await db.scalar(
+                select(ChannelMember.is_member)
+                .where(ChannelMember.chat_id == chat_id, ChannelMember.user_id == user_id)
+            )
+        if is_member is None:
+            self.unknown += 1
+            return None
+        self.local_hits += 1
+        return bool(is_member)
+
+    def has_pending(self) -> bool:
+        """Есть ли незаписанные статусы"""
+        return bool(self._pending)
+
+    async def flush_hook(self, db: AsyncSession) -> Callable[[], None]:
+        """Хук очереди отложенной записи: upsert накопленных статусов"""
+        batch, self._pending = self._pending, {}
+        stmt = insert_for_dialect(ChannelMember)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ChannelMember.chat_id, ChannelMember.user_id],
+            set_={
+                'status': stmt.excluded.status,
+                'is_member': stmt.excluded.is_member,
+                'updated_at': stmt.excluded.updated_at,
+            }
+        )
+        await db.execute(stmt, [
+            {'chat_id': chat_id, 'user_id': user_id, 'status': status,
+             'is_member': is_member, 'updated_at': updated_at}
+            for (chat_id, user_id), (status, is_member, updated_at) in batch.items()
+        ])
+
+        def undo():
+            # Более свежие статусы, пришедшие за время записи, важнее
+            for key, value in batch.items():
+                self._pending.setdefault(key, value)
+        return undo
+
+    def stats(self) -> Dict[str, int]:
+        """Счётчики ответов по таблице"""
+        return {
+            'local_hits': self.local_hits,
+            'unknown': self.unknown,
+            'events': self.events,
+        }
+
+
+# Глобальная таблица членства
+channel_members = ChannelMemberStore()
+user_write_queue.register_flush_hook(channel_members.flush_hook, channel_members.has_pending)
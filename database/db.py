@@ -4,11 +4,19 @@
 import os
 import logging
 import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.exc import OperationalError, DatabaseError
 from database.models import Base
+from database.migrations import run_migrations
+from database.profiler import query_profiler
 from config import settings
 
 logger = logging.getLogger(__name__)
@@ -18,45 +26,184 @@ _MAX_DB_RETRIES = 3
 _DB_RETRY_DELAY = 0.5
 
 
-# Создаем директорию для БД если её нет
-os.makedirs(os.path.dirname(settings.DB_PATH), exist_ok=True)
+IS_SQLITE = settings.is_sqlite
+DATABASE_URL = make_url(settings.database_url)
+
+if IS_SQLITE:
+    # Создаем директорию для БД если её нет
+    os.makedirs(os.path.dirname(os.path.abspath(settings.sqlite_path)), exist_ok=True)
+
+
+def _apply_sqlite_pragmas(dbapi_connection, read_only: bool = False):
+    """
+    Применить профиль SQLite к новому соединению
+    
+    Args:
+        dbapi_connection: DBAPI-соединение (sqlite3 или адаптер aiosqlite)
+        read_only: Соединение только для чтения
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA busy_timeout = {int(settings.SQLITE_BUSY_TIMEOUT)}")
+        if not read_only:
+            # Режим журнала хранится в файле БД, его задаёт только пишущее соединение
+            cursor.execute(f"PRAGMA journal_mode = {settings.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous = {settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA cache_size = {int(settings.SQLITE_CACHE_SIZE)}")
+        cursor.execute(f"PRAGMA mmap_size = {int(settings.SQLITE_MMAP_SIZE)}")
+        cursor.execute("PRAGMA temp_store = MEMORY")
+        cursor.execute("PRAGMA foreign_keys = ON")
+        if read_only:
+            cursor.execute("PRAGMA query_only = ON")
+    finally:
+        cursor.close()
 
-# Создаем движок БД с настройками для защиты от перегрузки
-engine = create_engine(
-    f'sqlite:///{settings.DB_PATH}',
-    connect_args={'check_same_thread': False},
-    poolclass=StaticPool,
-    echo=False,
-    pool_pre_ping=True,  # Проверка соединения перед использованием
-    pool_recycle=3600,   # Переиспользование соединений каждый час
-)
 
-# Обработчик для логирования медленных запросов
-@event.listens_for(engine, "before_cursor_execute")
-def receive_before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
-    """Логирование медленных запросов к БД"""
-    conn.info.setdefault('query_start_time', []).append(time.time())
+if IS_SQLITE:
+    # Синхронный движок — только для офлайн-скриптов и обслуживания БД.
+    # Обработчики бота работают через async_engine (см. ниже)
+    engine = create_engine(
+        f'sqlite:///{settings.sqlite_path}',
+        connect_args={'check_same_thread': False},
+        echo=False,
+        pool_pre_ping=True,  # Проверка соединения перед использованием
+        pool_recycle=3600,   # Переиспользование соединений каждый час
+    )
 
+    # Пишущий движок для обработчиков: ровно одно соединение, поэтому записи
+    # сериализуются на уровне пула, а не конкурируют за блокировку файла
+    async_engine = create_async_engine(
+        DATABASE_URL,
+        echo=False,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=30,
+        pool_pre_ping=True,
+    )
 
-@event.listens_for(engine, "after_cursor_execute")
-def receive_after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
-    """Логирование медленных запросов к БД"""
-    total = time.time() - conn.info['query_start_time'].pop(-1)
-    if total > 1.0:  # Запросы дольше 1 секунды
-        logger.warning(f"⚠️ Медленный запрос к БД ({total:.2f}s): {statement[:100]}")
+    # Движок только для чтения (статистика, списки, поиск). В режиме WAL читатели
+    # не блокируют писателя и не ждут его
+    read_engine = create_async_engine(
+        f'sqlite+aiosqlite:///file:{os.path.abspath(settings.sqlite_path)}?mode=ro&uri=true',
+        echo=False,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=max(1, settings.DB_READ_POOL_SIZE),
+        max_overflow=0,
+        pool_timeout=30,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+    )
+else:
+    # PostgreSQL: общий пул asyncpg для чтения и записи, писатели не сериализуются.
+    # Синхронного движка нет — офлайн-скрипты используют асинхронные функции
+    engine = None
+    async_engine = create_async_engine(
+        DATABASE_URL,
+        echo=False,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=30,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+        connect_args={'statement_cache_size': settings.DB_STATEMENT_CACHE_SIZE},
+    )
+    read_engine = async_engine
+
+
+def insert_for_dialect(table):
+    """
+    INSERT с поддержкой ON CONFLICT для текущей СУБД
 
-# Создаем фабрику сессий
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    SQLite и PostgreSQL поддерживают одинаковый upsert
+    (on_conflict_do_update / excluded), различается только конструктор.
+
+    Args:
+        table: Модель или таблица
+    """
+    if IS_SQLITE:
+        return sqlite_insert(table)
+    return postgresql_insert(table)
+
+
+if IS_SQLITE:
+    @event.listens_for(engine, "connect")
+    def _on_sync_connect(dbapi_connection, connection_record):
+        """Профиль SQLite для синхронного движка"""
+        _apply_sqlite_pragmas(dbapi_connection)
+
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _on_write_connect(dbapi_connection, connection_record):
+        """Профиль SQLite для пишущего соединения"""
+        _apply_sqlite_pragmas(dbapi_connection)
+
+    @event.listens_for(read_engine.sync_engine, "connect")
+    def _on_read_connect(dbapi_connection, connection_record):
+        """Профиль SQLite для соединений только для чтения"""
+        _apply_sqlite_pragmas(dbapi_connection, read_only=True)
+
+
+# Профилирование запросов (и логирование медленных) для всех движков
+for _engine in {async_engine.sync_engine, read_engine.sync_engine, engine} - {None}:
+    event.listen(_engine, "before_cursor_execute", query_profiler.before_cursor_execute)
+    event.listen(_engine, "after_cursor_execute", query_profiler.after_cursor_execute)
+    event.listen(_engine, "handle_error", query_profiler.handle_error)
+
+# Создаем фабрики сессий
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine) if engine is not None else None
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,  # Объекты остаются доступными после commit (без ленивых запросов)
+)
+AsyncReadSessionLocal = async_sessionmaker(
+    bind=read_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+
+def _describe_database() -> str:
+    """Адрес БД для логов (без пароля)"""
+    if IS_SQLITE:
+        return settings.sqlite_path
+    return DATABASE_URL.render_as_string(hide_password=True)
 
 
 def init_db():
-    """Инициализация базы данных"""
+    """Инициализация базы данных (синхронная, для офлайн-скриптов)"""
     import logging
     logger = logging.getLogger(__name__)
     
-    logger.info(f"📂 Путь к БД: {settings.DB_PATH}")
-    Base.metadata.create_all(bind=engine)
-    logger.info(f"✅ База данных инициализирована: {settings.DB_PATH}")
+    if engine is None:
+        # Для PostgreSQL синхронного драйвера нет — используем асинхронную инициализацию
+        import asyncio
+        asyncio.run(init_db_async())
+        return
+    
+    logger.info(f"📂 Путь к БД: {settings.sqlite_path}")
+    with engine.begin() as conn:
+        Base.metadata.create_all(bind=conn)
+        run_migrations(conn)
+    logger.info(f"✅ База данных инициализирована: {settings.sqlite_path}")
+
+
+async def init_db_async():
+    """Инициализация базы данных (асинхронная, для запуска бота)"""
+    logger.info(f"📂 БД: {_describe_database()}")
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(run_migrations)
+    logger.info(f"✅ База данных инициализирована: {_describe_database()}")
+
+
+async def close_db():
+    """Закрыть соединения асинхронных движков"""
+    if read_engine is not async_engine:
+        await read_engine.dispose()
+    await async_engine.dispose()
 
 
 def get_db() -> Session:
@@ -85,3 +232,41 @@ def get_db_session() -> Session:
             logger.warning(f"⚠️ Ошибка подключения к БД (попытка {retries}/{_MAX_DB_RETRIES}): {e}")
             time.sleep(_DB_RETRY_DELAY * retries)  # Экспоненциальная задержка
 
+
+
+@asynccontextmanager
+async def get_async_session() -> AsyncIterator[AsyncSession]:
+    """
+    Получить асинхронную сессию БД для записи (в SQLite — единственное пишущее соединение)
+
+    Сессия держит соединение до commit/rollback, поэтому не стоит делать
+    запросы к Telegram API между первым запросом и commit.
+
+    Использование:
+        async with get_async_session() as db:
+            user = await db.scalar(select(User).where(User.telegram_id == user_id))
+    """
+    session = AsyncSessionLocal()
+    try:
+        yield session
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
+
+
+@asynccontextmanager
+async def get_read_session() -> AsyncIterator[AsyncSession]:
+    """
+    Получить асинхронную сессию только для чтения (пул читателей)
+
+    Использование:
+        async with get_read_session() as db:
+            total = await db.scalar(select(func.count()).select_from(User))
+    """
+    session = AsyncReadSessionLocal()
+    try:
+        yield session
+    finally:
+        await session.close()
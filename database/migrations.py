@@ -0,0 +1,118 @@
+"""
+Версионные миграции схемы БД
+
+create_all создаёт только отсутствующие таблицы, поэтому индексы и колонки,
+добавленные позже, не попадают в существующие файлы data/bot.db.
+Миграции применяются по порядку при старте, номер последней хранится
+в таблице schema_version. Если схема актуальна, проверка стоит один запрос.
+"""
+import logging
+from datetime import datetime
+from typing import Callable, List, Tuple, Union
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+
+logger = logging.getLogger(__name__)
+
+# Шаг миграции: SQL-выражение или функция, получающая соединение.
+# {TRUE} в SQL заменяется на литерал истины текущей СУБД: условие частичного
+# индекса должно совпадать с тем, как SQLAlchemy рендерит `== True`
+MigrationStep = Union[str, Callable[[Connection], None]]
+
+
+def _backfill_daily_stats(conn: Connection):
+    """Заполнить daily_stats по уже существующим пользователям"""
+    from database.stats import rebuild_statements
+
+    for stmt in rebuild_statements():
+        conn.execute(stmt)
+
+
+# Миграции: (версия, описание, шаги). Версии только растут, применённые не меняются
+MIGRATIONS: List[Tuple[int, str, List[MigrationStep]]] = [
+    (1, "Частичный индекс активных пользователей для рассылки", [
+        "CREATE INDEX IF NOT EXISTS ix_users_active_telegram_id "
+        "ON users (telegram_id) WHERE is_active = {TRUE}",
+    ]),
+    (2, "Индекс пользователей по дате регистрации для списка и статистики", [
+        "CREATE INDEX IF NOT EXISTS ix_users_created_at_id "
+        "ON users (created_at DESC, id DESC)",
+    ]),
+    (3, "Частичные индексы для подсчёта зарегистрированных и подписанных", [
+        "CREATE INDEX IF NOT EXISTS ix_users_registered_created_at "
+        "ON users (created_at) WHERE is_registered = {TRUE}",
+        "CREATE INDEX IF NOT EXISTS ix_users_subscribed_created_at "
+        "ON users (created_at) WHERE is_subscribed = {TRUE}",
+    ]),
+    (4, "Индекс каталога демо проектов", [
+        "CREATE INDEX IF NOT EXISTS ix_demo_projects_active_order "
+        "ON demo_projects (is_active, order_index)",
+    ]),
+    (5, "Первичное заполнение суточной статистики", [
+        _backfill_daily_stats,
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def get_schema_version(conn: Connection) -> int:
+    """
+    Получить текущую версию схемы
+
+    Args:
+        conn: Соединение с БД
+
+    Returns:
+        Номер последней применённой миграции (0, если миграций не было)
+    """
+    if not inspect(conn).has_table('schema_version'):
+        return 0
+    return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+
+def run_migrations(conn: Connection) -> int:
+    """
+    Применить недостающие миграции
+
+    Вызывается внутри транзакции после create_all (синхронно или через run_sync).
+
+    Args:
+        conn: Соединение с БД
+
+    Returns:
+        Количество применённых миграций
+    """
+    current = get_schema_version(conn)
+    if current >= LATEST_VERSION:
+        logger.info(f"🗂 Схема БД актуальна (версия {current})")
+        return 0
+
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, "
+        "description VARCHAR(255) NOT NULL, "
+        "applied_at TIMESTAMP NOT NULL)"
+    ))
+
+    true_literal = "1" if conn.dialect.name == "sqlite" else "true"
+    applied = 0
+    for version, description, steps in MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info(f"🗂 Миграция {version}: {description}")
+        for step in steps:
+            if callable(step):
+                step(conn)
+            else:
+                conn.execute(text(step.replace("{TRUE}", true_literal)))
+        conn.execute(
+            text("INSERT INTO schema_version (version, description, applied_at) VALUES (:v, :d, :t)"),
+            {'v': version, 'd': description, 't': datetime.utcnow()}
+        )
+        applied += 1
+
+    # Обновляем статистику планировщика под новые индексы
+    conn.execute(text("ANALYZE"))
+    logger.info(f"✅ Применено миграций: {applied}, версия схемы: {LATEST_VERSION}")
+    return applied
@@ -2,7 +2,7 @@
 Модели базы данных
 """
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Boolean, Text, DateTime
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, Text, DateTime, Date, Float, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -13,7 +13,7 @@ class User(Base):
     __tablename__ = 'users'
     
     id = Column(Integer, primary_key=True)
-    telegram_id = Column(Integer, unique=True, nullable=False, index=True)
+    telegram_id = Column(BigInteger, unique=True, nullable=False, index=True)  # ID Telegram не помещаются в int32
     username = Column(String(255), nullable=True)
     first_name = Column(String(255), nullable=True)
     last_name = Column(String(255), nullable=True)
@@ -42,6 +42,64 @@ class User(Base):
         return f"<User(telegram_id={self.telegram_id}, username={self.username})>"
 
 
+class DailyStats(Base):
+    """Суточные счётчики по когортам (день регистрации + источник)"""
+    __tablename__ = 'daily_stats'
+    __table_args__ = (UniqueConstraint('day', 'source', name='uq_daily_stats_day_source'),)
+    
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False)  # День создания пользователя (UTC)
+    source = Column(String(100), nullable=False, default='')  # Пустая строка — источник не указан
+    signups = Column(Integer, nullable=False, default=0)
+    registrations = Column(Integer, nullable=False, default=0)
+    subscriptions = Column(Integer, nullable=False, default=0)
+    pdf_claims = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<DailyStats(day={self.day}, source={self.source}, signups={self.signups})>"
+
+
+class RateLimitBucket(Base):
+    """Общее состояние rate limit (для нескольких процессов бота)"""
+    __tablename__ = 'rate_limits'
+    
+    bucket = Column(String(255), primary_key=True)  # limiter:user_id[:action]
+    window_start = Column(Float, nullable=False)  # Начало текущего окна (unix time)
+    current = Column(Integer, nullable=False, default=0)
+    previous = Column(Integer, nullable=False, default=0)
+    blocked_until = Column(Float, nullable=False, default=0)
+    violations = Column(Integer, nullable=False, default=0)
+    expires_at = Column(Float, nullable=False)  # После этого момента запись можно удалить
+    
+    def __repr__(self):
+        return f"<RateLimitBucket(bucket={self.bucket}, current={self.current})>"
+
+
+class ChannelMember(Base):
+    """Членство пользователей в обязательных каналах (по событиям chat_member)"""
+    __tablename__ = 'channel_members'
+    
+    chat_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    user_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    status = Column(String(32), nullable=False)  # Последний известный статус участника
+    is_member = Column(Boolean, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<ChannelMember(chat_id={self.chat_id}, user_id={self.user_id}, status={self.status})>"
+
+
+class ProcessedUpdate(Base):
+    """Недавно обработанные update_id (защита от повторной обработки после перезапуска)"""
+    __tablename__ = 'processed_updates'
+    
+    update_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    processed_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<ProcessedUpdate(update_id={self.update_id})>"
+
+
 class Content(Base):
     """Модель контента (для отправки по ключевому слову)"""
     __tablename__ = 'content'
@@ -81,7 +139,7 @@ class Broadcast(Base):
     __tablename__ = 'broadcasts'
     
     id = Column(Integer, primary_key=True)
-    admin_id = Column(Integer, nullable=False)
+    admin_id = Column(BigInteger, nullable=False)
     content_type = Column(String(50), nullable=False)
     text = Column(Text, nullable=True)
     file_id = Column(String(255), nullable=True)
@@ -93,6 +151,34 @@ class Broadcast(Base):
         return f"<Broadcast(id={self.id}, sent={self.sent_count})>"
 
 
+class BroadcastJob(Base):
+    """Задание рассылки: выполняется фоновым обработчиком и продолжается после перезапуска"""
+    __tablename__ = 'broadcast_jobs'
+    
+    id = Column(Integer, primary_key=True)
+    admin_id = Column(BigInteger, nullable=False)
+    content_type = Column(String(50), nullable=False)
+    text = Column(Text, nullable=True)
+    file_id = Column(String(255), nullable=True)
+    status = Column(String(20), nullable=False, default='draft', index=True)  # draft, queued, running, paused, cancelled, done, failed
+    cursor_id = Column(Integer, nullable=False, default=0)  # users.id последнего обработанного получателя
+    total = Column(Integer, nullable=False, default=0)
+    sent_count = Column(Integer, nullable=False, default=0)
+    failed_count = Column(Integer, nullable=False, default=0)
+    # Сообщение с прогрессом у администратора
+    progress_chat_id = Column(BigInteger, nullable=True)
+    progress_message_id = Column(Integer, nullable=True)
+    # Аренда: задание выполняет только владелец, пока аренда не истекла
+    lease_owner = Column(String(100), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f"<BroadcastJob(id={self.id}, status={self.status}, sent={self.sent_count}/{self.total})>"
+
+
 class DemoProject(Base):
     """Модель демо проекта"""
     __tablename__ = 'demo_projects'
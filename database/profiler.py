@@ -0,0 +1,226 @@
+"""
+Профилировщик SQL-запросов
+
+Слушатели before/after_cursor_execute собирают статистику по «отпечаткам»
+запросов: текст с заменёнными литералами. Для каждого отпечатка хранятся
+количество вызовов, суммарное время, гистограмма задержек (p50/p95/p99)
+и количество строк. Учёт стоит несколько операций со словарём на запрос,
+поэтому профилировщик можно держать включённым в продакшене.
+"""
+import re
+import math
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Гистограмма: логарифмические корзины с шагом 2^(1/4) (~19%) от 10 мкс
+_BUCKET_BASE = 1e-5
+_BUCKETS_PER_DOUBLING = 4
+_BUCKET_COUNT = 100
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+# Сколько различных текстов запросов запоминать вместе с отпечатками
+_FINGERPRINT_CACHE_SIZE = 5000
+# Сколько отпечатков хранить в статистике (сверх — вытесняются давно не встречавшиеся)
+_MAX_FINGERPRINTS = 2000
+
+
+def fingerprint(statement: str) -> str:
+    """
+    Нормализовать текст запроса: литералы → ?, списки IN (?, ?, ...) → (?...)
+
+    Args:
+        statement: SQL-запрос
+
+    Returns:
+        Отпечаток запроса
+    """
+    text = _STRING_LITERAL.sub("?", statement)
+    text = _NUMBER_LITERAL.sub("?", text)
+    text = _IN_LIST.sub("(?...)", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def _bucket_index(seconds: float) -> int:
+    if seconds <= _BUCKET_BASE:
+        return 0
+    index = int(math.log2(seconds / _BUCKET_BASE) * _BUCKETS_PER_DOUBLING) + 1
+    return min(index, _BUCKET_COUNT - 1)
+
+
+def _bucket_upper_bound(index: int) -> float:
+    return _BUCKET_BASE * 2 ** (index / _BUCKETS_PER_DOUBLING)
+
+
+class QueryStats:
+    """Статистика одного отпечатка запроса"""
+
+    __slots__ = ('count', 'total', 'max', 'rows', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.buckets = [0] * _BUCKET_COUNT
+
+    def add(self, seconds: float, rows: int):
+        """Учесть одно выполнение"""
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.rows += rows
+        self.buckets[_bucket_index(seconds)] += 1
+
+    def percentile(self, fraction: float) -> float:
+        """Оценка перцентиля задержки (верхняя граница корзины), в секундах"""
+        if not self.count:
+            return 0.0
+        threshold = fraction * self.count
+        seen = 0
+        for index, hits in enumerate(self.buckets):
+            seen += hits
+            if seen >= threshold:
+                return min(_bucket_upper_bound(index), self.max)
+        return self.max
+
+
+class QueryProfiler:
+    """Сбор статистики выполнения SQL-запросов"""
+
+    def __init__(self, enabled: bool = True, slow_query_seconds: float = 1.0,
+                 max_fingerprints: int = _MAX_FINGERPRINTS):
+        """
+        Args:
+            enabled: Собирать статистику (медленные запросы логируются всегда)
+            slow_query_seconds: Порог логирования медленного запроса
+            max_fingerprints: Максимум отпечатков в статистике
+        """
+        self.enabled = enabled
+        self.slow_query_seconds = slow_query_seconds
+        self.max_fingerprints = max_fingerprints
+        self._fingerprints: Dict[str, str] = {}
+        # Отпечатки в порядке последнего выполнения
+        self._stats: "OrderedDict[str, QueryStats]" = OrderedDict()
+        self.evicted = 0
+        self.started_at = datetime.utcnow()
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        """Слушатель SQLAlchemy: запомнить время начала запроса"""
+        conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        """Слушатель SQLAlchemy: учесть время и количество строк"""
+        elapsed = time.perf_counter() - conn.info['query_start_time'].pop(-1)
+        if elapsed > self.slow_query_seconds:
+            logger.warning(f"⚠️ Медленный запрос к БД ({elapsed:.2f}s): {statement[:100]}")
+        if self.enabled:
+            self.record(statement, elapsed, _row_count(cursor))
+
+    def handle_error(self, context):
+        """Слушатель SQLAlchemy: снять время начала запроса, завершившегося ошибкой"""
+        conn = context.connection
+        if conn is None or context.statement is None:
+            return
+        starts = conn.info.get('query_start_time')
+        if starts:
+            starts.pop(-1)
+
+    def record(self, statement: str, seconds: float, rows: int = 0):
+        """
+        Учесть выполнение запроса
+
+        Args:
+            statement: SQL-запрос
+            seconds: Время выполнения
+            rows: Количество возвращённых или изменённых строк
+        """
+        key = self._fingerprints.get(statement)
+        if key is None:
+            key = fingerprint(statement)
+            if len(self._fingerprints) < _FINGERPRINT_CACHE_SIZE:
+                self._fingerprints[statement] = key
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = QueryStats()
+            # Разовые запросы (например, с уникальным текстом) не копятся без конца
+            while len(self._stats) > self.max_fingerprints:
+                self._stats.popitem(last=False)
+                self.evicted += 1
+        else:
+            self._stats.move_to_end(key)
+        stats.add(seconds, rows)
+
+    def reset(self):
+        """Сбросить накопленную статистику"""
+        self._stats = OrderedDict()
+        self._fingerprints = {}
+        self.evicted = 0
+        self.started_at = datetime.utcnow()
+
+    def report(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Статистика по отпечаткам, отсортированная по суммарному времени
+
+        Args:
+            limit: Сколько отпечатков вернуть (None — все)
+
+        Returns:
+            Список словарей со статистикой (время в миллисекундах)
+        """
+        grand_total = sum(stats.total for stats in self._stats.values()) or 1.0
+        ranked = sorted(self._stats.items(), key=lambda item: item[1].total, reverse=True)
+        if limit is not None:
+            ranked = ranked[:limit]
+        return [
+            {
+                'query': key,
+                'count': stats.count,
+                'total_ms': round(stats.total * 1000, 3),
+                'share': round(stats.total / grand_total, 4),
+                'avg_ms': round(stats.total / stats.count * 1000, 3),
+                'p50_ms': round(stats.percentile(0.50) * 1000, 3),
+                'p95_ms': round(stats.percentile(0.95) * 1000, 3),
+                'p99_ms': round(stats.percentile(0.99) * 1000, 3),
+                'max_ms': round(stats.max * 1000, 3),
+                'rows': stats.rows,
+                'avg_rows': round(stats.rows / stats.count, 2),
+            }
+            for key, stats in ranked
+        ]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Полный отчёт для выгрузки в JSON"""
+        return {
+            'started_at': self.started_at.isoformat(),
+            'generated_at': datetime.utcnow().isoformat(),
+            'evicted_fingerprints': self.evicted,
+            'queries': self.report(),
+        }
+
+
+def _row_count(cursor) -> int:
+    """Количество строк запроса без дополнительного чтения курсора"""
+    # Асинхронный адаптер SQLAlchemy заранее вычитывает результат SELECT в _rows
+    rows = getattr(cursor, '_rows', None)
+    if rows is not None and cursor.description is not None:
+        return len(rows)
+    rowcount = getattr(cursor, 'rowcount', -1)
+    return rowcount if rowcount and rowcount > 0 else 0
+
+
+# Глобальный профилировщик запросов
+query_profiler = QueryProfiler(
+    enabled=settings.DB_PROFILER_ENABLED,
+    slow_query_seconds=settings.DB_SLOW_QUERY_MS / 1000
+)
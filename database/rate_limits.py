@@ -0,0 +1,138 @@
+"""
+Общее хранилище rate limit в БД
+
+Каждая проверка — один атомарный upsert с RETURNING: сдвиг окон,
+решение о блокировке и учёт запроса выполняются в самой СУБД, поэтому
+лимиты общие для всех процессов бота и переживают перезапуск.
+Используется только с PostgreSQL: в SQLite каждый апдейт занимал бы
+единственное пишущее соединение (см. проверку RATE_LIMIT_BACKEND в config).
+"""
+import time
+import logging
+from typing import Optional, Tuple
+from sqlalchemy import case, delete, select, or_
+from sqlalchemy.ext.asyncio import AsyncEngine
+from database.db import async_engine, insert_for_dialect
+from database.models import RateLimitBucket
+from utils.rate_limit import RateLimitStorage, RateLimitHit, RateLimitKey
+
+logger = logging.getLogger(__name__)
+
+
+def _bucket(key: RateLimitKey) -> str:
+    """Строковый ключ записи"""
+    return ":".join(str(part) for part in key)
+
+
+class DatabaseRateLimitStorage(RateLimitStorage):
+    """Состояния лимитов в таблице rate_limits"""
+
+    def __init__(self, engine: Optional[AsyncEngine] = None):
+        """
+        Args:
+            engine: Движок БД (по умолчанию — общий движок приложения)
+        """
+        self.engine = engine if engine is not None else async_engine
+
+    def _now(self) -> float:
+        # Время общее для всех процессов — используем часы системы
+        return time.time()
+
+    async def hit(self, key: RateLimitKey, max_requests: int, window: int, block_duration: int) -> RateLimitHit:
+        now = self._now()
+        window_start = float(int(now // window) * window)
+        overlap = 1 - (now - window_start) / window
+        expires_at = now + max(2 * window, block_duration)
+        table = RateLimitBucket.__table__
+        c = table.c
+
+        current = case((c.window_start == window_start, c.current), else_=0)
+        previous = case(
+            (c.window_start == window_start, c.previous),
+            (c.window_start == window_start - window, c.current),
+            else_=0
+        )
+        blocked = c.blocked_until > now
+        over = previous * overlap + current >= max_requests
+        # Истёкшая блокировка сбрасывает нарушения
+        base_violations = case((c.blocked_until > 0, 0), else_=c.violations)
+
+        stmt = insert_for_dialect(RateLimitBucket).values(
+            bucket=_bucket(key),
+            window_start=window_start,
+            current=1,
+            previous=0,
+            blocked_until=0,
+            violations=0,
+            expires_at=expires_at
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[c.bucket],
+            set_={
+                'window_start': window_start,
+                'previous': previous,
+                'current': current + case((or_(blocked, over), 0), else_=1),
+                'blocked_until': case(
+                    (blocked, c.blocked_until),
+                    # Без блокировки (лимит действия) отметка равна now — так виден отказ
+                    (over, now + block_duration),
+                    else_=0
+                ),
+                'violations': case(
+                    (blocked, c.violations),
+                    (over, base_violations + (1 if block_duration > 0 else 0)),
+                    else_=base_violations
+                ),
+                'expires_at': case((c.expires_at > expires_at, c.expires_at), else_=expires_at),
+            }
+        ).returning(
+            # RETURNING отдаёт новые значения — по ним восстанавливается исход
+            c.blocked_until, c.violations
+        )
+
+        async with self.engine.begin() as conn:
+            row = (await conn.execute(stmt)).one()
+
+        return self._to_hit(row, now, block_duration)
+
+    @staticmethod
+    def _to_hit(row, now: float, block_duration: int) -> RateLimitHit:
+        """Восстановить исход проверки по новым значениям строки"""
+        if row.blocked_until > now:
+            # Блокировка, выставленная этим запросом, заканчивается ровно через block_duration
+            newly = block_duration > 0 and row.blocked_until == now + block_duration
+            return RateLimitHit(
+                allowed=False,
+                blocked=newly,
+                retry_after=int(row.blocked_until - now),
+                violations=row.violations
+            )
+        if row.blocked_until == now:
+            return RateLimitHit(allowed=False, blocked=False, retry_after=0, violations=row.violations)
+        return RateLimitHit(allowed=True, blocked=False, retry_after=0, violations=row.violations)
+
+    async def get(self, key: RateLimitKey) -> Optional[Tuple[float, int]]:
+        async with self.engine.connect() as conn:
+            row = (await conn.execute(
+                select(RateLimitBucket.blocked_until, RateLimitBucket.violations)
+                .where(RateLimitBucket.bucket == _bucket(key))
+            )).first()
+        if row is None:
+            return None
+        remaining = row.blocked_until - self._now()
+        return (remaining if remaining > 0 else 0.0), row.violations
+
+    async def reset(self, prefix: RateLimitKey):
+        bucket = _bucket(prefix)
+        async with self.engine.begin() as conn:
+            await conn.execute(delete(RateLimitBucket).where(or_(
+                RateLimitBucket.bucket == bucket,
+                RateLimitBucket.bucket.startswith(bucket + ":", autoescape=True)
+            )))
+
+    async def sweep(self, limit: int = 1000) -> int:
+        async with self.engine.begin() as conn:
+            result = await conn.execute(
+                delete(RateLimitBucket).where(RateLimitBucket.expires_at < self._now())
+            )
+        return result.rowcount or 0
@@ -0,0 +1,244 @@
+"""
+Инкрементальная статистика пользователей
+
+Вместо COUNT(*) по всей таблице users при каждом открытии панели
+счётчики хранятся в daily_stats по когортам: день создания пользователя
+и источник. Изменения пользователей превращаются в дельты, которые
+записываются вместе с очередью отложенной записи в одной транзакции.
+
+Дельты считаются от состояния, известного этому процессу: при нескольких
+процессах или после вытеснения записи из кэша они могут разойтись с
+users, поэтому счётчики периодически пересчитываются заново (StatsReconciler).
+"""
+import asyncio
+import logging
+from datetime import date, datetime, timedelta
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, Tuple
+from sqlalchemy import select, delete, insert, func, case
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.db import get_async_session, insert_for_dialect
+from database.models import DailyStats, User
+from database.write_behind import user_write_queue
+from config import settings
+
+if TYPE_CHECKING:
+    from database.user_cache import UserState
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ('signups', 'registrations', 'subscriptions', 'pdf_claims')
+
+# Дельты счётчиков: {(день, источник): {счётчик: изменение}}
+Deltas = Dict[Tuple[date, str], Dict[str, int]]
+
+
+def _contribution(state: Optional["UserState"]) -> Tuple[Optional[Tuple[date, str]], Dict[str, int]]:
+    """Вклад одного пользователя в счётчики своей когорты"""
+    if state is None:
+        return None, {}
+    key = (state.created_day, state.source or '')
+    return key, {
+        'signups': 1,
+        'registrations': int(state.is_registered),
+        'subscriptions': int(state.is_subscribed),
+        'pdf_claims': int(state.has_pdf),
+    }
+
+
+def diff_states(before: Optional["UserState"], after: Optional["UserState"]) -> Deltas:
+    """
+    Посчитать изменения счётчиков при переходе пользователя между состояниями
+
+    Смена источника переносит пользователя в другую когорту,
+    удаление (after=None) вычитает его вклад целиком.
+
+    Args:
+        before: Состояние до изменения (None — пользователя не было)
+        after: Состояние после изменения (None — пользователь удалён)
+
+    Returns:
+        Ненулевые дельты по когортам
+    """
+    deltas: Deltas = {}
+    for state, sign in ((before, -1), (after, 1)):
+        key, values = _contribution(state)
+        if key is None:
+            continue
+        bucket = deltas.setdefault(key, dict.fromkeys(COUNTERS, 0))
+        for name, value in values.items():
+            bucket[name] += sign * value
+    return {key: values for key, values in deltas.items() if any(values.values())}
+
+
+class DailyStatsCollector:
+    """Накопитель дельт daily_stats, сбрасываемый вместе с очередью записи"""
+
+    def __init__(self):
+        self._pending: Deltas = {}
+
+    def record(self, before: Optional["UserState"], after: Optional["UserState"]):
+        """Учесть изменение пользователя (запишется при ближайшем сбросе очереди)"""
+        self._merge(diff_states(before, after))
+
+    def has_pending(self) -> bool:
+        """Есть ли незаписанные дельты"""
+        return bool(self._pending)
+
+    def _merge(self, deltas: Deltas):
+        for key, values in deltas.items():
+            bucket = self._pending.setdefault(key, dict.fromkeys(COUNTERS, 0))
+            for name, value in values.items():
+                bucket[name] += value
+
+    async def flush_hook(self, db: AsyncSession) -> Callable[[], None]:
+        """Хук очереди отложенной записи: записать накопленные дельты"""
+        batch, self._pending = self._pending, {}
+        await write_deltas(db, batch)
+        return lambda: self._merge(batch)
+
+
+async def write_deltas(db: AsyncSession, deltas: Deltas):
+    """
+    Прибавить дельты к строкам daily_stats (upsert одним executemany)
+
+    Args:
+        db: Сессия БД (коммит на вызывающей стороне)
+        deltas: Дельты по когортам
+    """
+    if not deltas:
+        return
+
+    rows = [
+        {'day': day, 'source': source, **values}
+        for (day, source), values in deltas.items()
+    ]
+    stmt = insert_for_dialect(DailyStats)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DailyStats.day, DailyStats.source],
+        set_={name: getattr(DailyStats, name) + stmt.excluded[name] for name in COUNTERS}
+    )
+    await db.execute(stmt, rows)
+
+
+def rebuild_statements():
+    """
+    Выражения полного пересчёта daily_stats из таблицы users
+
+    Используются и командой пересчёта, и миграцией первичного заполнения.
+    """
+    day = func.coalesce(func.date(User.created_at), func.current_date())
+    source = func.coalesce(User.source, '')
+    aggregate = select(
+        day,
+        source,
+        func.count(),
+        func.sum(case((User.is_registered == True, 1), else_=0)),
+        func.sum(case((User.is_subscribed == True, 1), else_=0)),
+        func.sum(case((User.has_pdf == True, 1), else_=0)),
+    ).group_by(day, source)
+    return (
+        delete(DailyStats),
+        insert(DailyStats).from_select(['day', 'source', *COUNTERS], aggregate),
+    )
+
+
+async def rebuild_daily_stats() -> int:
+    """
+    Пересчитать daily_stats заново по таблице users
+
+    Перед пересчётом сбрасывается очередь отложенной записи: изменения,
+    поставленные в очередь позже, придут обычными дельтами.
+
+    Returns:
+        Количество строк daily_stats после пересчёта
+    """
+    await user_write_queue.flush()
+    async with get_async_session() as db:
+        for stmt in rebuild_statements():
+            await db.execute(stmt)
+        await db.commit()
+        rows = await db.scalar(select(func.count()).select_from(DailyStats))
+    logger.info(f"📊 Статистика пересчитана: {rows} строк daily_stats")
+    return rows
+
+
+async def get_total_users(db: AsyncSession) -> int:
+    """Общее количество пользователей по счётчикам (без COUNT по users)"""
+    return await db.scalar(select(func.coalesce(func.sum(DailyStats.signups), 0)))
+
+
+async def get_summary(db: AsyncSession) -> Dict[str, Any]:
+    """
+    Сводная статистика для админ-панели одним запросом по daily_stats
+
+    Args:
+        db: Сессия БД
+
+    Returns:
+        Итоги и прирост пользователей за сегодня/неделю/месяц (по UTC)
+    """
+    today = datetime.utcnow().date()
+
+    def total(column):
+        return func.coalesce(func.sum(column), 0)
+
+    def signups_since(day: date):
+        return total(case((DailyStats.day >= day, DailyStats.signups), else_=0))
+
+    row = (await db.execute(select(
+        total(DailyStats.signups).label('total_users'),
+        total(DailyStats.registrations).label('registered_users'),
+        total(DailyStats.subscriptions).label('subscribed_users'),
+        total(DailyStats.pdf_claims).label('pdf_users'),
+        signups_since(today).label('users_today'),
+        signups_since(today - timedelta(days=7)).label('users_this_week'),
+        signups_since(today - timedelta(days=30)).label('users_this_month'),
+    ))).one()
+    return dict(row._mapping)
+
+
+class StatsReconciler:
+    """Периодическая сверка daily_stats с таблицей users"""
+
+    def __init__(self, interval_hours: float):
+        """
+        Args:
+            interval_hours: Интервал пересчёта в часах (0 — выключено)
+        """
+        self.interval_hours = interval_hours
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Запустить сверку по расписанию"""
+        if self.interval_hours <= 0:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"📊 Сверка статистики по расписанию: каждые {self.interval_hours} ч")
+
+    async def stop(self):
+        """Остановить сверку"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        """Цикл сверки"""
+        while True:
+            await asyncio.sleep(self.interval_hours * 3600)
+            try:
+                await rebuild_daily_stats()
+            except Exception as e:
+                logger.error(f"❌ Ошибка сверки статистики: {e}", exc_info=True)
+
+
+# Глобальный накопитель дельт статистики
+daily_stats = DailyStatsCollector()
+user_write_queue.register_flush_hook(daily_stats.flush_hook, daily_stats.has_pending)
+
+# Глобальная сверка статистики
+stats_reconciler = StatsReconciler(interval_hours=settings.STATS_REBUILD_INTERVAL_HOURS)
@@ -0,0 +1,140 @@
+"""
+Журнал обработанных апдейтов
+
+После падения или перезапуска Telegram может повторно прислать апдейты,
+которые уже обработаны (смещение подтверждается только следующим
+getUpdates). Журнал хранит кольцо последних update_id в памяти и в БД:
+новые id пишутся пачками вместе с очередью отложенной записи, а при
+запуске кольцо загружается. Смещение в Telegram заранее не подтверждается:
+апдейты обрабатываются параллельно, и к моменту падения апдейты с меньшими
+id могли ещё не завершиться — повторы отсеет само кольцо.
+
+update_id обычно растут, но после недели без апдейтов Telegram начинает
+их со случайного значения, которое может оказаться меньше прежних.
+Скачок назад дальше окна кольца считается таким сбросом, а не повтором:
+кольцо очищается, старые id удаляются из БД при следующем сбросе очереди.
+"""
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Callable, List
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.db import get_read_session, insert_for_dialect
+from database.models import ProcessedUpdate
+from database.write_behind import user_write_queue
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateLog:
+    """Кольцо последних обработанных update_id"""
+
+    def __init__(self, ring_size: int = 10000):
+        """
+        Args:
+            ring_size: Сколько последних update_id помнить
+        """
+        self.ring_size = ring_size
+        self._ring = deque()
+        self._seen = set()
+        # Все id не больше floor вытеснены из кольца и считаются обработанными
+        self.floor = 0
+        self.last_update_id = 0
+        self._pending: List[int] = []
+        # После сброса нумерации старые id в БД нужно удалить
+        self._purge_pending = False
+        self.duplicates = 0
+
+    def claim(self, update_id: int) -> bool:
+        """
+        Отметить апдейт как принятый в обработку
+
+        Returns:
+            False, если апдейт уже обрабатывался
+        """
+        if self.is_id_reset(update_id):
+            self._reset(update_id)
+        elif update_id <= self.floor or update_id in self._seen:
+            self.duplicates += 1
+            return False
+        self._remember(update_id)
+        return True
+
+    def is_id_reset(self, update_id: int) -> bool:
+        """Похоже ли update_id на новую нумерацию (скачок назад дальше окна кольца)"""
+        return update_id < self.last_update_id - self.ring_size
+
+    def _reset(self, update_id: int):
+        """Забыть прежнюю нумерацию update_id"""
+        logger.warning(
+            f"⚠️ update_id {update_id} меньше последнего ({self.last_update_id}) больше чем на "
+            f"{self.ring_size}: Telegram начал нумерацию заново, журнал апдейтов сброшен"
+        )
+        self._ring.clear()
+        self._seen.clear()
+        self.floor = 0
+        self.last_update_id = 0
+        # Незаписанные id относятся к старой нумерации
+        self._pending = []
+        self._purge_pending = True
+
+    def _remember(self, update_id: int):
+        if len(self._ring) >= self.ring_size:
+            evicted = self._ring.popleft()
+            self._seen.discard(evicted)
+            self.floor = max(self.floor, evicted)
+        self._ring.append(update_id)
+        self._seen.add(update_id)
+        self.last_update_id = max(self.last_update_id, update_id)
+
+    def done(self, update_id: int):
+        """Апдейт обработан — записать при следующем сбросе очереди"""
+        self._pending.append(update_id)
+
+    def has_pending(self) -> bool:
+        """Есть ли незаписанные id"""
+        return bool(self._pending) or self._purge_pending
+
+    async def flush_hook(self, db: AsyncSession) -> Callable[[], None]:
+        """Хук очереди отложенной записи: записать id и обрезать старые"""
+        batch, self._pending = self._pending, []
+        purge, self._purge_pending = self._purge_pending, False
+        if purge:
+            # Старая нумерация целиком больше новой
+            stale = delete(ProcessedUpdate)
+            if batch:
+                stale = stale.where(ProcessedUpdate.update_id > max(batch))
+            await db.execute(stale)
+        if batch:
+            now = datetime.utcnow()
+            stmt = insert_for_dialect(ProcessedUpdate).on_conflict_do_nothing(index_elements=[ProcessedUpdate.update_id])
+            await db.execute(stmt, [{'update_id': update_id, 'processed_at': now} for update_id in batch])
+            await db.execute(delete(ProcessedUpdate).where(ProcessedUpdate.update_id <= max(batch) - self.ring_size))
+
+        def undo():
+            self._pending.extend(batch)
+            self._purge_pending = self._purge_pending or purge
+        return undo
+
+    async def load(self):
+        """Загрузить кольцо из БД"""
+        async with get_read_session() as db:
+            ids = (await db.scalars(
+                select(ProcessedUpdate.update_id)
+                .order_by(ProcessedUpdate.update_id.desc())
+                .limit(self.ring_size)
+            )).all()
+        for update_id in reversed(ids):
+            self._remember(update_id)
+        if ids:
+            # Всё, что старше загруженного окна, тоже уже обработано
+            self.floor = max(self.floor, ids[-1] - 1)
+        logger.info(f"🧾 Журнал апдейтов: загружено {len(ids)}, последний update_id {self.last_update_id}")
+
+
+
+# Глобальный журнал апдейтов
+update_log = UpdateLog(ring_size=settings.UPDATE_DEDUP_RING_SIZE)
+user_write_queue.register_flush_hook(update_log.flush_hook, update_log.has_pending)
@@ -0,0 +1,265 @@
+"""
+Кэш состояния пользователей
+
+Почти каждый обработчик загружает пользователя только ради пары флагов
+(is_registered, has_pdf). Кэш хранит компактную запись UserState по
+telegram_id (LRU + TTL), поэтому меню и ключевые слова не ходят в БД.
+Все изменения пользователей проходят через update_user(), который
+ставит их в очередь отложенной записи, обновляет кэш и статистику.
+"""
+import time
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from datetime import date, datetime
+from typing import Any, Dict, Optional, Tuple
+from sqlalchemy import update
+from database.db import get_async_session, get_read_session
+from database.models import User
+from database.write_behind import user_write_queue, load_user
+from database.stats import daily_stats
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Маркер «пользователя нет в БД» (кэшируется так же, как найденные)
+_MISSING = object()
+# Маркер прерванной загрузки
+_NOT_LOADED = object()
+
+
+@dataclass(frozen=True)
+class UserState:
+    """Компактное состояние пользователя для горячих путей"""
+    telegram_id: int
+    is_registered: bool
+    is_subscribed: bool
+    has_pdf: bool
+    is_active: bool
+    source: Optional[str]
+    created_day: date
+
+    @classmethod
+    def merge(cls, telegram_id: int, state: Optional["UserState"], fields: Dict[str, Any]) -> "UserState":
+        """Применить изменения полей User к состоянию (None — новый пользователь)"""
+        if state is None:
+            state = cls(
+                telegram_id=telegram_id,
+                is_registered=False,
+                is_subscribed=False,
+                has_pdf=False,
+                is_active=True,
+                source=None,
+                created_day=datetime.utcnow().date(),
+            )
+        changes = {key: value for key, value in fields.items() if key in cls.__dataclass_fields__}
+        if fields.get('created_at') is not None:
+            changes['created_day'] = fields['created_at'].date()
+        return replace(state, **changes) if changes else state
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserState":
+        """Собрать состояние из модели (в т.ч. ещё не сохранённой)"""
+        return cls(
+            telegram_id=user.telegram_id,
+            is_registered=bool(user.is_registered),
+            is_subscribed=bool(user.is_subscribed),
+            has_pdf=bool(user.has_pdf),
+            is_active=user.is_active is not False,
+            source=user.source,
+            created_day=(user.created_at or datetime.utcnow()).date(),
+        )
+
+
+class UserStateCache:
+    """LRU-кэш состояния пользователей с ограничением по времени жизни"""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300):
+        """
+        Args:
+            max_size: Максимальное количество записей
+            ttl: Время жизни записи в секундах
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        # {telegram_id: (время_истечения, UserState или _MISSING)}
+        self._entries: "OrderedDict[int, Tuple[float, Any]]" = OrderedDict()
+        # Незавершённые загрузки: {telegram_id: [количество, поколение]}.
+        # Запись пользователя увеличивает поколение, и устаревшая загрузка не попадёт в кэш
+        self._loads: Dict[int, list] = {}
+        # Статистика
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, telegram_id: int) -> Tuple[bool, Optional[UserState]]:
+        """
+        Найти запись в кэше
+
+        Returns:
+            (найдено, состояние) — состояние None, если пользователя нет в БД
+        """
+        entry = self._entries.get(telegram_id)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(telegram_id)
+                self.hits += 1
+                return True, None if value is _MISSING else value
+            del self._entries[telegram_id]
+        self.misses += 1
+        return False, None
+
+    def begin_load(self, telegram_id: int) -> int:
+        """Отметить начало загрузки из БД и получить поколение записи"""
+        load = self._loads.setdefault(telegram_id, [0, 0])
+        load[0] += 1
+        return load[1]
+
+    def end_load(self, telegram_id: int, generation: int, state: Any = _NOT_LOADED) -> bool:
+        """
+        Завершить загрузку и сохранить результат, если пользователь не менялся
+
+        Args:
+            telegram_id: Telegram ID пользователя
+            generation: Поколение из begin_load()
+            state: Загруженное состояние (None — пользователя нет); без него загрузка отменяется
+
+        Returns:
+            True, если состояние сохранено
+        """
+        load = self._loads[telegram_id]
+        load[0] -= 1
+        if load[0] == 0:
+            del self._loads[telegram_id]
+        if state is _NOT_LOADED or load[1] != generation:
+            return False
+        self._store(telegram_id, state)
+        return True
+
+    def put(self, telegram_id: int, state: Optional[UserState]):
+        """Сохранить новое состояние после изменения пользователя"""
+        self._touch(telegram_id)
+        self._store(telegram_id, state)
+
+    def invalidate(self, telegram_id: int):
+        """Удалить запись пользователя из кэша"""
+        self._touch(telegram_id)
+        self._entries.pop(telegram_id, None)
+
+    def clear(self):
+        """Очистить кэш"""
+        for load in self._loads.values():
+            load[1] += 1
+        self._entries.clear()
+
+    def _touch(self, telegram_id: int):
+        load = self._loads.get(telegram_id)
+        if load is not None:
+            load[1] += 1
+
+    def _store(self, telegram_id: int, state: Optional[UserState]):
+        self._entries[telegram_id] = (time.monotonic() + self.ttl, _MISSING if state is None else state)
+        self._entries.move_to_end(telegram_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика попаданий"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
+async def get_user_state(telegram_id: int) -> Optional[UserState]:
+    """
+    Получить состояние пользователя (из кэша или из БД)
+
+    Возвращённое состояние актуально на момент возврата: если во время
+    загрузки пользователь изменился, загрузка повторяется.
+
+    Args:
+        telegram_id: Telegram ID пользователя
+
+    Returns:
+        Состояние пользователя или None, если пользователя нет
+    """
+    while True:
+        found, state = user_state_cache.lookup(telegram_id)
+        if found:
+            return state
+
+        generation = user_state_cache.begin_load(telegram_id)
+        state = _NOT_LOADED
+        try:
+            async with get_read_session() as db:
+                user = await load_user(db, telegram_id)
+            state = UserState.from_user(user) if user else None
+        finally:
+            stored = user_state_cache.end_load(telegram_id, generation, state)
+        if stored:
+            return state
+
+
+async def update_user(telegram_id: int, **fields) -> UserState:
+    """
+    Изменить пользователя: поставить запись в очередь, обновить кэш и статистику
+
+    Новый пользователь создаётся при первом вызове.
+
+    Args:
+        telegram_id: Telegram ID пользователя
+        **fields: Поля модели User и их новые значения
+
+    Returns:
+        Актуальное состояние пользователя
+    """
+    before = await get_user_state(telegram_id)
+    # Дальше без await: чтение, запись в очередь и дельты статистики атомарны для event loop
+    if before is None:
+        fields.setdefault('created_at', datetime.utcnow())
+    after = UserState.merge(telegram_id, before, fields)
+    user_write_queue.enqueue(telegram_id, **fields)
+    user_state_cache.put(telegram_id, after)
+    daily_stats.record(before, after)
+    return after
+
+
+async def deactivate_user(telegram_id: int) -> bool:
+    """
+    Пометить пользователя неактивным, не создавая его
+
+    В отличие от update_user() выполняет только UPDATE: пользователь,
+    удалённый администратором, не будет создан заново.
+
+    Args:
+        telegram_id: Telegram ID пользователя
+
+    Returns:
+        True, если пользователь был активен и помечен неактивным
+    """
+    async with get_async_session() as db:
+        result = await db.execute(
+            update(User)
+            .where(User.telegram_id == telegram_id, User.is_active == True)
+            .values(is_active=False)
+        )
+        await db.commit()
+    if result.rowcount != 1:
+        return False
+    found, state = user_state_cache.lookup(telegram_id)
+    if found and state is not None:
+        user_state_cache.put(telegram_id, replace(state, is_active=False))
+    else:
+        user_state_cache.invalidate(telegram_id)
+    return True
+
+
+# Глобальный кэш состояния пользователей
+user_state_cache = UserStateCache(
+    max_size=settings.USER_CACHE_SIZE,
+    ttl=settings.USER_CACHE_TTL
+)
@@ -0,0 +1,230 @@
+"""
+Отложенная запись (write-behind) изменений пользователей
+
+Горячие пути (подписка, PDF, регистрация) не коммитят каждое изменение
+отдельно, а ставят его в очередь. Фоновая задача объединяет изменения по
+telegram_id и раз в N мс (или при накоплении M строк) записывает их одной
+транзакцией — вместо сотен fsync в секунду получается несколько.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.db import get_async_session, insert_for_dialect
+from database.models import User
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Хук может вернуть функцию отката: она вызывается, если транзакция не удалась
+FlushHook = Callable[[AsyncSession], Awaitable[Optional[Callable[[], None]]]]
+PendingCheck = Callable[[], bool]
+
+
+class UserWriteBehind:
+    """Очередь отложенной записи изменений модели User"""
+
+    def __init__(self, flush_interval: float = 0.2, max_batch: int = 500):
+        """
+        Args:
+            flush_interval: Интервал сброса в секундах
+            max_batch: Количество пользователей, при котором сброс запускается досрочно
+        """
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        # Ожидающие изменения: {telegram_id: {поле: значение}}
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        # Изменения, которые сейчас записываются (видны читателям до commit)
+        self._inflight: Dict[int, Dict[str, Any]] = {}
+        # Дополнительные записи, выполняемые в той же транзакции: [(хук, есть_ли_данные)]
+        self._hooks: List[Tuple[FlushHook, PendingCheck]] = []
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        # Статистика
+        self.flushes = 0
+        self.rows_written = 0
+
+    def enqueue(self, telegram_id: int, **fields):
+        """
+        Поставить изменения пользователя в очередь
+
+        Повторные изменения одного пользователя объединяются: в БД попадёт
+        только последнее значение каждого поля. Если строки ещё нет, она
+        будет создана при сбросе.
+
+        Args:
+            telegram_id: Telegram ID пользователя
+            **fields: Поля модели User и их новые значения
+        """
+        self._pending.setdefault(telegram_id, {}).update(fields)
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+
+    def get_pending(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        """Получить ещё не записанные изменения пользователя (копия)"""
+        inflight = self._inflight.get(telegram_id)
+        pending = self._pending.get(telegram_id)
+        if not inflight and not pending:
+            return None
+        return {**(inflight or {}), **(pending or {})}
+
+    def apply_pending(self, user: User) -> User:
+        """Наложить ещё не записанные изменения на загруженный объект"""
+        fields = self.get_pending(user.telegram_id)
+        if fields:
+            for key, value in fields.items():
+                setattr(user, key, value)
+        return user
+
+    def register_flush_hook(self, hook: FlushHook, has_pending: PendingCheck):
+        """
+        Зарегистрировать дополнительную запись при сбросе
+
+        Хук получает сессию и выполняется в той же транзакции,
+        что и изменения пользователей. Если хук забирает данные из своей
+        очереди, он возвращает функцию, возвращающую их обратно при ошибке.
+
+        Args:
+            hook: Корутина, выполняющая запись
+            has_pending: Функция, сообщающая, есть ли у хука данные для записи
+        """
+        self._hooks.append((hook, has_pending))
+
+    def has_pending(self) -> bool:
+        """Есть ли данные, ожидающие записи"""
+        return bool(self._pending) or any(has_pending() for _, has_pending in self._hooks)
+
+    async def flush(self) -> int:
+        """
+        Записать все накопленные изменения одной транзакцией
+
+        Returns:
+            Количество записанных пользователей
+        """
+        async with self._flush_lock:
+            if not self.has_pending():
+                return 0
+
+            batch, self._pending = self._pending, {}
+            self._inflight = batch
+            undo = []
+            try:
+                async with get_async_session() as db:
+                    await self._write_batch(db, batch)
+                    for hook, has_pending in self._hooks:
+                        if has_pending():
+                            rollback = await hook(db)
+                            if rollback is not None:
+                                undo.append(rollback)
+                    await db.commit()
+            except Exception as e:
+                logger.error(f"❌ Ошибка отложенной записи ({len(batch)} пользователей): {e}", exc_info=True)
+                for rollback in undo:
+                    rollback()
+                # Возвращаем изменения в очередь, не затирая более новые значения
+                for telegram_id, fields in batch.items():
+                    newer = self._pending.get(telegram_id, {})
+                    self._pending[telegram_id] = {**fields, **newer}
+                raise
+            finally:
+                self._inflight = {}
+
+            if batch:
+                self.flushes += 1
+                self.rows_written += len(batch)
+                logger.debug(f"💾 Отложенная запись: {len(batch)} пользователей")
+            return len(batch)
+
+    async def _write_batch(self, db: AsyncSession, batch: Dict[int, Dict[str, Any]]):
+        """Upsert изменений, сгруппированных по набору полей (executemany на группу)"""
+        if not batch:
+            return
+
+        now = datetime.utcnow()
+        groups: Dict[frozenset, List[Dict[str, Any]]] = {}
+        for telegram_id, fields in batch.items():
+            row = {**fields, 'telegram_id': telegram_id, 'updated_at': now}
+            groups.setdefault(frozenset(row), []).append(row)
+
+        for keys, rows in groups.items():
+            stmt = insert_for_dialect(User)
+            # created_at задаётся только при вставке новой строки
+            update_keys = [key for key in keys if key not in ('telegram_id', 'created_at')]
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[User.telegram_id],
+                set_={key: stmt.excluded[key] for key in update_keys}
+            )
+            await db.execute(stmt, rows)
+
+    def start(self):
+        """Запустить фоновую задачу сброса"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info(
+                f"💾 Отложенная запись запущена "
+                f"(интервал {int(self.flush_interval * 1000)} мс, пакет {self.max_batch})"
+            )
+
+    async def stop(self):
+        """Остановить фоновую задачу и записать всё, что осталось в очереди"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+            logger.info("💾 Отложенная запись остановлена, очередь сброшена")
+        except Exception:
+            logger.error(f"❌ Не удалось сбросить очередь при остановке: {len(self._pending)} пользователей")
+
+    async def _run(self):
+        """Цикл фонового сброса"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                # Ошибка уже залогирована, изменения вернулись в очередь
+                await asyncio.sleep(self.flush_interval)
+
+
+async def load_user(db: AsyncSession, telegram_id: int) -> Optional[User]:
+    """
+    Загрузить пользователя с учётом ещё не записанных изменений
+
+    Гарантирует read-your-writes: если изменения пользователя ещё в очереди,
+    они накладываются на строку из БД. Если строки ещё нет, но в очереди
+    есть данные, возвращается несохранённый объект User.
+
+    Args:
+        db: Сессия БД (обычно только для чтения)
+        telegram_id: Telegram ID пользователя
+
+    Returns:
+        Пользователь или None
+    """
+    user = await db.scalar(select(User).where(User.telegram_id == telegram_id))
+    if user is not None:
+        return user_write_queue.apply_pending(user)
+
+    pending = user_write_queue.get_pending(telegram_id)
+    if pending:
+        return User(telegram_id=telegram_id, **pending)
+    return None
+
+
+# Глобальная очередь отложенной записи
+user_write_queue = UserWriteBehind(
+    flush_interval=settings.WRITE_BEHIND_FLUSH_MS / 1000,
+    max_batch=settings.WRITE_BEHIND_MAX_BATCH
+)
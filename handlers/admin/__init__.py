@@ -9,6 +9,10 @@ from .main import router as main_router
 from .video_notes import router as video_notes_router
 from .demo_projects import router as demo_projects_router
 from .settings import router as settings_router
+from .dbprofile import router as dbprofile_router
+from .backup import router as backup_router
+from .users_io import router as users_io_router
+from .load import router as load_router
 
 router = Router()
 router.include_router(main_router)
@@ -18,6 +22,10 @@ router.include_router(stats_router)
 router.include_router(video_notes_router)
 router.include_router(demo_projects_router)
 router.include_router(settings_router)
+router.include_router(dbprofile_router)
+router.include_router(backup_router)
+router.include_router(users_io_router)
+router.include_router(load_router)
 
 
 
@@ -0,0 +1,88 @@
+"""
+Резервное копирование БД из админ-панели
+"""
+import os
+import logging
+from aiogram import Router, F
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+from database.backup import backup_manager
+from utils.validators import is_admin
+
+router = Router()
+logger = logging.getLogger(__name__)
+
+
+def get_backup_keyboard():
+    """Клавиатура резервного копирования"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="💾 Создать копию сейчас", callback_data="backup_create")],
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_back")]
+    ])
+
+
+def format_backups() -> str:
+    """Список имеющихся снимков"""
+    backups = backup_manager.list_backups()
+    if not backups:
+        return "Копий пока нет."
+    lines = []
+    for path in backups:
+        size = os.path.getsize(path) / 1024 / 1024
+        lines.append(f"• <code>{os.path.basename(path)}</code> — {size:.1f} МБ")
+    return "\n".join(lines)
+
+
+@router.callback_query(F.data == "admin_backup")
+async def show_backup_menu(callback: CallbackQuery):
+    """Показать меню резервного копирования"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет прав", show_alert=True)
+        return
+
+    await callback.answer()
+
+    schedule = (
+        f"каждые {backup_manager.interval_hours:g} ч" if backup_manager.interval_hours > 0 else "выключено"
+    )
+    await callback.message.edit_text(
+        f"💾 <b>Резервные копии</b>\n\n"
+        f"По расписанию: {schedule}, хранится последних: {backup_manager.keep}\n\n"
+        f"{format_backups()}",
+        reply_markup=get_backup_keyboard(),
+        parse_mode="HTML"
+    )
+
+
+@router.callback_query(F.data == "backup_create")
+async def create_backup(callback: CallbackQuery):
+    """Создать резервную копию по запросу"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет прав", show_alert=True)
+        return
+
+    if backup_manager.is_running:
+        await callback.answer("⏳ Копирование уже идёт", show_alert=True)
+        return
+
+    await callback.answer("⏳ Создаю резервную копию...")
+    logger.info(f"💾 Резервное копирование запущено админом {callback.from_user.id}")
+
+    try:
+        result = await backup_manager.create_backup()
+    except Exception as e:
+        logger.error(f"❌ Ошибка резервного копирования: {e}", exc_info=True)
+        await callback.message.edit_text(
+            f"❌ Не удалось создать копию: {e}",
+            reply_markup=get_backup_keyboard()
+        )
+        return
+
+    await callback.message.edit_text(
+        f"✅ <b>Резервная копия создана</b>\n\n"
+        f"Файл: <code>{os.path.basename(result.path)}</code>\n"
+        f"Размер: {result.size / 1024 / 1024:.1f} МБ\n"
+        f"Длительность: {result.duration:.2f} с\n\n"
+        f"{format_backups()}",
+        reply_markup=get_backup_keyboard(),
+        parse_mode="HTML"
+    )
@@ -6,10 +6,13 @@ from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from database.db import get_db_session
-from database.models import User, Broadcast
+from sqlalchemy import select, func
+from database.db import get_read_session
+from database.models import User
+from database.broadcast_jobs import create_job, queue_job, apply_action, record_history
 from utils.validators import is_admin
-from utils.messages import send_broadcast_message
+from utils.keyboards import create_broadcast_job_keyboard
+from utils.broadcast_worker import broadcast_worker, format_job_progress
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -58,7 +61,7 @@ async def process_broadcast(message: Message, state: FSMContext):
         return
     
     # Проверка rate limit для рассылки
-    allowed, error_msg = check_broadcast_rate_limit(admin_id)
+    allowed, error_msg = await check_broadcast_rate_limit(admin_id)
     if not allowed:
         logger.warning(f"🚫 Админ {admin_id} превысил лимит рассылок")
         await message.answer(error_msg)
@@ -73,14 +76,11 @@ async def process_broadcast(message: Message, state: FSMContext):
     
     logger.info(f"📢 Админ {admin_id} начал рассылку")
     
-    db = get_db_session()
     try:
-        # Получаем всех активных пользователей
-        users = db.query(User).filter(User.is_active == True).all()
-        logger.info(f"👥 Найдено {len(users)} пользователей для рассылки")
-        
-        sent_count = 0
-        failed_count = 0
+        # Считаем активных пользователей; сами id читаются пачками при отправке
+        async with get_read_session() as db:
+            total_users = await db.scalar(select(func.count(User.id)).where(User.is_active == True))
+        logger.info(f"👥 Найдено {total_users} пользователей для рассылки")
         
         # Определяем тип контента и медиа
         content_type = "text"
@@ -136,72 +136,43 @@ async def process_broadcast(message: Message, state: FSMContext):
             # Обычный текст
             text = message.text or message.caption
         
-        # Защита от перегрузки: ограничиваем количество пользователей за раз
-        MAX_BROADCAST_USERS = 1000  # Максимум пользователей за одну рассылку
-        
-        if len(users) > MAX_BROADCAST_USERS:
-            logger.warning(f"⚠️ Слишком много пользователей ({len(users)}). Ограничиваем до {MAX_BROADCAST_USERS}")
-            users = users[:MAX_BROADCAST_USERS]
-            await message.answer(
-                f"⚠️ Внимание: рассылка будет отправлена только первым {MAX_BROADCAST_USERS} пользователям "
-                f"(всего {len(users)} активных пользователей)"
-            )
-        
-        # Отправляем рассылку с задержкой между сообщениями для защиты от rate limit Telegram
-        import asyncio
-        DELAY_BETWEEN_MESSAGES = 0.05  # 50ms между сообщениями (20 сообщений в секунду)
-        
-        for user in users:
-            try:
-                await send_broadcast_message(
-                    bot=message.bot,
-                    user_id=user.telegram_id,
-                    content_type=content_type,
-                    text=text,
-                    file_id=file_id
-                )
-                sent_count += 1
-                
-                # Небольшая задержка для защиты от rate limit Telegram API
-                if sent_count % 20 == 0:  # Каждые 20 сообщений
-                    await asyncio.sleep(1)  # Пауза 1 секунда
-                else:
-                    await asyncio.sleep(DELAY_BETWEEN_MESSAGES)
-                    
-            except Exception as e:
-                logger.error(f"Ошибка отправки пользователю {user.telegram_id}: {e}")
-                failed_count += 1
-                
-                # Если слишком много ошибок подряд, останавливаем рассылку
-                if failed_count > 50:
-                    logger.error(f"❌ Слишком много ошибок ({failed_count}). Останавливаем рассылку.")
-                    await message.answer(
-                        f"❌ Рассылка остановлена из-за большого количества ошибок.\n\n"
-                        f"Отправлено: {sent_count}\n"
-                        f"Ошибок: {failed_count}"
-                    )
-                    break
-        
-        # Сохраняем в историю (file_id может быть None для текстовых сообщений)
-        broadcast = Broadcast(
-            admin_id=admin_id,
-            content_type=content_type,
-            text=text,
-            file_id=file_id,
-            sent_count=sent_count,
-            failed_count=failed_count
-        )
-        db.add(broadcast)
-        db.commit()
-        
-        logger.info(f"✅ Рассылка завершена: отправлено {sent_count}, ошибок {failed_count}")
-        await message.answer(
-            f"✅ Рассылка завершена!\n\n"
-            f"Отправлено: {sent_count}\n"
-            f"Ошибок: {failed_count}"
+        # Отправкой занимается фоновый обработчик: задание и курсор хранятся в БД
+        job = await create_job(admin_id, content_type, text, file_id, total_users)
+        progress = await message.answer(
+            format_job_progress(job),
+            reply_markup=create_broadcast_job_keyboard(job.id, job.status),
+            parse_mode="HTML"
         )
+        await queue_job(job.id, progress.chat.id, progress.message_id)
+        broadcast_worker.wake()
+        logger.info(f"📢 Рассылка #{job.id} поставлена в очередь ({total_users} получателей)")
         
     finally:
-        db.close()
         await state.clear()
 
+
+@router.callback_query(F.data.regexp(r"^bjob_(pause|resume|cancel)_\d+$"))
+async def broadcast_job_action(callback: CallbackQuery):
+    """Пауза, продолжение или отмена задания рассылки"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет прав", show_alert=True)
+        return
+    
+    _, action, job_id = callback.data.split("_")
+    job = await apply_action(int(job_id), action)
+    if job is None:
+        await callback.answer("⚠️ Это действие уже недоступно", show_alert=True)
+        return
+    
+    logger.info(f"📢 Админ {callback.from_user.id}: рассылка #{job.id} → {job.status}")
+    if job.status == 'queued':
+        broadcast_worker.wake()
+    elif job.status == 'cancelled' and job.lease_owner is None:
+        # Задание никто не выполнял — в историю его записываем здесь
+        await record_history(job)
+    await callback.answer()
+    await callback.message.edit_text(
+        format_job_progress(job),
+        reply_markup=create_broadcast_job_keyboard(job.id, job.status),
+        parse_mode="HTML"
+    )
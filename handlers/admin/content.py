@@ -5,7 +5,8 @@ from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from database.db import get_db_session
+from sqlalchemy import select
+from database.db import get_async_session, get_read_session
 from database.models import Content
 from utils.validators import is_admin, validate_text, validate_message_size
 from utils.rate_limit import check_admin_rate_limit
@@ -38,7 +39,7 @@ async def process_content_keyword(message: Message, state: FSMContext):
     admin_id = message.from_user.id
     
     # Проверка rate limit для админов
-    allowed, error_msg = check_admin_rate_limit(admin_id)
+    allowed, error_msg = await check_admin_rate_limit(admin_id)
     if not allowed:
         await message.answer(error_msg)
         return
@@ -63,10 +64,9 @@ async def process_content_keyword(message: Message, state: FSMContext):
         await message.answer("❌ Некорректное ключевое слово")
         return
     
-    db = get_db_session()
-    try:
+    async with get_read_session() as db:
         # Проверяем, не существует ли уже
-        existing = db.query(Content).filter(Content.keyword == keyword).first()
+        existing = await db.scalar(select(Content).where(Content.keyword == keyword))
         if existing:
             await message.answer("❌ Контент с таким ключевым словом уже существует")
             return
@@ -74,8 +74,6 @@ async def process_content_keyword(message: Message, state: FSMContext):
         await state.update_data(keyword=keyword)
         await state.set_state(ContentStates.waiting_content_text)
         await message.answer("📝 Введи текст контента (или отправь /skip чтобы пропустить):")
-    finally:
-        db.close()
 
 
 @router.message(ContentStates.waiting_content_text)
@@ -147,19 +145,18 @@ async def process_content_file(message: Message, state: FSMContext):
         await message.answer("❌ Отправь файл или /skip")
         return
     
-    db = get_db_session()
     try:
-        content = Content(
-            keyword=keyword,
-            content_type=content_type,
-            text=text,
-            file_id=file_id
-        )
-        db.add(content)
-        db.commit()
-        
-        await message.answer(f"✅ Контент добавлен!\n\nКлючевое слово: {keyword}")
+        async with get_async_session() as db:
+            content = Content(
+                keyword=keyword,
+                content_type=content_type,
+                text=text,
+                file_id=file_id
+            )
+            db.add(content)
+            await db.commit()
+            
+            await message.answer(f"✅ Контент добавлен!\n\nКлючевое слово: {keyword}")
     finally:
-        db.close()
         await state.clear()
 
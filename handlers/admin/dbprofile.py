@@ -0,0 +1,71 @@
+"""
+Профиль SQL-запросов
+"""
+import json
+import html
+import logging
+from datetime import datetime
+from aiogram import Router
+from aiogram.types import Message, BufferedInputFile
+from aiogram.filters import Command, CommandObject
+from database.profiler import query_profiler
+from utils.validators import is_admin
+
+router = Router()
+logger = logging.getLogger(__name__)
+
+# Сколько отпечатков показывать в сообщении
+TOP_QUERIES = 10
+
+
+def format_profile(limit: int = TOP_QUERIES) -> str:
+    """Форматировать топ запросов по суммарному времени"""
+    report = query_profiler.report(limit)
+    if not report:
+        return "🧪 <b>Профиль запросов</b>\n\nЗапросов пока не было."
+
+    since = query_profiler.started_at.strftime("%d.%m.%Y %H:%M")
+    text = f"🧪 <b>Профиль запросов</b> (с {since} UTC)\n\n"
+    for index, item in enumerate(report, 1):
+        query = item['query']
+        if len(query) > 150:
+            query = query[:150] + "…"
+        text += (
+            f"<b>{index}.</b> {item['share']:.0%} времени, {item['count']} вызовов, "
+            f"всего {item['total_ms']:.0f} мс\n"
+            f"p50/p95/p99: {item['p50_ms']:.2f}/{item['p95_ms']:.2f}/{item['p99_ms']:.2f} мс, "
+            f"строк в среднем: {item['avg_rows']}\n"
+            f"<code>{html.escape(query)}</code>\n\n"
+        )
+    text += "<i>/dbprofile json — выгрузка, /dbprofile reset — сброс</i>"
+    return text
+
+
+@router.message(Command("dbprofile"))
+async def cmd_dbprofile(message: Message, command: CommandObject):
+    """Показать, выгрузить или сбросить профиль SQL-запросов"""
+    if not is_admin(message.from_user.id):
+        return
+
+    action = (command.args or "").strip().lower()
+
+    if action == "reset":
+        query_profiler.reset()
+        logger.info(f"🧪 Профиль запросов сброшен админом {message.from_user.id}")
+        await message.answer("✅ Профиль запросов сброшен")
+        return
+
+    if action == "json":
+        payload = json.dumps(query_profiler.snapshot(), ensure_ascii=False, indent=2)
+        filename = f"dbprofile_{datetime.utcnow():%Y%m%d_%H%M%S}.json"
+        await message.answer_document(
+            BufferedInputFile(payload.encode("utf-8"), filename=filename),
+            caption="🧪 Профиль SQL-запросов"
+        )
+        return
+
+    if not query_profiler.enabled:
+        await message.answer("⚠️ Профилирование выключено (DB_PROFILER_ENABLED=false)")
+        return
+
+    await message.answer(format_profile(), parse_mode="HTML")
@@ -6,7 +6,8 @@ from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from database.db import get_db_session
+from sqlalchemy import select
+from database.db import get_async_session, get_read_session
 from database.models import DemoProject
 from utils.validators import is_admin, validate_message_size
 from utils.rate_limit import check_admin_rate_limit
@@ -37,9 +38,8 @@ async def demo_projects_menu(callback: CallbackQuery):
     
     await callback.answer()
     
-    db = get_db_session()
-    try:
-        projects = db.query(DemoProject).filter(DemoProject.is_active == True).order_by(DemoProject.order_index.asc()).all()
+    async with get_read_session() as db:
+        projects = (await db.scalars(select(DemoProject).where(DemoProject.is_active == True).order_by(DemoProject.order_index.asc()))).all()
         
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="➕ Добавить проект", callback_data="admin_demo_add")],
@@ -56,8 +56,6 @@ async def demo_projects_menu(callback: CallbackQuery):
         )
         
         await callback.message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
-    finally:
-        db.close()
 
 
 @router.callback_query(F.data == "admin_demo_list")
@@ -69,9 +67,8 @@ async def list_demo_projects(callback: CallbackQuery):
     
     await callback.answer()
     
-    db = get_db_session()
-    try:
-        projects = db.query(DemoProject).order_by(DemoProject.order_index.asc()).all()
+    async with get_read_session() as db:
+        projects = (await db.scalars(select(DemoProject).order_by(DemoProject.order_index.asc()))).all()
         
         if not projects:
             keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -97,8 +94,6 @@ async def list_demo_projects(callback: CallbackQuery):
         ])
         
         await callback.message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
-    finally:
-        db.close()
 
 
 @router.callback_query(F.data == "admin_demo_add")
@@ -194,28 +189,28 @@ async def process_demo_order(message: Message, state: FSMContext):
     
     data = await state.get_data()
     
-    db = get_db_session()
     try:
-        project = DemoProject(
-            title=data['title'],
-            description=data['description'],
-            photo_file_id=data.get('photo_file_id'),
-            app_url=data.get('app_url'),
-            channel_url=data.get('channel_url'),
-            order_index=order_index,
-            is_active=True
-        )
-        db.add(project)
-        db.commit()
-        
-        await message.answer(f"✅ Проект '{data['title']}' успешно добавлен!")
-        logger.info(f"✅ Админ {message.from_user.id} добавил проект: {data['title']}")
+        async with get_async_session() as db:
+            project = DemoProject(
+                title=data['title'],
+                description=data['description'],
+                photo_file_id=data.get('photo_file_id'),
+                app_url=data.get('app_url'),
+                channel_url=data.get('channel_url'),
+                order_index=order_index,
+                is_active=True
+            )
+            db.add(project)
+            await db.commit()
     except Exception as e:
         logger.error(f"❌ Ошибка при добавлении проекта: {e}", exc_info=True)
         await message.answer("❌ Произошла ошибка при добавлении проекта.")
+        return
     finally:
-        db.close()
         await state.clear()
+    
+    await message.answer(f"✅ Проект '{data['title']}' успешно добавлен!")
+    logger.info(f"✅ Админ {message.from_user.id} добавил проект: {data['title']}")
 
 
 @router.callback_query(F.data == "admin_demo_edit")
@@ -242,51 +237,54 @@ async def process_edit_project_id(message: Message, state: FSMContext):
         await message.answer("❌ Введи число (ID проекта). Попробуй еще раз:")
         return
     
-    db = get_db_session()
-    try:
-        project = db.query(DemoProject).filter(DemoProject.id == project_id).first()
-        
-        if not project:
-            await message.answer("❌ Проект с таким ID не найден.")
-            await state.clear()
-            return
-        
-        # Если это удаление
-        if action == "delete":
-            project.is_active = False
-            db.commit()
-            await message.answer(f"✅ Проект '{project.title}' деактивирован (удален).")
-            logger.info(f"✅ Админ {message.from_user.id} удалил проект {project_id}")
-            await state.clear()
-            return
-        
-        # Если это редактирование
-        await state.update_data(project_id=project_id)
-        
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="📝 Название", callback_data="edit_field_title")],
-            [InlineKeyboardButton(text="📄 Описание", callback_data="edit_field_description")],
-            [InlineKeyboardButton(text="📷 Фото", callback_data="edit_field_photo")],
-            [InlineKeyboardButton(text="🔗 Ссылка на приложение", callback_data="edit_field_app_url")],
-            [InlineKeyboardButton(text="📢 Ссылка на канал", callback_data="edit_field_channel_url")],
-            [InlineKeyboardButton(text="🔢 Порядок", callback_data="edit_field_order")],
-            [InlineKeyboardButton(text="✅/❌ Активность", callback_data="edit_field_active")],
-            [InlineKeyboardButton(text="❌ Отмена", callback_data="admin_demo_projects")]
-        ])
-        
-        status = "✅ Активен" if project.is_active else "❌ Неактивен"
-        await message.answer(
-            f"✏️ <b>Редактирование проекта:</b>\n\n"
-            f"ID: {project.id}\n"
-            f"Название: {project.title}\n"
-            f"Порядок: {project.order_index}\n"
-            f"Статус: {status}\n\n"
-            f"Что хочешь изменить?",
-            reply_markup=keyboard,
-            parse_mode="HTML"
-        )
-    finally:
-        db.close()
+    # Ответы отправляем после выхода из сессии: пишущее соединение не ждёт Telegram
+    if action == "delete":
+        async with get_async_session() as db:
+            project = await db.scalar(select(DemoProject).where(DemoProject.id == project_id))
+            if project:
+                project.is_active = False
+                await db.commit()
+    else:
+        async with get_read_session() as db:
+            project = await db.scalar(select(DemoProject).where(DemoProject.id == project_id))
+    
+    if not project:
+        await message.answer("❌ Проект с таким ID не найден.")
+        await state.clear()
+        return
+    
+    # Если это удаление
+    if action == "delete":
+        await message.answer(f"✅ Проект '{project.title}' деактивирован (удален).")
+        logger.info(f"✅ Админ {message.from_user.id} удалил проект {project_id}")
+        await state.clear()
+        return
+    
+    # Если это редактирование
+    await state.update_data(project_id=project_id)
+    
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="📝 Название", callback_data="edit_field_title")],
+        [InlineKeyboardButton(text="📄 Описание", callback_data="edit_field_description")],
+        [InlineKeyboardButton(text="📷 Фото", callback_data="edit_field_photo")],
+        [InlineKeyboardButton(text="🔗 Ссылка на приложение", callback_data="edit_field_app_url")],
+        [InlineKeyboardButton(text="📢 Ссылка на канал", callback_data="edit_field_channel_url")],
+        [InlineKeyboardButton(text="🔢 Порядок", callback_data="edit_field_order")],
+        [InlineKeyboardButton(text="✅/❌ Активность", callback_data="edit_field_active")],
+        [InlineKeyboardButton(text="❌ Отмена", callback_data="admin_demo_projects")]
+    ])
+    
+    status = "✅ Активен" if project.is_active else "❌ Неактивен"
+    await message.answer(
+        f"✏️ <b>Редактирование проекта:</b>\n\n"
+        f"ID: {project.id}\n"
+        f"Название: {project.title}\n"
+        f"Порядок: {project.order_index}\n"
+        f"Статус: {status}\n\n"
+        f"Что хочешь изменить?",
+        reply_markup=keyboard,
+        parse_mode="HTML"
+    )
 
 
 @router.callback_query(F.data.startswith("edit_field_"))
@@ -307,45 +305,47 @@ async def edit_field_start(callback: CallbackQuery, state: FSMContext):
         await state.clear()
         return
     
-    db = get_db_session()
-    try:
-        project = db.query(DemoProject).filter(DemoProject.id == project_id).first()
-        
-        if not project:
-            await callback.message.answer("❌ Проект не найден.")
-            await state.clear()
-            return
-        
-        await state.update_data(edit_field=field)
-        
-        field_names = {
-            "title": "название",
-            "description": "описание",
-            "photo": "фото",
-            "app_url": "ссылку на приложение",
-            "channel_url": "ссылку на канал",
-            "order": "порядок",
-            "active": "активность"
-        }
-        
-        if field == "active":
-            # Переключаем активность сразу
-            project.is_active = not project.is_active
-            db.commit()
-            await callback.message.answer(f"✅ Активность проекта изменена на: {'Активен' if project.is_active else 'Неактивен'}")
-            await state.clear()
-        elif field == "photo":
-            await state.set_state(DemoProjectStates.waiting_edit_field)
-            await callback.message.answer("📷 Отправь новое фото (или /skip чтобы удалить):")
-        elif field == "order":
-            await state.set_state(DemoProjectStates.waiting_edit_field)
-            await callback.message.answer(f"🔢 Текущий порядок: {project.order_index}\nВведи новый порядок:")
-        else:
-            await state.set_state(DemoProjectStates.waiting_edit_field)
-            current_value = getattr(project, field, "")
-            await callback.message.answer(f"✏️ Текущее значение: {current_value or '(пусто)'}\nВведи новое {field_names.get(field, field)}:")
-    finally:
-        db.close()
+    if field == "active":
+        # Переключаем активность сразу
+        async with get_async_session() as db:
+            project = await db.scalar(select(DemoProject).where(DemoProject.id == project_id))
+            if project:
+                project.is_active = not project.is_active
+                await db.commit()
+    else:
+        async with get_read_session() as db:
+            project = await db.scalar(select(DemoProject).where(DemoProject.id == project_id))
+    
+    if not project:
+        await callback.message.answer("❌ Проект не найден.")
+        await state.clear()
+        return
+    
+    await state.update_data(edit_field=field)
+    
+    field_names = {
+        "title": "название",
+        "description": "описание",
+        "photo": "фото",
+        "app_url": "ссылку на приложение",
+        "channel_url": "ссылку на канал",
+        "order": "порядок",
+        "active": "активность"
+    }
+    
+    if field == "active":
+        await callback.message.answer(f"✅ Активность проекта изменена на: {'Активен' if project.is_active else 'Неактивен'}")
+        await state.clear()
+    elif field == "photo":
+        await state.set_state(DemoProjectStates.waiting_edit_field)
+        await callback.message.answer("📷 Отправь новое фото (или /skip чтобы удалить):")
+    elif field == "order":
+        await state.set_state(DemoProjectStates.waiting_edit_field)
+        await callback.message.answer(f"🔢 Текущий порядок: {project.order_index}\nВведи новый порядок:")
+    else:
+        await state.set_state(DemoProjectStates.waiting_edit_field)
+        current_value = getattr(project, field, "")
+        await callback.message.answer(f"✏️ Текущее значение: {current_value or '(пусто)'}\nВведи новое {field_names.get(field, field)}:")
 
 
 @router.message(DemoProjectStates.waiting_edit_field)
@@ -360,53 +360,54 @@ async def process_edit_field(message: Message, state: FSMContext):
         await state.clear()
         return
     
-    db = get_db_session()
-    try:
-        project = db.query(DemoProject).filter(DemoProject.id == project_id).first()
-        
-        if not project:
-            await message.answer("❌ Проект не найден.")
-            await state.clear()
+    # Новое значение разбираем до сессии: при ошибке ввода соединение не занимается
+    if field == "photo":
+        if message.text and message.text.strip() == "/skip":
+            values = {'photo_file_id': None}
+        elif message.photo:
+            values = {'photo_file_id': message.photo[-1].file_id}
+        else:
+            await message.answer("❌ Отправь фото или /skip")
             return
-        
-        if field == "photo":
-            if message.text and message.text.strip() == "/skip":
-                project.photo_file_id = None
-            elif message.photo:
-                project.photo_file_id = message.photo[-1].file_id
-            else:
-                await message.answer("❌ Отправь фото или /skip")
-                return
-        elif field == "order":
-            try:
-                project.order_index = int(message.text.strip())
-            except ValueError:
-                await message.answer("❌ Введи число. Попробуй еще раз:")
-                return
-        elif field == "title":
-            project.title = message.text.strip()[:255]
-        elif field == "description":
-            project.description = message.text.strip()[:4096]
-        elif field == "app_url":
-            if message.text.strip() == "/skip":
-                project.app_url = None
-            else:
-                project.app_url = message.text.strip()[:500]
-        elif field == "channel_url":
-            if message.text.strip() == "/skip":
-                project.channel_url = None
-            else:
-                project.channel_url = message.text.strip()[:500]
-        
-        db.commit()
-        await message.answer(f"✅ Поле '{field}' успешно обновлено!")
-        logger.info(f"✅ Админ {message.from_user.id} обновил поле {field} проекта {project_id}")
+    elif field == "order":
+        try:
+            values = {'order_index': int(message.text.strip())}
+        except (ValueError, AttributeError):
+            await message.answer("❌ Введи число. Попробуй еще раз:")
+            return
+    elif not message.text:
+        await message.answer("❌ Отправь текст. Попробуй еще раз:")
+        return
+    elif field == "title":
+        values = {'title': message.text.strip()[:255]}
+    elif field == "description":
+        values = {'description': message.text.strip()[:4096]}
+    elif field in ("app_url", "channel_url"):
+        text = message.text.strip()
+        values = {field: None if text == "/skip" else text[:500]}
+    else:
+        values = {}
+    
+    project = None
+    try:
+        async with get_async_session() as db:
+            project = await db.scalar(select(DemoProject).where(DemoProject.id == project_id))
+            if project:
+                for key, value in values.items():
+                    setattr(project, key, value)
+                await db.commit()
     except Exception as e:
         logger.error(f"❌ Ошибка при обновлении проекта: {e}", exc_info=True)
         await message.answer("❌ Произошла ошибка при обновлении.")
-    finally:
-        db.close()
         await state.clear()
+        return
+    
+    await state.clear()
+    if not project:
+        await message.answer("❌ Проект не найден.")
+        return
+    await message.answer(f"✅ Поле '{field}' успешно обновлено!")
+    logger.info(f"✅ Админ {message.from_user.id} обновил поле {field} проекта {project_id}")
 
 
 @router.callback_query(F.data == "admin_demo_delete")
@@ -0,0 +1,76 @@
+"""
+Метрики нагрузки бота
+"""
+import logging
+from aiogram import Router
+from aiogram.types import Message
+from aiogram.filters import Command
+from middleware.load_shedding import load_monitor
+from utils.subscription_sweeper import subscription_sweeper
+from utils.validators import is_admin
+
+router = Router()
+logger = logging.getLogger(__name__)
+
+SHED_KIND_NAMES = {
+    'keyword_lookup': "поиск по ключевым словам",
+    'demo_navigation': "листание демо-проектов",
+}
+
+
+def format_load() -> str:
+    """Форматировать метрики нагрузки"""
+    metrics = load_monitor.snapshot()
+    status = "🔴 перегрузка" if metrics['overloaded'] else "🟢 норма"
+    text = (
+        f"📈 <b>Нагрузка</b>: {status}\n\n"
+        f"Задержка цикла событий: {metrics['lag_ms']:.1f} мс "
+        f"(порог {load_monitor.lag_threshold_ms} мс, максимум {metrics['max_lag_ms']:.1f} мс)\n"
+        f"В обработке: {metrics['in_flight']}"
+        f"{f' (порог {load_monitor.max_in_flight})' if load_monitor.max_in_flight else ''}\n"
+        f"Сброшено событий: {metrics['shed_total']}\n"
+    )
+    for kind, count in sorted(metrics['shed'].items()):
+        text += f"• {SHED_KIND_NAMES.get(kind, kind)}: {count}\n"
+    return text + "\n" + format_sweep()
+
+
+def format_sweep() -> str:
+    """Форматировать состояние перепроверки подписок"""
+    text = f"🔄 <b>Перепроверка подписок</b> (до {subscription_sweeper.bucket.rate:.1f} вызовов API/с)\n"
+    current = subscription_sweeper.current
+    if current is not None:
+        text += (
+            f"Идёт: проверено {current.checked}, изменилось {current.changed}, "
+            f"{current.rate:.1f} польз./с\n"
+        )
+    report = subscription_sweeper.last_report
+    if report is None:
+        return text + "Завершённых проходов ещё не было\n"
+    return text + (
+        f"Последний: {report.finished_at.strftime('%d.%m.%Y %H:%M')} UTC, "
+        f"{report.checked} польз. за {report.duration:.0f} с ({report.rate:.1f}/с)\n"
+        f"Подписались: {report.subscribed}, отписались: {report.unsubscribed}, "
+        f"ошибок: {report.errors}, вызовов API: {report.api_calls}\n"
+    )
+
+
+@router.message(Command("load"))
+async def cmd_load(message: Message):
+    """Показать метрики нагрузки"""
+    if not is_admin(message.from_user.id):
+        return
+
+    await message.answer(format_load(), parse_mode="HTML")
+
+
+@router.message(Command("sweep"))
+async def cmd_sweep(message: Message):
+    """Запустить перепроверку подписок вне расписания"""
+    if not is_admin(message.from_user.id):
+        return
+
+    if subscription_sweeper.trigger():
+        await message.answer("🔄 Перепроверка подписок запущена. Итоги — в /load")
+    else:
+        await message.answer("⏳ Перепроверка уже идёт или не запущена\n\n" + format_sweep(), parse_mode="HTML")
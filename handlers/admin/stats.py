@@ -3,14 +3,24 @@
 """
 import logging
 from datetime import datetime, timedelta
+from typing import Optional, Tuple
 from aiogram import Router, F
 from aiogram.types import CallbackQuery, Message
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
+from aiogram.filters import Command
 from aiogram.fsm.state import State, StatesGroup
-from database.db import get_db_session
+from sqlalchemy import select, tuple_
+from database.db import get_async_session, get_read_session
+from database.write_behind import user_write_queue, load_user
+from database.user_cache import UserState, user_state_cache
+from utils.membership import membership_cache
+from database.channel_members import channel_members
+from utils.roster import roster_service
+from database.stats import get_summary, get_total_users, rebuild_daily_stats, diff_states, write_deltas
 from database.models import User
 from utils.validators import is_admin
+from utils.pagination import encode_cursor, decode_cursor
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -18,6 +28,7 @@ logger = logging.getLogger(__name__)
 
 class UserSearchStates(StatesGroup):
     waiting_user_id = State()
+    waiting_date = State()
 
 
 def get_stats_keyboard():
@@ -25,6 +36,8 @@ def get_stats_keyboard():
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="🔍 Найти пользователя", callback_data="stats_search_user")],
         [InlineKeyboardButton(text="📋 Список пользователей", callback_data="stats_users_list")],
+        [InlineKeyboardButton(text="📦 Выгрузка и загрузка", callback_data="stats_users_io")],
+        [InlineKeyboardButton(text="🔁 Пересчитать статистику", callback_data="stats_rebuild")],
         [InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_back")]
     ])
 
@@ -47,44 +60,74 @@ async def show_stats(callback: CallbackQuery):
     
     await callback.answer()
     
-    db = get_db_session()
-    try:
-        # Общая статистика
-        total_users = db.query(User).count()
-        registered_users = db.query(User).filter(User.is_registered == True).count()
-        subscribed_users = db.query(User).filter(User.is_subscribed == True).count()
-        
-        # За последний месяц
-        month_ago = datetime.now() - timedelta(days=30)
-        users_this_month = db.query(User).filter(User.created_at >= month_ago).count()
-        
-        # За сегодня
-        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        users_today = db.query(User).filter(User.created_at >= today).count()
+    async with get_read_session() as db:
+        # Сводка по суточным счётчикам вместо COUNT(*) по таблице users
+        summary = await get_summary(db)
         
-        # За неделю
-        week_ago = datetime.now() - timedelta(days=7)
-        users_this_week = db.query(User).filter(User.created_at >= week_ago).count()
+        cache_stats = user_state_cache.stats()
+        membership_stats = membership_cache.stats()
+        members_stats = channel_members.stats()
         
         stats_text = (
             f"📊 <b>Статистика</b>\n\n"
             f"<b>Всего:</b>\n"
-            f"👥 Пользователей: {total_users}\n"
-            f"✅ Зарегистрировано: {registered_users}\n"
-            f"📢 Подписаны на каналы: {subscribed_users}\n\n"
+            f"👥 Пользователей: {summary['total_users']}\n"
+            f"✅ Зарегистрировано: {summary['registered_users']}\n"
+            f"📢 Подписаны на каналы: {summary['subscribed_users']}\n"
+            f"🎁 Получили PDF: {summary['pdf_users']}\n\n"
             f"<b>Динамика:</b>\n"
-            f"📅 Сегодня: +{users_today}\n"
-            f"📆 За неделю: +{users_this_week}\n"
-            f"🗓 За месяц: +{users_this_month}"
+            f"📅 Сегодня: +{summary['users_today']}\n"
+            f"📆 За неделю: +{summary['users_this_week']}\n"
+            f"🗓 За месяц: +{summary['users_this_month']}\n\n"
+            f"<b>Кэш пользователей:</b>\n"
+            f"⚡️ Попаданий: {cache_stats['hits']} ({cache_stats['hit_rate']:.0%}), "
+            f"промахов: {cache_stats['misses']}\n\n"
+            f"<b>Кэш подписок:</b>\n"
+            f"⚡️ Попаданий: {membership_stats['hits'] + membership_stats['coalesced']} "
+            f"({membership_stats['hit_rate']:.0%}), промахов: {membership_stats['misses']}\n"
+            f"📡 Из таблицы членства: {members_stats['local_hits']}, "
+            f"неизвестных (запрос к API): {members_stats['unknown']}, событий: {members_stats['events']}"
         )
+        if roster_service is not None:
+            stats_text += "\n\n<b>Состав каналов:</b>"
+            for chat_id, roster in roster_service.stats().items():
+                refreshed = datetime.fromtimestamp(roster['refreshed_at']).strftime('%d.%m %H:%M')
+                stats_text += f"\n👥 {chat_id}: {roster['members']} участников (обновлён {refreshed})"
         
         await callback.message.edit_text(
             stats_text,
             reply_markup=get_stats_keyboard(),
             parse_mode="HTML"
         )
-    finally:
-        db.close()
+
+
+@router.callback_query(F.data == "stats_rebuild")
+async def rebuild_stats_callback(callback: CallbackQuery):
+    """Пересчитать суточную статистику (кнопка)"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет прав", show_alert=True)
+        return
+    
+    await rebuild_daily_stats()
+    logger.info(f"🔁 Статистика пересчитана админом {callback.from_user.id}")
+    # show_stats сам отвечает на callback
+    await show_stats(callback)
+
+
+@router.message(Command("rebuild_stats"))
+async def rebuild_stats_command(message: Message):
+    """Пересчитать суточную статистику (команда /rebuild_stats)"""
+    if not is_admin(message.from_user.id):
+        return
+    
+    rows = await rebuild_daily_stats()
+    logger.info(f"🔁 Статистика пересчитана админом {message.from_user.id}")
+    await message.answer(
+        f"✅ Статистика пересчитана\n\nСтрок в daily_stats: {rows}",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="⬅️ К статистике", callback_data="admin_stats")]
+        ])
+    )
 
 
 @router.callback_query(F.data == "stats_search_user")
@@ -119,9 +162,8 @@ async def process_user_search(message: Message, state: FSMContext):
     
     await state.clear()
     
-    db = get_db_session()
-    try:
-        user = db.query(User).filter(User.telegram_id == user_id).first()
+    async with get_read_session() as db:
+        user = await load_user(db, user_id)
         
         if not user:
             await message.answer(
@@ -137,44 +179,127 @@ async def process_user_search(message: Message, state: FSMContext):
             reply_markup=get_user_keyboard(user.telegram_id),
             parse_mode="HTML"
         )
-    finally:
-        db.close()
 
 
-def get_users_list_keyboard(page: int, total_pages: int):
-    """Клавиатура для списка пользователей с пагинацией"""
+USERS_PER_PAGE = 20
+
+
+def get_users_list_keyboard(first_cursor: Optional[str], last_cursor: Optional[str]):
+    """
+    Клавиатура для списка пользователей с keyset-пагинацией
+    
+    Args:
+        first_cursor: Курсор первой строки страницы, если есть более новые пользователи
+        last_cursor: Курсор последней строки страницы, если есть более старые пользователи
+    """
     buttons = []
     
     # Кнопки навигации
     nav_buttons = []
-    if page > 0:
-        nav_buttons.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"users_page_{page - 1}"))
-    if page < total_pages - 1:
-        nav_buttons.append(InlineKeyboardButton(text="Вперёд ▶️", callback_data=f"users_page_{page + 1}"))
+    if first_cursor:
+        nav_buttons.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"users_newer_{first_cursor}"))
+    if last_cursor:
+        nav_buttons.append(InlineKeyboardButton(text="Вперёд ▶️", callback_data=f"users_older_{last_cursor}"))
     
     if nav_buttons:
         buttons.append(nav_buttons)
     
+    buttons.append([InlineKeyboardButton(text="📅 Перейти к дате", callback_data="stats_users_jump")])
     buttons.append([InlineKeyboardButton(text="🔍 Найти пользователя", callback_data="stats_search_user")])
     buttons.append([InlineKeyboardButton(text="⬅️ К статистике", callback_data="admin_stats")])
     
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
+async def build_users_page(cursor: Optional[Tuple[datetime, int]] = None, older: bool = True):
+    """
+    Собрать страницу списка пользователей
+    
+    Страница ищется по индексу (created_at DESC, id DESC) от курсора,
+    поэтому время не зависит от глубины, а новые регистрации не сдвигают строки.
+    
+    Args:
+        cursor: (created_at, id) строки, от которой листаем; None — первая страница
+        older: Листать к более старым (True) или к более новым (False) пользователям
+    
+    Returns:
+        (текст, клавиатура)
+    """
+    position = tuple_(User.created_at, User.id)
+    
+    async with get_read_session() as db:
+        total_users = await get_total_users(db)
+        
+        query = select(User).where(User.created_at.isnot(None))
+        if older:
+            if cursor:
+                query = query.where(position < tuple_(*cursor))
+            query = query.order_by(User.created_at.desc(), User.id.desc())
+        else:
+            query = query.where(position > tuple_(*cursor)).order_by(User.created_at.asc(), User.id.asc())
+        
+        # Берём на одну строку больше, чтобы узнать, есть ли следующая страница
+        users = list((await db.scalars(query.limit(USERS_PER_PAGE + 1))).all())
+        has_more = len(users) > USERS_PER_PAGE
+        users = users[:USERS_PER_PAGE]
+        if not older:
+            users.reverse()
+        
+        if not users:
+            if cursor is None:
+                return "📋 Пользователей пока нет", InlineKeyboardMarkup(inline_keyboard=[
+                    [InlineKeyboardButton(text="⬅️ К статистике", callback_data="admin_stats")]
+                ])
+            return "📋 Пользователей за этот период нет", get_users_list_keyboard(None, None)
+        
+        first, last = users[0], users[-1]
+        # Наличие строк с другой стороны страницы — одна проверка по индексу
+        if older:
+            has_newer = cursor is not None and await db.scalar(
+                select(User.id).where(position > tuple_(first.created_at, first.id)).limit(1)
+            ) is not None
+            has_older = has_more
+        else:
+            has_newer = has_more
+            has_older = True
+    
+    period = f"{last.created_at.strftime('%d.%m.%Y')} — {first.created_at.strftime('%d.%m.%Y')}"
+    text = f"📋 <b>Пользователи</b> ({period})\n"
+    text += f"<i>Всего: {total_users}</i>\n\n"
+    
+    for user in users:
+        status = "✅" if user.is_registered else "❌"
+        name = user.name or user.first_name or "Без имени"
+        date = user.created_at.strftime("%d.%m.%Y")
+        text += f"{status} <code>{user.telegram_id}</code> — {name} ({date})\n"
+    
+    text += "\n<i>Нажми на ID чтобы скопировать</i>"
+    
+    keyboard = get_users_list_keyboard(
+        encode_cursor(first.created_at, first.id) if has_newer else None,
+        encode_cursor(last.created_at, last.id) if has_older else None
+    )
+    return text, keyboard
+
+
 @router.callback_query(F.data == "stats_users_list")
 async def show_users_list(callback: CallbackQuery):
     """Показать список пользователей (первая страница)"""
-    await show_users_page(callback, 0)
+    await show_users_page(callback)
 
 
-@router.callback_query(F.data.startswith("users_page_"))
+@router.callback_query(F.data.startswith("users_older_") | F.data.startswith("users_newer_"))
 async def show_users_page_handler(callback: CallbackQuery):
-    """Показать конкретную страницу пользователей"""
-    page = int(callback.data.replace("users_page_", ""))
-    await show_users_page(callback, page)
+    """Показать соседнюю страницу пользователей"""
+    older = callback.data.startswith("users_older_")
+    cursor = decode_cursor(callback.data.split("_", 2)[2])
+    if cursor is None:
+        await callback.answer("❌ Ошибка навигации", show_alert=True)
+        return
+    await show_users_page(callback, cursor, older)
 
 
-async def show_users_page(callback: CallbackQuery, page: int):
+async def show_users_page(callback: CallbackQuery, cursor: Optional[Tuple[datetime, int]] = None, older: bool = True):
     """Показать страницу пользователей"""
     if not is_admin(callback.from_user.id):
         await callback.answer("❌ Нет прав", show_alert=True)
@@ -182,43 +307,46 @@ async def show_users_page(callback: CallbackQuery, page: int):
     
     await callback.answer()
     
-    per_page = 20
-    offset = page * per_page
+    text, keyboard = await build_users_page(cursor, older)
+    await callback.message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
+
+
+@router.callback_query(F.data == "stats_users_jump")
+async def start_users_jump(callback: CallbackQuery, state: FSMContext):
+    """Начать переход к дате в списке пользователей"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет прав", show_alert=True)
+        return
+    
+    await callback.answer()
+    await state.set_state(UserSearchStates.waiting_date)
+    
+    await callback.message.edit_text(
+        "📅 <b>Переход к дате</b>\n\n"
+        "Отправь дату в формате ДД.ММ.ГГГГ — покажу пользователей, "
+        "пришедших в этот день и раньше.\n\n"
+        "<i>Для отмены отправь /cancel</i>",
+        parse_mode="HTML"
+    )
+
+
+@router.message(UserSearchStates.waiting_date)
+async def process_users_jump(message: Message, state: FSMContext):
+    """Показать пользователей начиная с указанной даты"""
+    if not is_admin(message.from_user.id):
+        return
     
-    db = get_db_session()
     try:
-        total_users = db.query(User).count()
-        total_pages = (total_users + per_page - 1) // per_page  # Округление вверх
-        
-        if total_users == 0:
-            await callback.message.edit_text(
-                "📋 Пользователей пока нет",
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="⬅️ К статистике", callback_data="admin_stats")]
-                ])
-            )
-            return
-        
-        users = db.query(User).order_by(User.created_at.desc()).offset(offset).limit(per_page).all()
-        
-        text = f"📋 <b>Пользователи</b> (стр. {page + 1}/{total_pages})\n"
-        text += f"<i>Всего: {total_users}</i>\n\n"
-        
-        for user in users:
-            status = "✅" if user.is_registered else "❌"
-            name = user.name or user.first_name or "Без имени"
-            date = user.created_at.strftime("%d.%m.%Y") if user.created_at else "?"
-            text += f"{status} <code>{user.telegram_id}</code> — {name} ({date})\n"
-        
-        text += "\n<i>Нажми на ID чтобы скопировать</i>"
-        
-        await callback.message.edit_text(
-            text,
-            reply_markup=get_users_list_keyboard(page, total_pages),
-            parse_mode="HTML"
-        )
-    finally:
-        db.close()
+        day = datetime.strptime((message.text or "").strip(), "%d.%m.%Y")
+    except ValueError:
+        await message.answer("❌ Введи дату в формате ДД.ММ.ГГГГ")
+        return
+    
+    await state.clear()
+    
+    # Курсор сразу после конца дня: первой строкой станет последний пользователь этого дня
+    text, keyboard = await build_users_page((day + timedelta(days=1), 0), older=True)
+    await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
 
 
 @router.callback_query(F.data.startswith("user_reset_"))
@@ -230,14 +358,18 @@ async def reset_user(callback: CallbackQuery):
     
     user_id = int(callback.data.replace("user_reset_", ""))
     
-    db = get_db_session()
-    try:
-        user = db.query(User).filter(User.telegram_id == user_id).first()
+    # Сначала записываем отложенные изменения, чтобы они не перезаписали результат
+    await user_write_queue.flush()
+    
+    async with get_async_session() as db:
+        user = await db.scalar(select(User).where(User.telegram_id == user_id))
         
         if not user:
             await callback.answer("❌ Пользователь не найден", show_alert=True)
             return
         
+        before = UserState.from_user(user)
+        
         # Обнуляем данные
         user.is_registered = False
         user.is_subscribed = False
@@ -248,7 +380,9 @@ async def reset_user(callback: CallbackQuery):
         user.quiz_completed = False
         user.gift_received = False
         
-        db.commit()
+        await write_deltas(db, diff_states(before, UserState.from_user(user)))
+        await db.commit()
+        user_state_cache.invalidate(user_id)
         logger.info(f"🔄 Пользователь {user_id} обнулён админом {callback.from_user.id}")
         
         await callback.answer("✅ Пользователь обнулён!")
@@ -261,8 +395,6 @@ async def reset_user(callback: CallbackQuery):
             ]),
             parse_mode="HTML"
         )
-    finally:
-        db.close()
 
 
 @router.callback_query(F.data.startswith("user_delete_"))
@@ -274,17 +406,21 @@ async def delete_user(callback: CallbackQuery):
     
     user_id = int(callback.data.replace("user_delete_", ""))
     
-    db = get_db_session()
-    try:
-        user = db.query(User).filter(User.telegram_id == user_id).first()
+    # Сначала записываем отложенные изменения, чтобы они не перезаписали результат
+    await user_write_queue.flush()
+    
+    async with get_async_session() as db:
+        user = await db.scalar(select(User).where(User.telegram_id == user_id))
         
         if not user:
             await callback.answer("❌ Пользователь не найден", show_alert=True)
             return
         
         # Удаляем пользователя
-        db.delete(user)
-        db.commit()
+        await write_deltas(db, diff_states(UserState.from_user(user), None))
+        await db.delete(user)
+        await db.commit()
+        user_state_cache.invalidate(user_id)
         logger.info(f"🗑 Пользователь {user_id} удалён админом {callback.from_user.id}")
         
         await callback.answer("✅ Пользователь удалён!")
@@ -297,8 +433,6 @@ async def delete_user(callback: CallbackQuery):
             ]),
             parse_mode="HTML"
         )
-    finally:
-        db.close()
 
 
 def format_user_info(user: User) -> str:
@@ -0,0 +1,141 @@
+"""
+Выгрузка и загрузка пользователей файлом
+"""
+import os
+import logging
+import tempfile
+from datetime import datetime
+from aiogram import Router, F
+from aiogram.types import Message, CallbackQuery, FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from database.bulk import export_users, import_users, EXPORT_FORMATS
+from utils.validators import is_admin
+
+router = Router()
+logger = logging.getLogger(__name__)
+
+
+class UsersImportStates(StatesGroup):
+    """Состояния загрузки пользователей"""
+    waiting_file = State()
+
+
+def get_users_io_keyboard():
+    """Клавиатура выгрузки и загрузки"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text="📤 CSV", callback_data="users_export_csv"),
+            InlineKeyboardButton(text="📤 JSONL", callback_data="users_export_jsonl")
+        ],
+        [InlineKeyboardButton(text="📥 Загрузить файл", callback_data="users_import")],
+        [InlineKeyboardButton(text="⬅️ К статистике", callback_data="admin_stats")]
+    ])
+
+
+@router.callback_query(F.data == "stats_users_io")
+async def show_users_io(callback: CallbackQuery):
+    """Меню выгрузки и загрузки пользователей"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет прав", show_alert=True)
+        return
+
+    await callback.answer()
+    await callback.message.edit_text(
+        "📦 <b>Выгрузка и загрузка пользователей</b>\n\n"
+        "Выгрузка отправляется файлом CSV или JSONL.\n"
+        "Загрузка принимает файл в тех же форматах: записи обновляются по telegram_id, "
+        "новые добавляются.",
+        reply_markup=get_users_io_keyboard(),
+        parse_mode="HTML"
+    )
+
+
+@router.callback_query(F.data.startswith("users_export_"))
+async def export_users_file(callback: CallbackQuery):
+    """Выгрузить пользователей и отправить файлом"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет прав", show_alert=True)
+        return
+
+    fmt = callback.data.replace("users_export_", "")
+    if fmt not in EXPORT_FORMATS:
+        await callback.answer("❌ Неизвестный формат", show_alert=True)
+        return
+
+    await callback.answer("⏳ Готовлю выгрузку...")
+    logger.info(f"📤 Админ {callback.from_user.id} запросил выгрузку пользователей ({fmt})")
+
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        count = await export_users(path, fmt)
+        filename = f"users-{datetime.utcnow():%Y%m%d-%H%M%S}.{fmt}"
+        await callback.message.answer_document(
+            FSInputFile(path, filename=filename),
+            caption=f"📤 Пользователей: {count}"
+        )
+    except Exception as e:
+        logger.error(f"❌ Ошибка выгрузки пользователей: {e}", exc_info=True)
+        await callback.message.answer(f"❌ Не удалось выгрузить пользователей: {e}")
+    finally:
+        os.remove(path)
+
+
+@router.callback_query(F.data == "users_import")
+async def start_import(callback: CallbackQuery, state: FSMContext):
+    """Начать загрузку пользователей"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет прав", show_alert=True)
+        return
+
+    await callback.answer()
+    await state.set_state(UsersImportStates.waiting_file)
+    await callback.message.answer(
+        "📥 Отправь файл .csv или .jsonl с пользователями.\n"
+        "Обязательная колонка: telegram_id.\n\n"
+        "Или отправь /cancel для отмены"
+    )
+
+
+@router.message(UsersImportStates.waiting_file, F.document)
+async def process_import(message: Message, state: FSMContext):
+    """Загрузить пользователей из присланного файла"""
+    if not is_admin(message.from_user.id):
+        await state.clear()
+        return
+
+    name = message.document.file_name or ""
+    fmt = name.rsplit(".", 1)[-1].lower() if "." in name else ""
+    if fmt not in EXPORT_FORMATS:
+        await message.answer("❌ Нужен файл с расширением .csv или .jsonl")
+        return
+
+    await state.clear()
+    status = await message.answer("⏳ Загружаю пользователей...")
+    logger.info(f"📥 Админ {message.from_user.id} загружает пользователей из {name}")
+
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        await message.bot.download(message.document, destination=path)
+        imported, skipped = await import_users(path, fmt)
+    except Exception as e:
+        logger.error(f"❌ Ошибка загрузки пользователей: {e}", exc_info=True)
+        await status.edit_text(f"❌ Не удалось загрузить пользователей: {e}")
+        return
+    finally:
+        os.remove(path)
+
+    await status.edit_text(
+        f"✅ Загрузка завершена\n\n"
+        f"Загружено: {imported}\n"
+        f"Пропущено записей: {skipped}",
+        reply_markup=get_users_io_keyboard()
+    )
+
+
+@router.message(UsersImportStates.waiting_file)
+async def import_wrong_input(message: Message):
+    """Ожидается файл"""
+    await message.answer("❌ Отправь файл .csv или .jsonl или /cancel для отмены")
@@ -0,0 +1,39 @@
+"""
+Обработчик событий вступления и выхода из обязательных каналов
+"""
+import logging
+from aiogram import Router
+from aiogram.types import ChatMemberUpdated
+from database.channel_members import channel_members
+from database.user_cache import get_user_state, update_user
+from utils.channel_helper import SUBSCRIBED_STATUSES, get_tracked_channel
+from utils.membership import membership_cache
+from utils.roster import roster_service
+
+router = Router()
+logger = logging.getLogger(__name__)
+
+
+@router.chat_member()
+async def channel_member_updated(event: ChatMemberUpdated):
+    """Обновить таблицу членства по событию из канала"""
+    channel = get_tracked_channel(event.chat.id)
+    if channel is None:
+        return
+
+    user_id = event.new_chat_member.user.id
+    status = str(getattr(event.new_chat_member.status, 'value', event.new_chat_member.status))
+    is_member = status in SUBSCRIBED_STATUSES
+    channel_members.record(channel.chat_id, user_id, status, is_member)
+    channel_members.events += 1
+    if roster_service is not None:
+        roster_service.apply(channel.chat_id, user_id, is_member)
+    # Следующая проверка подписки возьмёт ответ из таблицы
+    membership_cache.invalidate(user_id, channel.chat_id)
+    logger.info(f"📡 Канал {channel.label}: пользователь {user_id} → {status}")
+
+    if not is_member:
+        # Отписка сразу отражается в статистике; подписку пользователь подтверждает кнопкой
+        user = await get_user_state(user_id)
+        if user is not None and user.is_subscribed:
+            await update_user(user_id, is_subscribed=False)
@@ -4,8 +4,10 @@
 import logging
 from aiogram import Router, F
 from aiogram.types import Message
-from database.db import get_db_session
-from database.models import Content, User
+from sqlalchemy import select
+from database.db import get_read_session
+from database.user_cache import get_user_state
+from database.models import Content
 from utils.messages import send_content
 from utils.validators import is_admin, validate_message_size
 from utils.rate_limit import check_content_keyword_rate_limit
@@ -30,7 +32,7 @@ async def handle_keyword(message: Message):
     
     # Проверка rate limit для поиска по ключевым словам
     if not is_admin(user_id):
-        allowed, error_msg = check_content_keyword_rate_limit(user_id)
+        allowed, error_msg = await check_content_keyword_rate_limit(user_id)
         if not allowed:
             logger.warning(f"🚫 Пользователь {user_id} превысил лимит поиска по ключевым словам")
             try:
@@ -46,20 +48,19 @@ async def handle_keyword(message: Message):
     
     keyword = message.text.strip().lower()
     
-    db = get_db_session()
-    try:
-        # Проверяем, зарегистрирован ли пользователь (админы могут без регистрации)
-        user = db.query(User).filter(User.telegram_id == message.from_user.id).first()
-        if not is_admin(message.from_user.id):
-            if not user or not user.is_registered:
-                logger.info(f"   Пользователь не зарегистрирован, пропускаем")
-                return  # Игнорируем незарегистрированных пользователей
-        
+    # Проверяем, зарегистрирован ли пользователь (админы могут без регистрации)
+    if not is_admin(message.from_user.id):
+        user = await get_user_state(message.from_user.id)
+        if not user or not user.is_registered:
+            logger.info(f"   Пользователь не зарегистрирован, пропускаем")
+            return  # Игнорируем незарегистрированных пользователей
+    
+    async with get_read_session() as db:
         # Ищем контент по ключевому слову
-        content = db.query(Content).filter(
+        content = await db.scalar(select(Content).where(
             Content.keyword == keyword,
             Content.is_active == True
-        ).first()
+        ))
         
         if not content:
             logger.info(f"   Контент не найден для '{keyword}'")
@@ -69,6 +70,4 @@ async def handle_keyword(message: Message):
         # Отправляем контент
         await send_content(message, content)
             
-    finally:
-        db.close()
 
@@ -4,10 +4,10 @@
 from typing import Union
 from aiogram import Router, F
 from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, Message
-from sqlalchemy.orm import Session
+from sqlalchemy import select
 from database.models import DemoProject
-from database.db import get_db_session
-from config import settings
+from database.db import get_read_session
+from utils.channel_helper import REQUIRED_CHANNELS
 
 router = Router()
 
@@ -42,8 +42,8 @@ def create_demo_keyboard(project: DemoProject, current_index: int, total_count:
     
     # Кнопка "На канал" - третья строка
     channel_url = project.channel_url
-    if not channel_url and settings.CHANNEL1_USERNAME:
-        channel_url = f"https://t.me/{settings.CHANNEL1_USERNAME.replace('@', '')}"
+    if not channel_url and REQUIRED_CHANNELS:
+        channel_url = REQUIRED_CHANNELS[0].url
     
     if channel_url:
         buttons.append([InlineKeyboardButton(text="📢 На канал", url=channel_url)])
@@ -62,12 +62,11 @@ async def show_demo_project(callback_or_message: Union[CallbackQuery, Message],
         callback_or_message: CallbackQuery или Message
         project_index: Индекс проекта для отображения
     """
-    db = get_db_session()
-    try:
+    async with get_read_session() as db:
         # Получаем все активные проекты, отсортированные по order_index
-        projects = db.query(DemoProject).filter(
+        projects = (await db.scalars(select(DemoProject).where(
             DemoProject.is_active == True
-        ).order_by(DemoProject.order_index.asc()).all()
+        ).order_by(DemoProject.order_index.asc()))).all()
         
         if not projects:
             text = "📦 Каталог демо проектов пуст.\n\nСкоро здесь появятся интересные проекты!"
@@ -133,8 +132,6 @@ async def show_demo_project(callback_or_message: Union[CallbackQuery, Message],
                     reply_markup=keyboard,
                     parse_mode="HTML"
                 )
-    finally:
-        db.close()
 
 
 @router.callback_query(F.data == "demo_projects")
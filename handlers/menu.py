@@ -1,24 +1,24 @@
 """
 Обработчик главного меню
 """
+from typing import Optional
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
-from sqlalchemy.orm import Session
-from database.models import User
-from database.db import get_db_session
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.user_cache import UserState, get_user_state
 from config import MENU_PHOTO_FILE_ID
 
 router = Router()
 
 
-async def show_main_menu(message: Message, db: Session, user: User, edit: bool = False):
+async def show_main_menu(message: Message, db: Optional[AsyncSession], user: UserState, edit: bool = False):
     """
     Показать главное меню
     
     Args:
         message: Сообщение для редактирования/ответа
-        db: Сессия БД
-        user: Пользователь
+        db: Сессия БД (может быть None, если пользователь уже загружен)
+        user: Состояние пользователя
         edit: Редактировать существующее сообщение вместо создания нового
     """
     # Формируем кнопки
@@ -81,10 +81,6 @@ async def back_to_menu(callback: CallbackQuery):
     """Вернуться в главное меню"""
     await callback.answer()
     
-    db = get_db_session()
-    try:
-        user = db.query(User).filter(User.telegram_id == callback.from_user.id).first()
-        if user:
-            await show_main_menu(callback.message, db, user, edit=True)
-    finally:
-        db.close()
+    user = await get_user_state(callback.from_user.id)
+    if user:
+        await show_main_menu(callback.message, None, user, edit=True)
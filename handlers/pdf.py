@@ -4,8 +4,7 @@
 import logging
 from aiogram import Router, F
 from aiogram.types import CallbackQuery
-from database.db import get_db_session
-from database.models import User
+from database.user_cache import get_user_state, update_user
 from handlers.menu import show_main_menu
 
 router = Router()
@@ -22,11 +21,9 @@ async def send_pdf(callback: CallbackQuery):
     await callback.answer()
     
     user_id = callback.from_user.id
-    db = get_db_session()
+    user = await get_user_state(user_id)
     
     try:
-        user = db.query(User).filter(User.telegram_id == user_id).first()
-        
         if not user:
             await callback.message.answer("❌ Пользователь не найден. Используй /start")
             return
@@ -62,17 +59,14 @@ async def send_pdf(callback: CallbackQuery):
         )
         
         # Отмечаем, что пользователь получил PDF
-        user.has_pdf = True
-        db.commit()
+        user = await update_user(user_id, has_pdf=True)
         
         logger.info(f"✅ Пользователь {user_id} получил PDF файл")
         
         # Обновляем меню (кнопка PDF исчезнет)
-        await show_main_menu(callback.message, db, user, edit=False)
+        await show_main_menu(callback.message, None, user, edit=False)
         
     except Exception as e:
         logger.error(f"❌ Ошибка при отправке PDF пользователю {user_id}: {e}", exc_info=True)
         await callback.message.answer("❌ Произошла ошибка при отправке PDF. Попробуйте позже.")
-    finally:
-        db.close()
 
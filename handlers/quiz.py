@@ -4,8 +4,7 @@
 import logging
 from aiogram import Router, F
 from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
-from database.db import get_db_session
-from database.models import User
+from database.user_cache import get_user_state, update_user
 from handlers.menu import show_main_menu
 
 router = Router()
@@ -21,11 +20,9 @@ async def send_pdf_bonus(callback: CallbackQuery):
     await callback.answer()
     
     user_id = callback.from_user.id
-    db = get_db_session()
+    user = await get_user_state(user_id)
     
     try:
-        user = db.query(User).filter(User.telegram_id == user_id).first()
-        
         if not user:
             await callback.message.answer("❌ Пользователь не найден. Используй /start")
             return
@@ -35,7 +32,7 @@ async def send_pdf_bonus(callback: CallbackQuery):
             logger.info(f"⚠️ Пользователь {user_id} уже получил PDF")
             await callback.message.answer("✅ Вы уже получили PDF файл ранее.")
             # Показываем меню
-            await show_main_menu(callback.message, db, user, edit=False)
+            await show_main_menu(callback.message, None, user, edit=False)
             return
         
         # Проверяем наличие file_id
@@ -73,20 +70,17 @@ async def send_pdf_bonus(callback: CallbackQuery):
         )
         
         # Отмечаем, что пользователь получил PDF
-        user.has_pdf = True
-        db.commit()
+        user = await update_user(user_id, has_pdf=True)
         
         logger.info(f"✅ Пользователь {user_id} получил PDF файл через викторину")
         
         # Показываем меню после отправки PDF
         temp_message = await callback.message.bot.send_message(chat_id=chat_id, text="⏳")
-        await show_main_menu(temp_message, db, user, edit=True)
+        await show_main_menu(temp_message, None, user, edit=True)
         
     except Exception as e:
         logger.error(f"❌ Ошибка при отправке PDF пользователю {user_id}: {e}", exc_info=True)
         await callback.message.answer("❌ Произошла ошибка при отправке PDF. Попробуйте позже.")
-    finally:
-        db.close()
 
 
 
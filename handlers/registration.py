@@ -3,11 +3,10 @@
 """
 import logging
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, User as TgUser
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from database.db import get_db_session
-from database.models import User
+from database.user_cache import UserState, get_user_state, update_user
 from utils.validators import sanitize_input, check_channel_subscription, validate_message_size
 from utils.rate_limit import check_registration_rate_limit
 from utils.keyboards import create_source_keyboard
@@ -41,13 +40,50 @@ async def send_question(message: Message, state: FSMContext, video_note_key: str
         await message.answer(text, reply_markup=keyboard)
 
 
+async def save_registration(tg_user: TgUser, data: dict) -> UserState:
+    """
+    Сохранить анкету пользователя
+    
+    Запись идёт через очередь отложенной записи, поэтому обработчик не ждёт
+    commit. Возвращённое состояние уже содержит новые значения полей.
+    
+    Args:
+        tg_user: Пользователь Telegram
+        data: Данные опросника из FSM
+    
+    Returns:
+        Состояние пользователя с заполненной анкетой
+    """
+    user = await get_user_state(tg_user.id)
+    
+    fields = {
+        'name': data.get('name'),
+        'position': data.get('position'),
+        'expectations': data.get('expectations'),
+        'source': data.get('source'),
+        'is_registered': True,
+    }
+    
+    if not user:
+        logger.info(f"👤 Создание нового пользователя {tg_user.id}")
+        fields.update(
+            username=tg_user.username,
+            first_name=tg_user.first_name,
+            last_name=tg_user.last_name
+        )
+    
+    user = await update_user(tg_user.id, **fields)
+    logger.info(f"💾 Данные пользователя {tg_user.id} поставлены в очередь записи")
+    return user
+
+
 @router.message(RegistrationStates.waiting_name)
 async def process_name(message: Message, state: FSMContext):
     """Обработка имени"""
     user_id = message.from_user.id
     
     # Проверка rate limit
-    allowed, error_msg = check_registration_rate_limit(user_id)
+    allowed, error_msg = await check_registration_rate_limit(user_id)
     if not allowed:
         logger.warning(f"🚫 Пользователь {user_id} превысил лимит регистрации")
         await message.answer(error_msg)
@@ -168,30 +204,8 @@ async def process_source_video(message: Message, state: FSMContext):
         user_id = message.from_user.id
         logger.info(f"✅ Пользователь {user_id} завершил опросник")
         
-        db = get_db_session()
-        
         try:
-            # Сохраняем данные пользователя
-            user = db.query(User).filter(User.telegram_id == user_id).first()
-            
-            if not user:
-                logger.info(f"👤 Создание нового пользователя {user_id}")
-                user = User(
-                    telegram_id=user_id,
-                    username=message.from_user.username,
-                    first_name=message.from_user.first_name,
-                    last_name=message.from_user.last_name
-                )
-                db.add(user)
-            
-            user.name = data.get('name')
-            user.position = data.get('position')
-            user.expectations = data.get('expectations')
-            user.source = data.get('source')
-            user.is_registered = True
-            
-            db.commit()
-            logger.info(f"💾 Данные пользователя {user_id} сохранены")
+            await save_registration(message.from_user, data)
             
             # Отправляем финальный кружочек (если видео-формат)
             data_format = data.get("survey_format", "text")
@@ -202,18 +216,14 @@ async def process_source_video(message: Message, state: FSMContext):
             # Проверяем подписку после опроса
             bot = message.bot
             is_subscribed = await check_channel_subscription(bot, user_id)
+            user = await update_user(user_id, is_subscribed=is_subscribed)
             
             if is_subscribed:
-                user.is_subscribed = True
-                db.commit()
-                await show_main_menu(message, db, user, edit=False)
+                await show_main_menu(message, None, user, edit=False)
             else:
-                user.is_subscribed = False
-                db.commit()
                 await show_subscription_request(message, bot, edit=False)
                 
         finally:
-            db.close()
             await state.clear()
 
 
@@ -238,30 +248,8 @@ async def process_source(callback: CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
     logger.info(f"✅ Пользователь {user_id} завершил опросник")
     
-    db = get_db_session()
-    
     try:
-        # Сохраняем данные пользователя
-        user = db.query(User).filter(User.telegram_id == user_id).first()
-        
-        if not user:
-            logger.info(f"👤 Создание нового пользователя {user_id}")
-            user = User(
-                telegram_id=user_id,
-                username=callback.from_user.username,
-                first_name=callback.from_user.first_name,
-                last_name=callback.from_user.last_name
-            )
-            db.add(user)
-        
-        user.name = data.get('name')
-        user.position = data.get('position')
-        user.expectations = data.get('expectations')
-        user.source = data.get('source')
-        user.is_registered = True
-        
-        db.commit()
-        logger.info(f"💾 Данные пользователя {user_id} сохранены")
+        await save_registration(callback.from_user, data)
         
         # Отправляем финальный кружочек (если видео-формат)
         finish_note = get_video_note("finish")
@@ -271,17 +259,12 @@ async def process_source(callback: CallbackQuery, state: FSMContext):
         # Проверяем подписку после опроса
         bot = callback.bot
         is_subscribed = await check_channel_subscription(bot, user_id)
+        user = await update_user(user_id, is_subscribed=is_subscribed)
         
         if is_subscribed:
-            user.is_subscribed = True
-            db.commit()
-            await show_main_menu(callback.message, db, user, edit=False)
+            await show_main_menu(callback.message, None, user, edit=False)
         else:
-            user.is_subscribed = False
-            db.commit()
             await show_subscription_request(callback.message, bot, edit=False)
             
     finally:
-        db.close()
         await state.clear()
-
@@ -7,8 +7,7 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.filters import Command
-from database.db import get_db_session
-from database.models import User
+from database.user_cache import get_user_state
 from handlers.menu import show_main_menu
 from handlers.registration import RegistrationStates
 from config import ADMIN_IDS
@@ -74,24 +73,20 @@ async def cmd_start(message: Message, state: FSMContext):
     username = message.from_user.username or message.from_user.first_name
     logger.info(f"📨 /start от пользователя {username} (ID: {user_id})")
     
-    db = get_db_session()
-    try:
-        user = db.query(User).filter(User.telegram_id == user_id).first()
-        
-        if user and user.is_registered:
-            logger.info(f"✅ Пользователь {user_id} уже зарегистрирован, показываем меню")
-            await state.clear()
-            await show_main_menu(message, db, user, edit=False)
-            return
-        
-        logger.info(f"🆕 Новый пользователь {user_id}, показываем выбор формата")
-        # Показываем выбор формата опроса
-        await message.answer(
-            "👋 Привет! Пройди короткий опрос.\n\nВыбери удобный формат:",
-            reply_markup=get_format_keyboard()
-        )
-    finally:
-        db.close()
+    user = await get_user_state(user_id)
+    
+    if user and user.is_registered:
+        logger.info(f"✅ Пользователь {user_id} уже зарегистрирован, показываем меню")
+        await state.clear()
+        await show_main_menu(message, None, user, edit=False)
+        return
+    
+    logger.info(f"🆕 Новый пользователь {user_id}, показываем выбор формата")
+    # Показываем выбор формата опроса
+    await message.answer(
+        "👋 Привет! Пройди короткий опрос.\n\nВыбери удобный формат:",
+        reply_markup=get_format_keyboard()
+    )
 
 
 @router.callback_query(F.data == "format_video")
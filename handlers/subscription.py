@@ -4,9 +4,11 @@
 import logging
 from aiogram import Router, F
 from aiogram.types import CallbackQuery
-from database.db import get_db_session
-from database.models import User
+from database.user_cache import get_user_state, update_user
 from utils.validators import check_channel_subscription
+from utils.idempotency import subscription_checks
+from utils.membership import membership_cache
+from utils.channel_helper import REQUIRED_CHANNELS
 from utils.subscription import show_subscription_request
 from handlers.menu import show_main_menu
 
@@ -17,45 +19,51 @@ logger = logging.getLogger(__name__)
 @router.callback_query(F.data == "check_subscription")
 async def check_subscription_handler(callback: CallbackQuery):
     """Проверка подписки"""
-    from utils.idempotency import is_duplicate_request, mark_request_processed
-    
     user_id = callback.from_user.id
     logger.info(f"🔍 Проверка подписки пользователя {user_id}")
     
-    # Защита от повторных запросов
-    if is_duplicate_request(user_id, "check_subscription"):
-        logger.warning(f"🚫 Дубликат запроса проверки подписки от пользователя {user_id}")
-        await callback.answer("⏳ Запрос уже обрабатывается. Подождите немного.", show_alert=True)
+    user = await get_user_state(user_id)
+    
+    if not user:
+        logger.warning(f"⚠️ Пользователь {user_id} не найден в БД")
+        await callback.answer("❌ Пользователь не найден. Используй /start", show_alert=True)
         return
     
-    mark_request_processed(user_id, "check_subscription")
+    bot = callback.bot
+    # Нажатие «Проверить» обычно следует за подпиской — старые ответы «не подписан» не годятся
+    for channel in REQUIRED_CHANNELS:
+        membership_cache.invalidate(user_id, channel.chat_id, negative_only=True)
+    
+    # Повторные нажатия во время проверки ждут её результат, а не запрашивают каналы снова
+    key = ("check_subscription", user_id)
+    is_subscribed, shared = await subscription_checks.do(
+        key,
+        lambda: check_channel_subscription(bot, user_id)
+    )
+    if not is_subscribed and not shared:
+        # Отрицательный ответ не храним: следующее нажатие — после подписки — проверит заново
+        subscription_checks.forget(key)
     
-    db = get_db_session()
-    try:
-        user = db.query(User).filter(User.telegram_id == user_id).first()
-        
-        if not user:
-            logger.warning(f"⚠️ Пользователь {user_id} не найден в БД")
-            await callback.answer("❌ Пользователь не найден. Используй /start", show_alert=True)
-            return
-        
-        bot = callback.bot
-        is_subscribed = await check_channel_subscription(bot, user_id)
-        
+    if shared:
+        # Экран уже обновляет обработчик первого нажатия
+        logger.info(f"🔁 Повторное нажатие проверки подписки от {user_id}, результат: {is_subscribed}")
         if is_subscribed:
-            logger.info(f"✅ Пользователь {user_id} подписан на оба канала")
-            user.is_subscribed = True
-            db.commit()
-            # Показываем уведомление через callback.answer
-            await callback.answer("✅ Отлично! Ты подписан на оба канала!")
-            # Редактируем сообщение и показываем меню
-            await show_main_menu(callback.message, db, user, edit=True)
+            await callback.answer("✅ Отлично! Ты подписан на все обязательные каналы!")
         else:
-            logger.info(f"⚠️ Пользователь {user_id} не подписан на каналы")
-            # Показываем уведомление через callback.answer (всплывающее уведомление)
-            await callback.answer("❌ Ты еще не подписан на один или оба канала", show_alert=False)
-            # Редактируем существующее сообщение с кнопками (не создаем новое)
-            await show_subscription_request(callback.message, bot, edit=True)
-    finally:
-        db.close()
+            await callback.answer("❌ Ты еще подписан не на все обязательные каналы", show_alert=False)
+        return
+    
+    if is_subscribed:
+        logger.info(f"✅ Пользователь {user_id} подписан на все обязательные каналы")
+        user = await update_user(user_id, is_subscribed=True)
+        # Показываем уведомление через callback.answer
+        await callback.answer("✅ Отлично! Ты подписан на все обязательные каналы!")
+        # Редактируем сообщение и показываем меню
+        await show_main_menu(callback.message, None, user, edit=True)
+    else:
+        logger.info(f"⚠️ Пользователь {user_id} не подписан на каналы")
+        # Показываем уведомление через callback.answer (всплывающее уведомление)
+        await callback.answer("❌ Ты еще подписан не на все обязательные каналы", show_alert=False)
+        # Редактируем существующее сообщение с кнопками (не создаем новое)
+        await show_subscription_request(callback.message, bot, edit=True)
 
@@ -2,8 +2,9 @@
 Middleware для бота
 """
 from .rate_limit_middleware import RateLimitMiddleware
+from .load_shedding import LoadSheddingMiddleware, load_monitor
 
-__all__ = ['RateLimitMiddleware']
+__all__ = ['RateLimitMiddleware', 'LoadSheddingMiddleware', 'load_monitor']
 
 
 
@@ -0,0 +1,152 @@
+"""
+Middleware сброса нагрузки
+
+Во время всплесков бот отвечает «занят» на второстепенные события
+(поиск по ключевым словам, листание демо-проектов), когда задержка
+цикла событий или число обрабатываемых апдейтов превышают пороги.
+Регистрация, команды и админка не сбрасываются никогда.
+"""
+import time
+import asyncio
+import logging
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Optional
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Message, CallbackQuery
+from config import settings
+from utils.validators import is_admin
+
+logger = logging.getLogger(__name__)
+
+BUSY_TEXT = "⏳ Бот сейчас перегружен, попробуйте через минуту"
+
+# Префиксы callback_data, которые можно сбросить под нагрузкой
+SHEDDABLE_CALLBACK_PREFIXES = ('demo_next_', 'demo_prev_')
+
+
+class LoadMonitor:
+    """Замер задержки цикла событий и учёт обрабатываемых апдейтов"""
+
+    def __init__(self, lag_threshold_ms: float, max_in_flight: int, interval_ms: float = 100, alpha: float = 0.3):
+        """
+        Args:
+            lag_threshold_ms: Порог сглаженной задержки цикла событий в мс
+            max_in_flight: Порог числа одновременно обрабатываемых апдейтов (0 — без порога)
+            interval_ms: Интервал замера задержки в мс
+            alpha: Коэффициент сглаживания задержки
+        """
+        self.lag_threshold_ms = lag_threshold_ms
+        self.max_in_flight = max_in_flight
+        self.interval = interval_ms / 1000
+        self.alpha = alpha
+        self.lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self.in_flight = 0
+        self.shed = Counter()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def overloaded(self) -> bool:
+        """Превышен ли хотя бы один порог"""
+        if self.lag_ms > self.lag_threshold_ms:
+            return True
+        return 0 < self.max_in_flight < self.in_flight
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Текущие метрики"""
+        return {
+            'lag_ms': round(self.lag_ms, 2),
+            'max_lag_ms': round(self.max_lag_ms, 2),
+            'in_flight': self.in_flight,
+            'overloaded': self.overloaded,
+            'shed_total': sum(self.shed.values()),
+            'shed': dict(self.shed),
+        }
+
+    def start(self):
+        """Запустить замер задержки"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановить замер задержки"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        """Цикл замера: насколько позже заказанного просыпается sleep"""
+        was_overloaded = False
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max((time.perf_counter() - started - self.interval) * 1000, 0.0)
+            self.lag_ms += self.alpha * (lag - self.lag_ms)
+            self.max_lag_ms = max(self.max_lag_ms, lag)
+
+            overloaded = self.overloaded
+            if overloaded != was_overloaded:
+                if overloaded:
+                    logger.warning(
+                        f"⚠️ Перегрузка: задержка цикла {self.lag_ms:.0f} мс, в обработке {self.in_flight}"
+                    )
+                else:
+                    logger.info(f"✅ Нагрузка снизилась, сброшено событий: {sum(self.shed.values())}")
+                was_overloaded = overloaded
+
+
+def shed_kind(event: TelegramObject, data: Dict[str, Any]) -> Optional[str]:
+    """Вид второстепенного события или None, если событие сбрасывать нельзя"""
+    if isinstance(event, CallbackQuery):
+        if event.data and event.data.startswith(SHEDDABLE_CALLBACK_PREFIXES):
+            return 'demo_navigation'
+        return None
+    if isinstance(event, Message):
+        # Текст вне сценария (не команда, нет состояния FSM) уходит в поиск по ключевым словам
+        if event.text and not event.text.startswith('/') and data.get('raw_state') is None:
+            return 'keyword_lookup'
+    return None
+
+
+class LoadSheddingMiddleware(BaseMiddleware):
+    """Сбрасывает второстепенные события при перегрузке"""
+
+    def __init__(self, monitor: LoadMonitor):
+        self.monitor = monitor
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        """Обработка события с проверкой нагрузки"""
+        monitor = self.monitor
+        if monitor.overloaded:
+            user = getattr(event, 'from_user', None)
+            kind = shed_kind(event, data)
+            if kind and not (user and is_admin(user.id)):
+                monitor.shed[kind] += 1
+                try:
+                    # Для callback — всплывающая подсказка, для сообщения — короткий ответ
+                    await event.answer(BUSY_TEXT)
+                except Exception:
+                    pass
+                return
+
+        monitor.in_flight += 1
+        try:
+            return await handler(event, data)
+        finally:
+            monitor.in_flight -= 1
+
+
+# Глобальный монитор нагрузки
+load_monitor = LoadMonitor(
+    lag_threshold_ms=settings.LOAD_SHED_LAG_MS,
+    max_in_flight=settings.LOAD_SHED_MAX_IN_FLIGHT
+)
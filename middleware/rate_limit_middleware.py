@@ -5,19 +5,15 @@ import logging
 from typing import Callable, Dict, Any, Awaitable
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject, Message, CallbackQuery
-from utils.rate_limit import (
-    check_message_rate_limit,
-    check_callback_rate_limit,
-    check_admin_rate_limit
-)
+from utils.rate_limit_policy import rate_limit_policy
 from utils.validators import is_admin
 
 logger = logging.getLogger(__name__)
 
 
 class RateLimitMiddleware(BaseMiddleware):
-    """Middleware для rate limiting"""
-    
+    """Middleware для rate limiting по политике utils.rate_limit_policy"""
+
     async def __call__(
         self,
         handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
@@ -25,61 +21,42 @@ class RateLimitMiddleware(BaseMiddleware):
         data: Dict[str, Any]
     ) -> Any:
         """Обработка события с проверкой rate limit"""
-        
-        # Для сообщений
+
+        user = getattr(event, 'from_user', None)
         if isinstance(event, Message):
-            user_id = event.from_user.id if event.from_user else None
-            
-            if user_id:
-                # Админы имеют более мягкие ограничения
-                if is_admin(user_id):
-                    # Для админов проверяем только очень агрессивный спам
-                    allowed, message = check_message_rate_limit(user_id)
-                    if not allowed:
-                        logger.warning(f"🚫 Админ {user_id} превысил лимит сообщений")
-                        try:
-                            await event.answer("⛔ Слишком много запросов. Подождите немного.")
-                        except:
-                            pass
-                        return
-                else:
-                    # Для обычных пользователей строгие ограничения
-                    allowed, message = check_message_rate_limit(user_id)
-                    if not allowed:
-                        logger.warning(f"🚫 Пользователь {user_id} превысил лимит сообщений: {message}")
-                        try:
-                            await event.answer(message)
-                        except:
-                            pass
-                        return
-        
-        # Для callback queries
+            event_type, route = 'message', event.text or ''
         elif isinstance(event, CallbackQuery):
-            user_id = event.from_user.id if event.from_user else None
-            
-            if user_id:
-                # Админы имеют более мягкие ограничения
-                if is_admin(user_id):
-                    allowed, message = check_callback_rate_limit(user_id)
-                    if not allowed:
-                        logger.warning(f"🚫 Админ {user_id} превысил лимит callback'ов")
-                        try:
-                            await event.answer("⛔ Слишком много запросов. Подождите немного.", show_alert=True)
-                        except:
-                            pass
-                        return
-                else:
-                    allowed, message = check_callback_rate_limit(user_id)
-                    if not allowed:
-                        logger.warning(f"🚫 Пользователь {user_id} превысил лимит callback'ов: {message}")
-                        try:
-                            await event.answer(message, show_alert=True)
-                        except:
-                            pass
-                        return
-        
-        # Продолжаем обработку
-        return await handler(event, data)
+            event_type, route = 'callback_query', event.data or ''
+        else:
+            return await handler(event, data)
+
+        if user is None:
+            return await handler(event, data)
 
+        admin = is_admin(user.id)
+        resolved = rate_limit_policy.resolve(event_type, admin, route)
+        if resolved is None:
+            return await handler(event, data)
 
+        limiter, spec = resolved
+        allowed, message = await limiter.check_rate_limit(
+            user_id=user.id,
+            max_requests=spec.max_requests,
+            time_window=spec.window,
+            block_duration=spec.block_duration
+        )
+        if allowed:
+            return await handler(event, data)
 
+        who = "Админ" if admin else "Пользователь"
+        logger.warning(f"🚫 {who} {user.id} превысил лимит {spec.name}: {message}")
+        # Админам — мягкое сообщение без подробностей блокировки
+        if admin:
+            message = "⛔ Слишком много запросов. Подождите немного."
+        try:
+            if isinstance(event, CallbackQuery):
+                await event.answer(message, show_alert=True)
+            else:
+                await event.answer(message)
+        except Exception:
+            pass
@@ -0,0 +1,29 @@
+"""
+Отбрасывание повторно полученных апдейтов
+"""
+import logging
+from typing import Any
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import Update
+from database.updates import update_log
+
+logger = logging.getLogger(__name__)
+
+
+class DeduplicatingDispatcher(Dispatcher):
+    """
+    Диспетчер, пропускающий уже обработанные update_id
+
+    Проверка стоит в feed_update — до любых middleware (в том числе FSM
+    и rate limit), поэтому повтор не вызывает ни запросов к API, ни записей в БД.
+    """
+
+    async def feed_update(self, bot: Bot, update: Update, **kwargs: Any) -> Any:
+        if not update_log.claim(update.update_id):
+            logger.info(f"🔁 Апдейт {update.update_id} уже обработан, пропускаем")
+            return UNHANDLED
+        try:
+            return await super().feed_update(bot, update, **kwargs)
+        finally:
+            update_log.done(update.update_id)
@@ -0,0 +1,24 @@
+"""
+Общая настройка тестов
+
+Конфигурация бота читает .env из текущего каталога при импорте, поэтому
+до импорта модулей бота тесты переходят во временный каталог с
+минимальным .env (SQLite во временном файле).
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+_workdir = tempfile.mkdtemp(prefix="bot-tests-")
+with open(os.path.join(_workdir, ".env"), "w", encoding="utf-8") as env:
+    env.write(
+        "BOT_TOKEN=123456:TEST\n"
+        "ADMIN_IDS=1\n"
+        "REQUIRED_CHANNELS=-1001:@test\n"
+        f"DB_PATH={os.path.join(_workdir, 'bot.db')}\n"
+    )
+os.chdir(_workdir)
@@ -0,0 +1,144 @@
+"""
+Тесты общего хранилища rate limit (DatabaseRateLimitStorage)
+
+Upsert с RETURNING проверяется на SQLite в памяти: тот же запрос
+выполняется и в PostgreSQL. Время подменяется, чтобы окна и блокировки
+считались детерминированно.
+"""
+import asyncio
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import StaticPool
+from database.models import RateLimitBucket
+from database.rate_limits import DatabaseRateLimitStorage
+
+KEY = ("message", 42)
+
+
+class ClockStorage(DatabaseRateLimitStorage):
+    """Хранилище с управляемым временем"""
+
+    def __init__(self, engine, now: float):
+        super().__init__(engine)
+        self.now = now
+
+    def _now(self) -> float:
+        return self.now
+
+
+def run(coro_factory):
+    """Выполнить сценарий на свежей БД в памяти"""
+    async def scenario():
+        engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        async with engine.begin() as conn:
+            await conn.run_sync(RateLimitBucket.__table__.create)
+        try:
+            return await coro_factory(ClockStorage(engine, now=1000.0))
+        finally:
+            await engine.dispose()
+    return asyncio.run(scenario())
+
+
+def test_allows_up_to_limit_then_blocks():
+    async def scenario(storage):
+        hits = [await storage.hit(KEY, 3, 10, 60) for _ in range(3)]
+        assert all(hit.allowed for hit in hits)
+
+        hit = await storage.hit(KEY, 3, 10, 60)
+        assert not hit.allowed and hit.blocked
+        assert hit.retry_after == 60 and hit.violations == 1
+
+        # Пока блокировка действует, отказ без новой блокировки и без счёта нарушений
+        storage.now += 30
+        hit = await storage.hit(KEY, 3, 10, 60)
+        assert not hit.allowed and not hit.blocked
+        assert hit.retry_after == 30 and hit.violations == 1
+        assert await storage.get(KEY) == (30.0, 1)
+    run(scenario)
+
+
+def test_expired_block_resets_violations():
+    async def scenario(storage):
+        for _ in range(4):
+            await storage.hit(KEY, 3, 10, 60)
+        storage.now += 61
+        hit = await storage.hit(KEY, 3, 10, 60)
+        assert hit.allowed and hit.violations == 0
+        assert await storage.get(KEY) == (0.0, 0)
+    run(scenario)
+
+
+def test_previous_window_counts_by_overlap():
+    async def scenario(storage):
+        # Окно [1000, 1010): 4 запроса
+        for _ in range(4):
+            assert (await storage.hit(KEY, 4, 10, 0)).allowed
+        # Середина следующего окна: прошлое окно весит половину — 2 из 4
+        storage.now = 1015.0
+        assert (await storage.hit(KEY, 4, 10, 0)).allowed
+        assert (await storage.hit(KEY, 4, 10, 0)).allowed
+        hit = await storage.hit(KEY, 4, 10, 0)
+        assert not hit.allowed and not hit.blocked and hit.retry_after == 0
+        # Через два окна старые запросы не учитываются
+        storage.now = 1030.0
+        assert (await storage.hit(KEY, 4, 10, 0)).allowed
+    run(scenario)
+
+
+def test_limit_without_block_does_not_count_violations():
+    async def scenario(storage):
+        await storage.hit(KEY, 1, 10, 0)
+        for _ in range(3):
+            hit = await storage.hit(KEY, 1, 10, 0)
+            assert not hit.allowed and not hit.blocked
+        assert (await storage.get(KEY))[1] == 0
+        # Отказанные запросы не занимают лимит
+        storage.now = 1020.0
+        assert (await storage.hit(KEY, 1, 10, 0)).allowed
+    run(scenario)
+
+
+def test_keys_are_independent_and_reset_by_prefix():
+    async def scenario(storage):
+        action_key = ("message", 42, "pdf")
+        other_key = ("message", 420)
+        await storage.hit(KEY, 1, 10, 60)
+        await storage.hit(KEY, 1, 10, 60)
+        assert (await storage.hit(action_key, 1, 10, 0)).allowed
+        assert (await storage.hit(other_key, 1, 10, 60)).allowed
+
+        await storage.reset(KEY)
+        assert await storage.get(KEY) is None
+        assert await storage.get(action_key) is None
+        # Ключ с тем же числовым началом не затронут
+        assert await storage.get(other_key) is not None
+    run(scenario)
+
+
+def test_sweep_removes_only_expired():
+    async def scenario(storage):
+        await storage.hit(KEY, 5, 10, 0)
+        await storage.hit(("message", 7), 1, 10, 300)
+        await storage.hit(("message", 7), 1, 10, 300)
+        storage.now += 25
+        assert await storage.sweep() == 1
+        assert await storage.get(KEY) is None
+        # Ключ с действующей блокировкой остаётся
+        assert await storage.get(("message", 7)) is not None
+    run(scenario)
+
+
+@pytest.mark.parametrize("url, accepted", [
+    ("", False),
+    ("sqlite:///data/bot.db", False),
+    ("postgresql://bot:secret@db/bot", True),
+])
+def test_database_backend_requires_postgres(url, accepted):
+    from pydantic import ValidationError
+    from config import Settings
+    values = dict(BOT_TOKEN="1:x", ADMIN_IDS="1", DATABASE_URL=url, RATE_LIMIT_BACKEND="database")
+    if accepted:
+        assert Settings(**values).RATE_LIMIT_BACKEND == "database"
+    else:
+        with pytest.raises(ValidationError):
+            Settings(**values)
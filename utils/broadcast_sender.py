@@ -0,0 +1,259 @@
+"""
+Параллельная отправка рассылки с адаптивным ограничением частоты
+
+Несколько отправителей берут получателей из общей очереди; частоту
+задаёт общий token bucket на уровне документированного лимита Telegram
+(около 30 сообщений в секунду на бота). Частота регулируется по AIMD:
+после TelegramRetryAfter она уменьшается вдвое и отправка замирает на
+retry_after секунд, а при спокойной работе растёт на шаг в секунду.
+
+Ошибки делятся на три вида:
+  • повторяемые — RetryAfter, сетевые, 5xx: отправка повторяется;
+  • постоянные — пользователь заблокировал бота, удалён, чат не найден:
+    получатель пропускается (и помечается неактивным);
+  • фатальные — ошибка в самой рассылке или в токене: задание останавливается.
+"""
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import AsyncIterator, Deque, List, Optional, Tuple
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramAPIError, TelegramBadRequest, TelegramConflictError, TelegramEntityTooLarge,
+    TelegramForbiddenError, TelegramMigrateToChat, TelegramNetworkError, TelegramNotFound,
+    TelegramRetryAfter, TelegramServerError, TelegramUnauthorizedError
+)
+from config import settings
+from database.models import BroadcastJob
+from database.user_cache import deactivate_user
+from utils.messages import send_broadcast_message
+from utils.token_bucket import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE = 'retryable'
+PERMANENT = 'permanent'
+FATAL = 'fatal'
+
+# Ответы BadRequest, относящиеся к конкретному получателю, а не к рассылке
+_PERMANENT_BAD_REQUESTS = (
+    'chat not found', 'user not found', 'user is deactivated', 'bot was blocked',
+    'peer_id_invalid', 'bot can\'t initiate conversation', 'have no rights to send',
+)
+
+
+def classify_error(error: Exception) -> str:
+    """
+    Вид ошибки отправки
+
+    Args:
+        error: Исключение при отправке
+
+    Returns:
+        RETRYABLE, PERMANENT или FATAL
+    """
+    if isinstance(error, TelegramEntityTooLarge):
+        return FATAL
+    if isinstance(error, (TelegramRetryAfter, TelegramNetworkError, TelegramServerError, asyncio.TimeoutError)):
+        return RETRYABLE
+    if isinstance(error, (TelegramForbiddenError, TelegramNotFound, TelegramMigrateToChat)):
+        return PERMANENT
+    if isinstance(error, TelegramBadRequest):
+        message = str(error).lower()
+        if any(marker in message for marker in _PERMANENT_BAD_REQUESTS):
+            return PERMANENT
+        return FATAL
+    if isinstance(error, (TelegramUnauthorizedError, TelegramConflictError)):
+        return FATAL
+    if isinstance(error, TelegramAPIError):
+        return PERMANENT
+    return RETRYABLE
+
+
+class AdaptiveRateLimiter:
+    """Token bucket с регулировкой частоты по AIMD"""
+
+    def __init__(self, max_rate: float, min_rate: float = 1.0, increase: float = 1.0, decrease: float = 0.5):
+        """
+        Args:
+            max_rate: Максимальная частота (сообщений в секунду)
+            min_rate: Минимальная частота
+            increase: Прибавка к частоте за секунду без RetryAfter
+            decrease: Множитель частоты при RetryAfter
+        """
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.bucket = TokenBucket(max_rate)
+        self.retry_afters = 0
+        self._last_increase = time.monotonic()
+        self._cooldown_until = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.bucket.rate
+
+    async def acquire(self, tokens: float = 1.0):
+        """Дождаться разрешения на отправку"""
+        await self.bucket.acquire(tokens)
+
+    def on_success(self):
+        """Аддитивное увеличение: не чаще раза в секунду"""
+        now = time.monotonic()
+        if now < self._cooldown_until or now - self._last_increase < 1.0:
+            return
+        self._last_increase = now
+        if self.bucket.rate < self.max_rate:
+            self.bucket.set_rate(min(self.max_rate, self.bucket.rate + self.increase))
+
+    def on_retry_after(self, retry_after: float):
+        """Мультипликативное уменьшение и пауза на retry_after секунд"""
+        self.retry_afters += 1
+        now = time.monotonic()
+        self.bucket.pause(retry_after)
+        # Одновременные отправки получают RetryAfter пачкой — частоту снижаем один раз
+        if now >= self._cooldown_until:
+            self.bucket.set_rate(max(self.min_rate, self.bucket.rate * self.decrease))
+            logger.warning(f"🐢 RetryAfter {retry_after} с: частота рассылки снижена до {self.bucket.rate:.1f}/с")
+        self._cooldown_until = now + retry_after
+        self._last_increase = self._cooldown_until
+
+
+class BroadcastSender:
+    """Пул отправителей одного задания рассылки"""
+
+    def __init__(self, bot: Bot, job: BroadcastJob, limiter: AdaptiveRateLimiter,
+                 concurrency: int = 10, max_attempts: int = 5, max_consecutive_failures: int = 50):
+        """
+        Args:
+            bot: Экземпляр бота
+            job: Задание (счётчики sent_count и failed_count обновляются на месте)
+            limiter: Общий ограничитель частоты
+            concurrency: Количество одновременных отправителей
+            max_attempts: Попыток для повторяемых ошибок (RetryAfter не считается)
+            max_consecutive_failures: Неудач подряд, после которых задание останавливается
+        """
+        self.bot = bot
+        self.job = job
+        self.limiter = limiter
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.max_consecutive_failures = max_consecutive_failures
+        # Сообщение с текстом после кружочка или стикера — это второй вызов API
+        self.tokens = 2 if job.content_type in ('video_note', 'sticker') and job.text else 1
+        self.cursor = job.cursor_id
+        self.fatal_error: Optional[Exception] = None
+        self.deactivated = 0
+        self._consecutive_failures = 0
+        self._dispatched: Deque[int] = deque()  # users.id в порядке выдачи
+        self._done = set()
+        self._stopped = False
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    def stop(self):
+        """Прекратить выдачу новых получателей (начатые отправки завершаются)"""
+        self._stopped = True
+
+    async def run(self, rows: AsyncIterator[List[Tuple[int, int]]]):
+        """
+        Отправить рассылку всем получателям
+
+        Args:
+            rows: Пачки (users.id, telegram_id) в порядке id
+        """
+        senders = [asyncio.create_task(self._sender()) for _ in range(self.concurrency)]
+        try:
+            async for batch in rows:
+                for row in batch:
+                    if self._stopped:
+                        break
+                    self._dispatched.append(row[0])
+                    await self._queue.put(row)
+                if self._stopped:
+                    break
+            for _ in senders:
+                await self._queue.put(None)
+            await asyncio.gather(*senders)
+        finally:
+            for task in senders:
+                task.cancel()
+
+    async def _sender(self):
+        """Отправитель: берёт получателей из очереди, пока не получит None"""
+        while True:
+            row = await self._queue.get()
+            if row is None:
+                return
+            if self._stopped:
+                # Невыданные получатели остаются за курсором и будут обработаны при продолжении
+                continue
+            row_id, telegram_id = row
+            await self._deliver(telegram_id)
+            self._complete(row_id)
+
+    async def _deliver(self, telegram_id: int):
+        """Отправить одному получателю с повторами"""
+        attempt = 0
+        while True:
+            await self.limiter.acquire(self.tokens)
+            try:
+                await send_broadcast_message(
+                    bot=self.bot,
+                    user_id=telegram_id,
+                    content_type=self.job.content_type,
+                    text=self.job.text,
+                    file_id=self.job.file_id
+                )
+                self.limiter.on_success()
+                self.job.sent_count += 1
+                self._consecutive_failures = 0
+                return
+            except Exception as e:
+                kind = classify_error(e)
+                if isinstance(e, TelegramRetryAfter):
+                    self.limiter.on_retry_after(e.retry_after)
+                    continue
+                if kind == RETRYABLE:
+                    attempt += 1
+                    if attempt < self.max_attempts:
+                        await asyncio.sleep(min(2 ** attempt, 30))
+                        continue
+                self.job.failed_count += 1
+                if kind == PERMANENT:
+                    logger.info(f"🚫 Рассылка #{self.job.id}: получатель {telegram_id} недоступен: {e}")
+                    if isinstance(e, TelegramForbiddenError):
+                        # Бот заблокирован или пользователь удалён — следующим рассылкам он не нужен
+                        try:
+                            if await deactivate_user(telegram_id):
+                                self.deactivated += 1
+                        except Exception as db_error:
+                            # Учёт одного получателя не должен останавливать отправителя
+                            logger.error(f"❌ Не удалось пометить пользователя {telegram_id} неактивным: {db_error}")
+                    self._consecutive_failures = 0
+                    return
+                if kind == FATAL:
+                    # Одновременные отправки упираются в ту же ошибку — сообщаем о ней один раз
+                    if self.fatal_error is None:
+                        logger.error(f"❌ Рассылка #{self.job.id}: ошибка, общая для всех получателей: {e}")
+                        self.fatal_error = e
+                    self.stop()
+                    return
+                logger.error(f"Ошибка отправки пользователю {telegram_id} после {attempt} попыток: {e}")
+                self._consecutive_failures += 1
+                if self._consecutive_failures >= self.max_consecutive_failures:
+                    self.fatal_error = e
+                    self.stop()
+                return
+
+    def _complete(self, row_id: int):
+        """Отметить получателя обработанным и сдвинуть курсор по непрерывному префиксу"""
+        self._done.add(row_id)
+        while self._dispatched and self._dispatched[0] in self._done:
+            self.cursor = self._dispatched.popleft()
+            self._done.discard(self.cursor)
+
+
+# Общий ограничитель частоты рассылок процесса
+broadcast_rate_limiter = AdaptiveRateLimiter(max_rate=settings.BROADCAST_RATE)
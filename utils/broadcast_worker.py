@@ -0,0 +1,230 @@
+"""
+Фоновое выполнение заданий рассылки
+
+Обработчик берёт задание из broadcast_jobs по аренде, обходит активных
+пользователей по id начиная с сохранённого курсора и периодически
+записывает курсор и счётчики (контрольная точка продлевает аренду).
+После падения задание продолжает с последней контрольной точки тот
+процесс, который первым заберёт истёкшую аренду. Сообщение с прогрессом
+у администратора обновляется не чаще BROADCAST_PROGRESS_INTERVAL.
+"""
+import os
+import time
+import uuid
+import socket
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional
+from aiogram import Bot
+from config import settings
+from database.broadcast_jobs import claim_job, checkpoint, release_job, get_job, record_history
+from database.bulk import iter_user_rows
+from database.models import BroadcastJob, User
+from utils.broadcast_sender import BroadcastSender, broadcast_rate_limiter
+from utils.keyboards import create_broadcast_job_keyboard
+
+logger = logging.getLogger(__name__)
+
+# После стольких неудачных отправок подряд (сеть, сервер) задание останавливается
+MAX_CONSECUTIVE_FAILURES = 50
+
+STATUS_NAMES = {
+    'draft': "⏳ в очереди",
+    'queued': "⏳ в очереди",
+    'running': "🚀 идёт",
+    'paused': "⏸ на паузе",
+    'cancelled': "✖️ отменена",
+    'done': "✅ завершена",
+    'failed': "❌ остановлена из-за ошибок",
+}
+
+
+def format_job_progress(job: BroadcastJob) -> str:
+    """Текст сообщения с прогрессом задания"""
+    processed = job.sent_count + job.failed_count
+    percent = min(processed / job.total, 1.0) if job.total else 1.0
+    filled = int(percent * 10)
+    text = (
+        f"📢 <b>Рассылка #{job.id}</b>: {STATUS_NAMES.get(job.status, job.status)}\n\n"
+        f"{'█' * filled}{'░' * (10 - filled)} {percent:.0%}\n"
+        f"Отправлено: {job.sent_count}\n"
+        f"Ошибок: {job.failed_count}\n"
+        f"Получателей: ~{job.total}"
+    )
+    if job.status == 'running' and job.started_at and processed:
+        elapsed = (datetime.utcnow() - job.started_at).total_seconds()
+        if elapsed > 0:
+            text += f"\nСкорость: {processed / elapsed:.1f} сообщ./с"
+    return text
+
+
+class BroadcastWorker:
+    """Фоновый обработчик заданий рассылки"""
+
+    def __init__(self, lease_ttl: float = 60, progress_interval: float = 3.0,
+                 checkpoint_interval: float = 2.0, poll_interval: float = 5.0, batch_size: int = 500,
+                 concurrency: int = 10):
+        """
+        Args:
+            lease_ttl: Срок аренды задания в секундах
+            progress_interval: Минимальный интервал обновления сообщения с прогрессом
+            checkpoint_interval: Интервал записи курсора (и проверки паузы/отмены)
+            poll_interval: Как часто искать новые задания, если очередь пуста
+            batch_size: Получателей в одной пачке чтения
+            concurrency: Одновременных отправок
+        """
+        self.lease_ttl = lease_ttl
+        self.progress_interval = progress_interval
+        self.checkpoint_interval = checkpoint_interval
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        # Уникален для процесса: по нему другие процессы видят, чья аренда
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.current: Optional[BroadcastJob] = None
+        self._bot: Optional[Bot] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._last_progress = 0.0
+
+    def start(self, bot: Bot):
+        """Запустить обработчик"""
+        self._bot = bot
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"📢 Обработчик рассылок запущен ({self.owner})")
+
+    async def stop(self):
+        """Остановить обработчик (задание продолжится после перезапуска)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        """Проверить очередь заданий, не дожидаясь интервала"""
+        self._wakeup.set()
+
+    async def _run(self):
+        """Цикл: взять задание, выполнить, ждать следующее"""
+        while True:
+            try:
+                job = await claim_job(self.owner, self.lease_ttl)
+            except Exception as e:
+                logger.error(f"❌ Ошибка получения задания рассылки: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            self.current = job
+            try:
+                await self._execute(job)
+            except asyncio.CancelledError:
+                # Остановка процесса: сохраняем прогресс и отдаём аренду, статус остаётся running
+                await asyncio.shield(release_job(job, self.owner))
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка выполнения рассылки #{job.id}: {e}", exc_info=True)
+                await release_job(job, self.owner)
+                await asyncio.sleep(self.poll_interval)
+            finally:
+                self.current = None
+
+    async def _execute(self, job: BroadcastJob):
+        """Выполнить задание с сохранённого курсора"""
+        logger.info(f"📢 Рассылка #{job.id}: старт с users.id > {job.cursor_id} (отправлено {job.sent_count})")
+        await self._report(job, force=True)
+        sender = BroadcastSender(
+            self._bot, job, broadcast_rate_limiter,
+            concurrency=self.concurrency,
+            max_consecutive_failures=MAX_CONSECUTIVE_FAILURES
+        )
+        sending = asyncio.create_task(sender.run(
+            iter_user_rows(User.is_active == True, after_id=job.cursor_id, batch_size=self.batch_size)
+        ))
+        interrupted = False
+        try:
+            while not sending.done():
+                await asyncio.wait({sending}, timeout=self.checkpoint_interval)
+                job.cursor_id = sender.cursor
+                if not sending.done() and not await checkpoint(job, self.owner, self.lease_ttl):
+                    # Пауза, отмена или потеря аренды: дожидаемся начатых отправок
+                    sender.stop()
+                    interrupted = True
+                    await sending
+                await self._report(job)
+            await sending
+        except BaseException:
+            sender.stop()
+            sending.cancel()
+            job.cursor_id = sender.cursor
+            raise
+        job.cursor_id = sender.cursor
+
+        if interrupted:
+            await self._interrupted(job)
+        elif sender.fatal_error is not None:
+            logger.error(f"❌ Рассылка #{job.id} остановлена: {sender.fatal_error}")
+            await self._finish(job, 'failed')
+        else:
+            if sender.deactivated:
+                logger.info(f"🚫 Рассылка #{job.id}: {sender.deactivated} получателей заблокировали бота и помечены неактивными")
+            await self._finish(job, 'done')
+
+    async def _finish(self, job: BroadcastJob, status: str):
+        """Завершить задание"""
+        await release_job(job, self.owner, status)
+        job = await get_job(job.id) or job
+        if job.status in ('done', 'failed', 'cancelled'):
+            await record_history(job)
+        logger.info(f"✅ Рассылка #{job.id} ({job.status}): отправлено {job.sent_count}, ошибок {job.failed_count}")
+        await self._report(job, force=True)
+
+    async def _interrupted(self, job: BroadcastJob):
+        """Задание поставлено на паузу, отменено или перешло к другому процессу"""
+        await release_job(job, self.owner)
+        fresh = await get_job(job.id)
+        if fresh is None:
+            return
+        logger.info(f"⏸ Рассылка #{job.id} прервана: {fresh.status}")
+        if fresh.status == 'cancelled':
+            await record_history(fresh)
+        if fresh.status in ('paused', 'cancelled'):
+            await self._report(fresh, force=True)
+
+    async def _report(self, job: BroadcastJob, force: bool = False):
+        """Обновить сообщение с прогрессом (не чаще progress_interval)"""
+        if not job.progress_chat_id or not job.progress_message_id:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_progress < self.progress_interval:
+            return
+        self._last_progress = now
+        try:
+            await self._bot.edit_message_text(
+                format_job_progress(job),
+                chat_id=job.progress_chat_id,
+                message_id=job.progress_message_id,
+                reply_markup=create_broadcast_job_keyboard(job.id, job.status),
+                parse_mode="HTML"
+            )
+        except Exception as e:
+            # «message is not modified» и ограничения на редактирование не мешают рассылке
+            logger.debug(f"Не удалось обновить прогресс рассылки #{job.id}: {e}")
+
+
+# Глобальный обработчик рассылок
+broadcast_worker = BroadcastWorker(
+    lease_ttl=settings.BROADCAST_LEASE_SECONDS,
+    progress_interval=settings.BROADCAST_PROGRESS_INTERVAL,
+    concurrency=settings.BROADCAST_CONCURRENCY
+)
@@ -1,11 +1,91 @@
 """
 Утилиты для работы с каналами Telegram
 """
+import asyncio
 import logging
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Tuple, Union
 from aiogram import Bot
+from aiogram.types import User
+from config import settings
 
 logger = logging.getLogger(__name__)
 
+# Статусы участника, при которых пользователь считается подписанным
+SUBSCRIBED_STATUSES = frozenset({'member', 'administrator', 'creator'})
+
+# Результат get_me по ID бота (не меняется за время работы процесса)
+_bot_info: Dict[int, User] = {}
+
+
+def _normalize_channel_id(channel_id):
+    """
+    Преобразует ID канала в правильный формат для Telegram API
+    
+    Args:
+        channel_id: ID канала (может быть строкой, числом или username)
+        
+    Returns:
+        Нормализованный ID канала (int для ID или str для username)
+    """
+    # Если это username (начинается с @), возвращаем как есть
+    if isinstance(channel_id, str) and channel_id.startswith('@'):
+        return channel_id
+    
+    # Если это строка с числом, преобразуем в int
+    if isinstance(channel_id, str):
+        # Убираем пробелы
+        channel_id = channel_id.strip()
+        # Если это username без @, добавляем @
+        if not channel_id.startswith('@') and not channel_id.lstrip('-').isdigit():
+            return f"@{channel_id}"
+        # Пытаемся преобразовать в число
+        try:
+            channel_id = int(channel_id)
+        except ValueError:
+            # Если не число, возможно это username без @
+            return f"@{channel_id}" if not channel_id.startswith('@') else channel_id
+    
+    # Если это положительное число, преобразуем в формат канала -100XXXXXXXXXX
+    if isinstance(channel_id, int) and channel_id > 0:
+        # Для каналов Telegram использует формат: -100 + ID
+        # Но нужно правильно сформировать число
+        # Например: 1541113270 -> -1001541113270
+        channel_str = str(channel_id)
+        return int(f"-100{channel_str}")
+    
+    # Если уже отрицательное число, возвращаем как есть
+    return channel_id
+
+
+@dataclass(frozen=True)
+class RequiredChannel:
+    """Канал, подписка на который обязательна"""
+    chat_id: Union[int, str]  # Нормализованный ID или @username
+    username: Optional[str]  # @username для ссылки и запасной проверки
+    resolved: bool = False  # ID получен от Telegram при запуске — запасная проверка не нужна
+    tracked: bool = False  # Бот — администратор: членство приходит событиями chat_member
+
+    @property
+    def label(self) -> str:
+        """Имя канала для логов"""
+        return self.username or str(self.chat_id)
+
+    @property
+    def url(self) -> Optional[str]:
+        """Ссылка на канал (если известен username)"""
+        return f"https://t.me/{self.username.lstrip('@')}" if self.username else None
+
+
+def load_required_channels() -> List[RequiredChannel]:
+    """Обязательные каналы из настроек"""
+    channels = []
+    for raw_id, username in settings.required_channel_specs:
+        if username:
+            username = '@' + username.lstrip('@')
+        channels.append(RequiredChannel(chat_id=_normalize_channel_id(raw_id), username=username or None))
+    return channels
+
 
 async def get_channel_id_by_username(bot: Bot, username: str) -> int:
     """
@@ -32,6 +112,23 @@ async def get_channel_id_by_username(bot: Bot, username: str) -> int:
         return None
 
 
+async def get_bot_info(bot: Bot) -> User:
+    """
+    Информация о боте (get_me запрашивается один раз за время работы процесса)
+    
+    Args:
+        bot: Экземпляр бота
+        
+    Returns:
+        Пользователь-бот
+    """
+    info = _bot_info.get(bot.id)
+    if info is None:
+        info = await bot.get_me()
+        _bot_info[bot.id] = info
+    return info
+
+
 async def verify_channel_access(bot: Bot, channel_id) -> bool:
     """
     Проверить доступ бота к каналу
@@ -44,7 +141,7 @@ async def verify_channel_access(bot: Bot, channel_id) -> bool:
         True если бот имеет доступ, иначе False
     """
     try:
-        bot_info = await bot.get_me()
+        bot_info = await get_bot_info(bot)
         member = await bot.get_chat_member(chat_id=channel_id, user_id=bot_info.id)
         logger.info(f"🤖 Бот в канале {channel_id}: статус={member.status}")
         return member.status in ['administrator', 'creator', 'member']
@@ -53,7 +150,71 @@ async def verify_channel_access(bot: Bot, channel_id) -> bool:
         return False
 
 
+# Обязательные каналы (общий список для проверки подписки и клавиатуры)
+REQUIRED_CHANNELS: List[RequiredChannel] = load_required_channels()
+
+
+def get_tracked_channel(chat_id: int) -> Optional[RequiredChannel]:
+    """Отслеживаемый обязательный канал по ID (или None)"""
+    for channel in REQUIRED_CHANNELS:
+        if channel.tracked and channel.chat_id == chat_id:
+            return channel
+    return None
+
+
+async def _resolve_channel(bot: Bot, channel: RequiredChannel, bot_id: int) -> Tuple[RequiredChannel, Optional[str]]:
+    """Получить числовой ID канала и проверить, что бот в нём администратор"""
+    try:
+        chat = await bot.get_chat(channel.chat_id)
+    except Exception as e:
+        if not channel.username or channel.username == channel.chat_id:
+            return channel, f"канал {channel.label} не найден: {e}"
+        try:
+            chat = await bot.get_chat(channel.username)
+        except Exception as e2:
+            return channel, f"канал {channel.label} не найден ни по ID, ни по username: {e2}"
+
+    username = f"@{chat.username}" if chat.username else channel.username
+    resolved = RequiredChannel(chat_id=chat.id, username=username, resolved=True)
+    try:
+        member = await bot.get_chat_member(chat_id=chat.id, user_id=bot_id)
+    except Exception as e:
+        return resolved, f"нет доступа к участникам канала {resolved.label}: {e}"
+    if member.status not in ('administrator', 'creator'):
+        return resolved, f"бот не администратор канала {resolved.label} (статус {member.status})"
+    return replace(resolved, tracked=True), None
+
+
+async def resolve_required_channels(bot: Bot, strict: bool = False) -> List[str]:
+    """
+    Один раз при запуске получить числовые ID обязательных каналов и проверить права бота
 
+    Каналы проверяются одновременно. Список REQUIRED_CHANNELS обновляется
+    на месте, поэтому проверки подписки дальше используют готовые ID.
+    Каналы, где бот — администратор, отмечаются как отслеживаемые:
+    для них членство берётся из событий chat_member.
 
+    Args:
+        bot: Экземпляр бота
+        strict: Прервать запуск при ошибке конфигурации (иначе — предупреждение)
+
+    Returns:
+        Список найденных проблем
+    """
+    bot_info = await get_bot_info(bot)
+    results = await asyncio.gather(*(_resolve_channel(bot, channel, bot_info.id) for channel in REQUIRED_CHANNELS))
 
+    problems = []
+    for index, (channel, problem) in enumerate(results):
+        REQUIRED_CHANNELS[index] = channel
+        if problem:
+            problems.append(problem)
+            logger.error(f"❌ {problem}")
+        else:
+            logger.info(f"📡 Канал {channel.label}: ID {channel.chat_id}, бот — администратор")
+        if not channel.url:
+            logger.warning(f"⚠️ У канала {channel.label} нет username — кнопки подписки на него не будет")
 
+    if problems and strict:
+        raise RuntimeError(f"Неверная настройка обязательных каналов: {'; '.join(problems)}")
+    return problems
@@ -1,73 +1,135 @@
 """
 Утилиты для защиты от повторных запросов (idempotency)
+
+TTLCache — словарь с временем жизни: записи лежат в порядке истечения,
+поэтому устаревшие снимаются с начала за O(1) на запись. SingleFlight
+объединяет одновременные одинаковые запросы: выполняется один, остальные
+ждут его Future и получают тот же результат.
 """
 import time
-import hashlib
-from typing import Dict, Set
-from datetime import datetime, timedelta
-
-# Хранилище обработанных запросов: {request_hash: timestamp}
-_processed_requests: Dict[str, float] = {}
-# Время жизни записи (5 минут)
-_REQUEST_TTL = 300
-
-
-def generate_request_hash(user_id: int, action: str, data: str = "") -> str:
-    """
-    Генерация хеша запроса для проверки дубликатов
-    
-    Args:
-        user_id: ID пользователя
-        action: Действие
-        data: Дополнительные данные
-    
-    Returns:
-        Хеш запроса
-    """
-    content = f"{user_id}:{action}:{data}"
-    return hashlib.md5(content.encode()).hexdigest()
-
-
-def is_duplicate_request(user_id: int, action: str, data: str = "") -> bool:
-    """
-    Проверить, является ли запрос дубликатом
-    
-    Args:
-        user_id: ID пользователя
-        action: Действие
-        data: Дополнительные данные
-    
-    Returns:
-        True если дубликат, иначе False
-    """
-    request_hash = generate_request_hash(user_id, action, data)
-    current_time = time.time()
-    
-    # Очищаем старые записи
-    cutoff_time = current_time - _REQUEST_TTL
-    _processed_requests.clear()  # Упрощенная очистка (в продакшене лучше использовать более эффективный метод)
-    
-    if request_hash in _processed_requests:
-        request_time = _processed_requests[request_hash]
-        if current_time - request_time < _REQUEST_TTL:
-            return True
-    
-    # Сохраняем запрос
-    _processed_requests[request_hash] = current_time
-    return False
-
-
-def mark_request_processed(user_id: int, action: str, data: str = ""):
-    """
-    Пометить запрос как обработанный
-    
-    Args:
-        user_id: ID пользователя
-        action: Действие
-        data: Дополнительные данные
-    """
-    request_hash = generate_request_hash(user_id, action, data)
-    _processed_requests[request_hash] = time.time()
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+# Сколько секунд отдавать готовый результат проверки подписки повторным нажатиям
+_SUBSCRIPTION_RESULT_TTL = 3
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Словарь с единым временем жизни записей"""
+
+    def __init__(self, ttl: float, max_size: int = 100000):
+        """
+        Args:
+            ttl: Время жизни записи в секундах
+            max_size: Максимум записей (сверх него вытесняются самые старые)
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        # {key: (expires_at, value)} в порядке истечения
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def _expire(self, now: float):
+        """Снять истёкшие записи с начала"""
+        data = self._data
+        while data:
+            expires_at = next(iter(data.values()))[0]
+            if expires_at > now:
+                break
+            data.popitem(last=False)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Значение или default, если записи нет или она истекла"""
+        self._expire(time.monotonic())
+        item = self._data.get(key)
+        return default if item is None else item[1]
+
+    def set(self, key: Hashable, value: Any = True):
+        """Записать значение (время жизни отсчитывается заново)"""
+        now = time.monotonic()
+        self._expire(now)
+        self._data.pop(key, None)
+        self._data[key] = (now + self.ttl, value)
+        if len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Удалить запись"""
+        item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        self._expire(time.monotonic())
+        return len(self._data)
+
+
+class SingleFlight:
+    """Объединение одновременных одинаковых запросов"""
+
+    def __init__(self, result_ttl: float = 0):
+        """
+        Args:
+            result_ttl: Сколько секунд отдавать готовый результат без нового запроса (0 — не хранить)
+        """
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self._results: Optional[TTLCache] = TTLCache(result_ttl) if result_ttl > 0 else None
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Выполнить запрос или присоединиться к уже выполняемому
+
+        Args:
+            key: Ключ запроса
+            factory: Функция, создающая корутину запроса
+
+        Returns:
+            (результат, shared) — shared=True, если результат получен от другого вызова
+        """
+        if self._results is not None:
+            cached = self._results.get(key, _MISSING)
+            if cached is not _MISSING:
+                return cached, True
+
+        future = self._in_flight.get(key)
+        if future is not None:
+            # shield: отмена ожидающего не отменяет общий запрос
+            return await asyncio.shield(future), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение передано ожидающим; помечаем его полученным, если их не было
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            if self._results is not None:
+                self._results.set(key, result)
+            return result, False
+        finally:
+            self._in_flight.pop(key, None)
+
+    def forget(self, key: Hashable):
+        """Забыть готовый результат"""
+        if self._results is not None:
+            self._results.pop(key)
 
+    @property
+    def in_flight(self) -> int:
+        """Сколько запросов выполняется сейчас"""
+        return len(self._in_flight)
 
 
+# Проверки подписки: одна на пользователя одновременно
+subscription_checks = SingleFlight(result_ttl=_SUBSCRIPTION_RESULT_TTL)
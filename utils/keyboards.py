@@ -1,17 +1,21 @@
 """
 Утилиты для создания клавиатур
 """
+from typing import Optional
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from config import settings
+from utils.channel_helper import REQUIRED_CHANNELS
 
 
 def create_subscription_keyboard() -> InlineKeyboardMarkup:
     """Создать клавиатуру для подписки на каналы"""
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="📢 Канал 1", url=f"https://t.me/{settings.CHANNEL1_USERNAME.replace('@', '')}")],
-        [InlineKeyboardButton(text="📢 Канал 2", url=f"https://t.me/{settings.CHANNEL2_USERNAME.replace('@', '')}")],
-        [InlineKeyboardButton(text="✅ Проверить подписку", callback_data="check_subscription")]
-    ])
+    buttons = [
+        [InlineKeyboardButton(text=f"📢 Канал {index}", url=channel.url)]
+        for index, channel in enumerate(REQUIRED_CHANNELS, 1)
+        if channel.url
+    ]
+    buttons.append([InlineKeyboardButton(text="✅ Проверить подписку", callback_data="check_subscription")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
 def create_back_button(callback_data: str = "menu_main") -> InlineKeyboardMarkup:
@@ -37,7 +41,21 @@ def create_admin_keyboard() -> InlineKeyboardMarkup:
         [InlineKeyboardButton(text="➕ Добавить контент", callback_data="admin_add_content")],
         [InlineKeyboardButton(text="📦 Демо проекты", callback_data="admin_demo_projects")],
         [InlineKeyboardButton(text="⚙️ Настройки", callback_data="admin_settings")],
-        [InlineKeyboardButton(text="📊 Статистика", callback_data="admin_stats")]
+        [InlineKeyboardButton(text="📊 Статистика", callback_data="admin_stats")],
+        [InlineKeyboardButton(text="💾 Резервные копии", callback_data="admin_backup")]
+    ])
+
+
+def create_broadcast_job_keyboard(job_id: int, status: str) -> Optional[InlineKeyboardMarkup]:
+    """Создать клавиатуру управления заданием рассылки (None — задание завершено)"""
+    if status in ('draft', 'queued', 'running'):
+        toggle = InlineKeyboardButton(text="⏸ Пауза", callback_data=f"bjob_pause_{job_id}")
+    elif status == 'paused':
+        toggle = InlineKeyboardButton(text="▶️ Продолжить", callback_data=f"bjob_resume_{job_id}")
+    else:
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [toggle, InlineKeyboardButton(text="✖️ Отменить", callback_data=f"bjob_cancel_{job_id}")]
     ])
 
 
@@ -0,0 +1,117 @@
+"""
+Кэш членства пользователей в обязательных каналах
+
+Результат getChatMember для пары (пользователь, канал) хранится:
+«подписан» — долго, «не подписан» — недолго (пользователь может
+подписаться в любой момент). Одновременные запросы одной пары
+объединяются в один вызов API.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from config import settings
+from utils.idempotency import TTLCache
+
+logger = logging.getLogger(__name__)
+
+MembershipKey = Tuple[int, Hashable]
+
+
+class MembershipCache:
+    """Кэш членства с раздельными TTL для положительных и отрицательных ответов"""
+
+    def __init__(self, positive_ttl: float, negative_ttl: float, max_size: int = 100000):
+        """
+        Args:
+            positive_ttl: Время жизни ответа «подписан» в секундах
+            negative_ttl: Время жизни ответа «не подписан» в секундах
+            max_size: Максимум записей каждого вида
+        """
+        self._positive = TTLCache(positive_ttl, max_size)
+        self._negative = TTLCache(negative_ttl, max_size)
+        self._in_flight: Dict[MembershipKey, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def lookup(self, user_id: int, chat_id: Hashable) -> Optional[bool]:
+        """Ответ из кэша или None"""
+        key = (user_id, chat_id)
+        if key in self._positive:
+            return True
+        if key in self._negative:
+            return False
+        return None
+
+    async def is_member(self, user_id: int, chat_id: Hashable,
+                        fetch: Callable[[], Awaitable[Optional[bool]]]) -> Optional[bool]:
+        """
+        Проверить членство через кэш
+
+        Запрос выполняется отдельной задачей: если вызывающий перестал ждать
+        (например, другой канал уже ответил «не подписан»), ответ всё равно
+        попадёт в кэш.
+
+        Args:
+            user_id: ID пользователя
+            chat_id: ID канала
+            fetch: Функция запроса к API; None — проверить не удалось (не кэшируется)
+
+        Returns:
+            True/False или None, если проверить не удалось
+        """
+        cached = self.lookup(user_id, chat_id)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        key = (user_id, chat_id)
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.create_task(fetch())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._store(key, done))
+        return await asyncio.shield(task)
+
+    def _store(self, key: MembershipKey, task: asyncio.Task):
+        """Сохранить ответ завершившегося запроса"""
+        self._in_flight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        result = task.result()
+        if result is True:
+            self._negative.pop(key)
+            self._positive.set(key)
+        elif result is False:
+            self._positive.pop(key)
+            self._negative.set(key)
+
+    def invalidate(self, user_id: int, chat_id: Hashable, negative_only: bool = False):
+        """Забыть ответ для пары (пользователь, канал)"""
+        key = (user_id, chat_id)
+        self._negative.pop(key)
+        if not negative_only:
+            self._positive.pop(key)
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика попаданий"""
+        total = self.hits + self.misses + self.coalesced
+        return {
+            'positive': len(self._positive),
+            'negative': len(self._negative),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            # Объединённые запросы тоже не стоили отдельного вызова API
+            'hit_rate': (self.hits + self.coalesced) / total if total else 0.0,
+        }
+
+
+# Глобальный кэш членства
+membership_cache = MembershipCache(
+    positive_ttl=settings.MEMBERSHIP_POSITIVE_TTL,
+    negative_ttl=settings.MEMBERSHIP_NEGATIVE_TTL
+)
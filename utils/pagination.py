@@ -0,0 +1,54 @@
+"""
+Курсоры для keyset-пагинации
+
+Курсор — пара (created_at, id) последней показанной строки, упакованная
+в компактную строку для callback_data (лимит Telegram — 64 байта).
+"""
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def _to_base36(value: int) -> str:
+    if value == 0:
+        return "0"
+    digits = []
+    while value:
+        value, rest = divmod(value, 36)
+        digits.append(_ALPHABET[rest])
+    return "".join(reversed(digits))
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """
+    Упаковать позицию строки в курсор
+
+    Args:
+        created_at: Дата создания строки
+        row_id: Первичный ключ строки
+
+    Returns:
+        Строка вида "<микросекунды>.<id>" в base36
+    """
+    micros = (created_at - _EPOCH) // _MICROSECOND
+    return f"{_to_base36(micros)}.{_to_base36(row_id)}"
+
+
+def decode_cursor(cursor: str) -> Optional[Tuple[datetime, int]]:
+    """
+    Распаковать курсор
+
+    Args:
+        cursor: Строка из encode_cursor()
+
+    Returns:
+        (created_at, id) или None, если курсор повреждён
+    """
+    try:
+        micros, row_id = cursor.split(".")
+        return _EPOCH + int(micros, 36) * _MICROSECOND, int(row_id, 36)
+    except (ValueError, OverflowError):
+        return None
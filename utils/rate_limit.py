@@ -1,27 +1,203 @@
 """
 Утилиты для защиты от спама и DDoS
+
+Лимиты считаются скользящим окном по двум счётчикам (текущее и прошлое
+окно, прошлое учитывается пропорционально перекрытию). Состояние ключа
+фиксированного размера, проверка — O(1), простаивающие ключи удаляет
+фоновая очистка. Хранилище состояний подключаемое: в памяти процесса
+или общее в БД (RATE_LIMIT_BACKEND), чтобы лимиты действовали во всех
+процессах бота.
 """
 import time
-from collections import defaultdict
-from typing import Dict, Tuple
-from datetime import datetime, timedelta
+import asyncio
 import logging
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple, Union
+from config import settings
 
 logger = logging.getLogger(__name__)
 
 
+class WindowState:
+    """Состояние лимита одного ключа"""
+    
+    __slots__ = ('window', 'window_start', 'current', 'previous', 'blocked_until', 'violations', 'last_seen')
+    
+    def __init__(self, window: float, now: float):
+        self.window = window
+        self.window_start = now - now % window
+        self.current = 0
+        self.previous = 0
+        self.blocked_until = 0.0
+        self.violations = 0
+        self.last_seen = now
+    
+    def _advance(self, now: float):
+        """Сдвинуть окна к текущему времени"""
+        elapsed = now - self.window_start
+        if elapsed >= self.window:
+            # Прошлое окно — только если текущее закончилось не более окна назад
+            self.previous = self.current if elapsed < 2 * self.window else 0
+            self.current = 0
+            self.window_start = now - now % self.window
+    
+    def estimate(self, now: float) -> float:
+        """Оценка числа запросов за последние window секунд"""
+        self._advance(now)
+        overlap = 1 - (now - self.window_start) / self.window
+        return self.previous * overlap + self.current
+    
+    def is_idle(self, now: float) -> bool:
+        """Ключ можно удалить: оба окна истекли и блокировки нет"""
+        return now - self.last_seen >= 2 * self.window and now >= self.blocked_until
+
+
+@dataclass
+class RateLimitHit:
+    """Результат проверки лимита"""
+    allowed: bool
+    blocked: bool  # Блокировка выставлена этим запросом
+    retry_after: int  # Секунд до снятия блокировки
+    violations: int
+
+
+# Ключ лимита: (limiter, user_id) или (limiter, user_id, action)
+RateLimitKey = Tuple[Union[str, int], ...]
+
+
+class RateLimitStorage(ABC):
+    """Интерфейс хранилища состояний лимитов"""
+    
+    @abstractmethod
+    async def hit(self, key: RateLimitKey, max_requests: int, window: int, block_duration: int) -> RateLimitHit:
+        """
+        Атомарно проверить лимит и учесть запрос
+        
+        Args:
+            key: Ключ лимита
+            max_requests: Максимальное количество запросов в окне
+            window: Окно в секундах
+            block_duration: Блокировка при превышении (0 — без блокировки)
+        
+        Returns:
+            Результат проверки
+        """
+    
+    @abstractmethod
+    async def get(self, key: RateLimitKey) -> Optional[Tuple[float, int]]:
+        """(секунд до снятия блокировки, нарушений) или None, если ключа нет"""
+    
+    @abstractmethod
+    async def reset(self, prefix: RateLimitKey):
+        """Удалить ключ и все ключи, начинающиеся с него"""
+    
+    @abstractmethod
+    async def sweep(self, limit: int = 1000) -> int:
+        """Удалить простаивающие ключи (не больше limit за вызов), вернуть количество"""
+
+
+class MemoryRateLimitStorage(RateLimitStorage):
+    """Состояния лимитов в памяти процесса"""
+    
+    def __init__(self, max_keys: int = 100000):
+        """
+        Args:
+            max_keys: Максимум ключей в памяти (сверх него вытесняются давно не активные)
+        """
+        self.max_keys = max_keys
+        # Состояния в порядке последнего обращения
+        self._states: "OrderedDict[RateLimitKey, WindowState]" = OrderedDict()
+    
+    def _get_state(self, key: RateLimitKey, window: float, now: float) -> WindowState:
+        """Получить состояние ключа, создав при необходимости"""
+        state = self._states.get(key)
+        if state is None or state.window != window:
+            previous = state
+            state = WindowState(window, now)
+            if previous is not None:
+                # Смена окна обнуляет счётчики, но не действующую блокировку
+                state.blocked_until = previous.blocked_until
+                state.violations = previous.violations
+            self._states[key] = state
+            if len(self._states) > self.max_keys:
+                self._states.popitem(last=False)
+        else:
+            self._states.move_to_end(key)
+        state.last_seen = now
+        return state
+    
+    async def hit(self, key: RateLimitKey, max_requests: int, window: int, block_duration: int) -> RateLimitHit:
+        now = time.monotonic()
+        state = self._get_state(key, window, now)
+        
+        if state.blocked_until:
+            if now < state.blocked_until:
+                return RateLimitHit(False, False, int(state.blocked_until - now), state.violations)
+            # Блокировка истекла
+            state.blocked_until = 0.0
+            state.violations = 0
+        
+        if state.estimate(now) >= max_requests:
+            if block_duration > 0:
+                state.blocked_until = now + block_duration
+                state.violations += 1
+            return RateLimitHit(False, block_duration > 0, block_duration, state.violations)
+        
+        state.current += 1
+        return RateLimitHit(True, False, 0, state.violations)
+    
+    async def get(self, key: RateLimitKey) -> Optional[Tuple[float, int]]:
+        state = self._states.get(key)
+        if state is None:
+            return None
+        return max(state.blocked_until - time.monotonic(), 0.0), state.violations
+    
+    async def reset(self, prefix: RateLimitKey):
+        size = len(prefix)
+        for key in [key for key in self._states if key[:size] == prefix]:
+            del self._states[key]
+    
+    async def sweep(self, limit: int = 1000) -> int:
+        now = time.monotonic()
+        removed = 0
+        for _ in range(min(limit, len(self._states))):
+            key, state = next(iter(self._states.items()))
+            if state.is_idle(now):
+                del self._states[key]
+                removed += 1
+            else:
+                # Ключ ещё заблокирован или окно не истекло — проверим позже, не задерживая
+                # простаивающие ключи за ним (у ключей разные окна и блокировки)
+                self._states.move_to_end(key)
+        return removed
+    
+    def __len__(self) -> int:
+        return len(self._states)
+
+
 class RateLimiter:
     """Rate limiter для защиты от спама"""
     
-    def __init__(self):
-        # Хранилище запросов: {user_id: [(timestamp, action), ...]}
-        self._requests: Dict[int, list] = defaultdict(list)
-        # Блокированные пользователи: {user_id: unblock_timestamp}
-        self._blocked: Dict[int, float] = {}
-        # Статистика нарушений
-        self._violations: Dict[int, int] = defaultdict(int)
+    def __init__(self, name: str, storage: RateLimitStorage):
+        """
+        Args:
+            name: Имя лимитера (пространство ключей в общем хранилище)
+            storage: Хранилище состояний
+        """
+        self.name = name
+        self.storage = storage
+    
+    async def _hit(self, key: RateLimitKey, max_requests: int, window: int, block_duration: int) -> RateLimitHit:
+        """Проверка с защитой от сбоев хранилища (при ошибке запрос пропускается)"""
+        try:
+            return await self.storage.hit(key, max_requests, window, block_duration)
+        except Exception as e:
+            logger.error(f"❌ Ошибка хранилища rate limit: {e}")
+            return RateLimitHit(True, False, 0, 0)
     
-    def check_rate_limit(
+    async def check_rate_limit(
         self,
         user_id: int,
         max_requests: int = 10,
@@ -40,37 +216,18 @@ class RateLimiter:
         Returns:
             (is_allowed, message)
         """
-        current_time = time.time()
-        
-        # Проверяем, не заблокирован ли пользователь
-        if user_id in self._blocked:
-            unblock_time = self._blocked[user_id]
-            if current_time < unblock_time:
-                remaining = int(unblock_time - current_time)
-                return False, f"⏳ Вы временно заблокированы. Попробуйте через {remaining} секунд"
-            else:
-                # Разблокируем
-                del self._blocked[user_id]
-                self._violations[user_id] = 0
-        
-        # Очищаем старые запросы
-        cutoff_time = current_time - time_window
-        user_requests = self._requests[user_id]
-        user_requests[:] = [req_time for req_time in user_requests if req_time > cutoff_time]
-        
-        # Проверяем лимит
-        if len(user_requests) >= max_requests:
-            # Блокируем пользователя
-            self._blocked[user_id] = current_time + block_duration
-            self._violations[user_id] += 1
+        hit = await self._hit((self.name, user_id), max_requests, time_window, block_duration)
+        if hit.allowed:
+            return True, ""
+        if hit.blocked:
             logger.warning(f"🚫 Пользователь {user_id} заблокирован за превышение лимита запросов")
             return False, f"⛔ Превышен лимит запросов. Блокировка на {block_duration} секунд"
-        
-        # Добавляем текущий запрос
-        user_requests.append(current_time)
-        return True, ""
+        if not hit.retry_after:
+            # Лимит без блокировки
+            return False, f"⏳ Слишком много запросов. Подождите {time_window} секунд"
+        return False, f"⏳ Вы временно заблокированы. Попробуйте через {hit.retry_after} секунд"
     
-    def check_action_rate_limit(
+    async def check_action_rate_limit(
         self,
         user_id: int,
         action: str,
@@ -89,61 +246,93 @@ class RateLimiter:
         Returns:
             (is_allowed, message)
         """
-        current_time = time.time()
-        key = f"{user_id}:{action}"
-        
-        # Очищаем старые запросы
-        cutoff_time = current_time - time_window
-        requests = self._requests.get(key, [])
-        requests[:] = [req_time for req_time in requests if req_time > cutoff_time]
-        
-        # Проверяем лимит
-        if len(requests) >= max_requests:
-            logger.warning(f"🚫 Пользователь {user_id} превысил лимит для действия '{action}'")
-            return False, f"⏳ Слишком много запросов. Подождите {time_window} секунд"
-        
-        # Добавляем текущий запрос
-        if key not in self._requests:
-            self._requests[key] = []
-        self._requests[key].append(current_time)
-        return True, ""
+        hit = await self._hit((self.name, user_id, action), max_requests, time_window, 0)
+        if hit.allowed:
+            return True, ""
+        logger.warning(f"🚫 Пользователь {user_id} превысил лимит для действия '{action}'")
+        return False, f"⏳ Слишком много запросов. Подождите {time_window} секунд"
     
-    def is_blocked(self, user_id: int) -> bool:
+    async def is_blocked(self, user_id: int) -> bool:
         """Проверить, заблокирован ли пользователь"""
-        if user_id not in self._blocked:
-            return False
-        
-        current_time = time.time()
-        if current_time >= self._blocked[user_id]:
-            del self._blocked[user_id]
-            return False
-        
-        return True
+        state = await self.storage.get((self.name, user_id))
+        return state is not None and state[0] > 0
     
-    def get_violations_count(self, user_id: int) -> int:
+    async def get_violations_count(self, user_id: int) -> int:
         """Получить количество нарушений пользователя"""
-        return self._violations.get(user_id, 0)
+        state = await self.storage.get((self.name, user_id))
+        return state[1] if state else 0
     
-    def reset_user(self, user_id: int):
+    async def reset_user(self, user_id: int):
         """Сбросить статистику пользователя"""
-        if user_id in self._requests:
-            del self._requests[user_id]
-        if user_id in self._blocked:
-            del self._blocked[user_id]
-        if user_id in self._violations:
-            del self._violations[user_id]
+        await self.storage.reset((self.name, user_id))
 
 
+class RateLimitSweeper:
+    """Фоновая очистка простаивающих ключей хранилища лимитов"""
+    
+    def __init__(self, storage: RateLimitStorage, interval: float = 30, chunk: int = 1000):
+        """
+        Args:
+            storage: Очищаемое хранилище
+            interval: Интервал между проходами в секундах
+            chunk: Ключей за один шаг (между шагами управление отдаётся циклу событий)
+        """
+        self.storage = storage
+        self.interval = interval
+        self.chunk = chunk
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        """Запустить фоновую очистку"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Остановить фоновую очистку"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def _run(self):
+        """Цикл очистки"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                while await self.storage.sweep(self.chunk) >= self.chunk:
+                    await asyncio.sleep(0)
+            except Exception as e:
+                logger.error(f"❌ Ошибка очистки rate limit: {e}")
+
+
+def _create_storage() -> RateLimitStorage:
+    """Хранилище по настройке RATE_LIMIT_BACKEND"""
+    if settings.RATE_LIMIT_BACKEND == "database":
+        from database.rate_limits import DatabaseRateLimitStorage
+        logger.info("🛡️ Rate limit: общее хранилище в БД")
+        return DatabaseRateLimitStorage()
+    return MemoryRateLimitStorage()
+
+
+# Общее хранилище состояний всех лимитеров
+rate_limit_storage = _create_storage()
+
 # Глобальные экземпляры rate limiters для разных типов действий
-message_rate_limiter = RateLimiter()  # Для текстовых сообщений
-callback_rate_limiter = RateLimiter()  # Для callback queries
-registration_rate_limiter = RateLimiter()  # Для регистрации
-admin_rate_limiter = RateLimiter()  # Для админ-панели
+message_rate_limiter = RateLimiter("message", rate_limit_storage)  # Для текстовых сообщений
+callback_rate_limiter = RateLimiter("callback", rate_limit_storage)  # Для callback queries
+registration_rate_limiter = RateLimiter("registration", rate_limit_storage)  # Для регистрации
+admin_rate_limiter = RateLimiter("admin", rate_limit_storage)  # Для админ-панели
+
+# Фоновая очистка простаивающих ключей
+rate_limit_sweeper = RateLimitSweeper(rate_limit_storage)
 
 
-def check_message_rate_limit(user_id: int) -> Tuple[bool, str]:
+async def check_message_rate_limit(user_id: int) -> Tuple[bool, str]:
     """Проверить rate limit для сообщений"""
-    return message_rate_limiter.check_rate_limit(
+    return await message_rate_limiter.check_rate_limit(
         user_id=user_id,
         max_requests=15,  # 15 сообщений
         time_window=60,   # в минуту
@@ -151,9 +340,9 @@ def check_message_rate_limit(user_id: int) -> Tuple[bool, str]:
     )
 
 
-def check_callback_rate_limit(user_id: int) -> Tuple[bool, str]:
+async def check_callback_rate_limit(user_id: int) -> Tuple[bool, str]:
     """Проверить rate limit для callback queries"""
-    return callback_rate_limiter.check_rate_limit(
+    return await callback_rate_limiter.check_rate_limit(
         user_id=user_id,
         max_requests=30,  # 30 callback'ов
         time_window=60,   # в минуту
@@ -161,9 +350,9 @@ def check_callback_rate_limit(user_id: int) -> Tuple[bool, str]:
     )
 
 
-def check_registration_rate_limit(user_id: int) -> Tuple[bool, str]:
+async def check_registration_rate_limit(user_id: int) -> Tuple[bool, str]:
     """Проверить rate limit для регистрации"""
-    return registration_rate_limiter.check_action_rate_limit(
+    return await registration_rate_limiter.check_action_rate_limit(
         user_id=user_id,
         action="registration",
         max_requests=3,  # 3 попытки
@@ -171,9 +360,9 @@ def check_registration_rate_limit(user_id: int) -> Tuple[bool, str]:
     )
 
 
-def check_admin_rate_limit(user_id: int) -> Tuple[bool, str]:
+async def check_admin_rate_limit(user_id: int) -> Tuple[bool, str]:
     """Проверить rate limit для админ-панели"""
-    return admin_rate_limiter.check_rate_limit(
+    return await admin_rate_limiter.check_rate_limit(
         user_id=user_id,
         max_requests=50,  # 50 запросов
         time_window=60,   # в минуту
@@ -181,9 +370,9 @@ def check_admin_rate_limit(user_id: int) -> Tuple[bool, str]:
     )
 
 
-def check_content_keyword_rate_limit(user_id: int) -> Tuple[bool, str]:
+async def check_content_keyword_rate_limit(user_id: int) -> Tuple[bool, str]:
     """Проверить rate limit для поиска по ключевым словам"""
-    return message_rate_limiter.check_action_rate_limit(
+    return await message_rate_limiter.check_action_rate_limit(
         user_id=user_id,
         action="content_keyword",
         max_requests=10,  # 10 запросов
@@ -191,9 +380,9 @@ def check_content_keyword_rate_limit(user_id: int) -> Tuple[bool, str]:
     )
 
 
-def check_broadcast_rate_limit(user_id: int) -> Tuple[bool, str]:
+async def check_broadcast_rate_limit(user_id: int) -> Tuple[bool, str]:
     """Проверить rate limit для рассылки"""
-    return admin_rate_limiter.check_action_rate_limit(
+    return await admin_rate_limiter.check_action_rate_limit(
         user_id=user_id,
         action="broadcast",
         max_requests=1,   # 1 рассылка
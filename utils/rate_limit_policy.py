@@ -0,0 +1,162 @@
+"""
+Политика rate limit для middleware
+
+Правила (тип события, команда или префикс callback_data, роль → лимит)
+компилируются при запуске в словарь, поэтому выбор лимита для апдейта —
+несколько поисков по хэшу без перебора правил. Правила по умолчанию
+можно дополнить или переопределить JSON-ом в RATE_LIMIT_POLICIES.
+"""
+import json
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from config import settings
+from utils.rate_limit import RateLimiter, RateLimitStorage, rate_limit_storage
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = ('message', 'callback_query')
+ROLES = ('user', 'admin')
+ANY_ROLE = '*'
+
+
+@dataclass(frozen=True)
+class LimitSpec:
+    """Параметры лимита"""
+    name: str  # Пространство ключей лимитера
+    max_requests: int
+    window: int
+    block_duration: int = 0
+
+
+@dataclass(frozen=True)
+class PolicyRule:
+    """Правило политики"""
+    event: str  # message или callback_query
+    prefix: str = ""  # Команда (/start) или префикс callback_data; пусто — все события типа
+    role: str = ANY_ROLE  # user, admin или *
+    limit: Optional[LimitSpec] = None  # None — без ограничений
+
+
+DEFAULT_POLICY: List[PolicyRule] = [
+    PolicyRule('message', limit=LimitSpec('message', 15, 60, 300)),  # 15 сообщений в минуту, блок на 5 минут
+    PolicyRule('callback_query', limit=LimitSpec('callback', 30, 60, 180)),  # 30 нажатий в минуту, блок на 3 минуты
+    # Проверка подписки — два запроса к Telegram API на нажатие
+    PolicyRule('callback_query', 'check_subscription', limit=LimitSpec('subscription_check', 10, 60, 60)),
+]
+
+
+def parse_rules(raw: str) -> List[PolicyRule]:
+    """
+    Разобрать правила из JSON
+
+    Формат: [{"event": "callback_query", "prefix": "demo_next", "role": "*",
+    "name": "demo_nav", "max_requests": 20, "window": 60, "block_duration": 0}, ...].
+    Без max_requests правило снимает ограничение.
+
+    Args:
+        raw: JSON-строка
+
+    Returns:
+        Список правил
+    """
+    if not raw.strip():
+        return []
+    rules = []
+    for item in json.loads(raw):
+        event = item['event']
+        role = item.get('role', ANY_ROLE)
+        if event not in EVENT_TYPES:
+            raise ValueError(f"Неизвестный тип события в политике rate limit: {event}")
+        if role != ANY_ROLE and role not in ROLES:
+            raise ValueError(f"Неизвестная роль в политике rate limit: {role}")
+        prefix = item.get('prefix', '')
+        limit = None
+        if item.get('max_requests') is not None:
+            limit = LimitSpec(
+                name=item.get('name') or f"{event}:{prefix or '*'}",
+                max_requests=int(item['max_requests']),
+                window=int(item.get('window', 60)),
+                block_duration=int(item.get('block_duration', 0))
+            )
+        rules.append(PolicyRule(event, prefix, role, limit))
+    return rules
+
+
+def route_prefixes(event_type: str, route: str) -> List[str]:
+    """
+    Ключи для поиска правила: от самого точного к общему
+
+    Для сообщений — команда и пустой ключ, для callback_data — префиксы
+    по сегментам через «_» (demo_next_3 → demo_next_3, demo_next, demo, "").
+    """
+    if event_type == 'message':
+        if route.startswith('/'):
+            command = route.split(maxsplit=1)[0].split('@', 1)[0]
+            return [command, ""]
+        return [""]
+
+    prefixes = []
+    end = len(route)
+    while end > 0:
+        prefixes.append(route[:end])
+        end = route.rfind('_', 0, end)
+    prefixes.append("")
+    return prefixes
+
+
+class RateLimitPolicy:
+    """Скомпилированная политика: (событие, роль, префикс) → лимит"""
+
+    def __init__(self, rules: List[PolicyRule], storage: RateLimitStorage):
+        """
+        Args:
+            rules: Правила; более поздние переопределяют ранние с тем же ключом
+            storage: Хранилище состояний лимитов
+        """
+        self._table: Dict[Tuple[str, str, str], Optional[Tuple[RateLimiter, LimitSpec]]] = {}
+        limiters: Dict[str, RateLimiter] = {}
+
+        # Правила для всех ролей раскладываются по ролям, правила конкретной роли их перекрывают
+        ordered = [rule for rule in rules if rule.role == ANY_ROLE] + [rule for rule in rules if rule.role != ANY_ROLE]
+        for rule in ordered:
+            entry = None
+            if rule.limit is not None:
+                limiter = limiters.setdefault(rule.limit.name, RateLimiter(rule.limit.name, storage))
+                entry = (limiter, rule.limit)
+            for role in (ROLES if rule.role == ANY_ROLE else (rule.role,)):
+                self._table[(rule.event, role, rule.prefix)] = entry
+
+        self.limiters = limiters
+
+    def resolve(self, event_type: str, is_admin: bool, route: str) -> Optional[Tuple[RateLimiter, LimitSpec]]:
+        """
+        Найти лимит для события
+
+        Args:
+            event_type: message или callback_query
+            is_admin: Событие от администратора
+            route: Текст сообщения или callback_data
+
+        Returns:
+            (лимитер, параметры) или None, если событие не ограничивается
+        """
+        role = 'admin' if is_admin else 'user'
+        table = self._table
+        for prefix in route_prefixes(event_type, route):
+            key = (event_type, role, prefix)
+            if key in table:
+                return table[key]
+        return None
+
+    @classmethod
+    def from_settings(cls, storage: RateLimitStorage) -> "RateLimitPolicy":
+        """Политика по умолчанию с правилами из RATE_LIMIT_POLICIES"""
+        extra = parse_rules(settings.RATE_LIMIT_POLICIES)
+        if extra:
+            logger.info(f"🛡️ Дополнительных правил rate limit: {len(extra)}")
+        return cls(DEFAULT_POLICY + extra, storage)
+
+
+# Глобальная политика rate limit (компилируется при запуске)
+rate_limit_policy = RateLimitPolicy.from_settings(rate_limit_storage)
@@ -0,0 +1,270 @@
+"""
+Состав обязательных каналов, загруженный через MTProto (Telethon)
+
+Вместо getChatMember на каждого пользователя список участников канала
+постранично загружается от имени администратора и хранится в памяти
+отсортированным массивом int64 — проверка членства бинарным поиском
+за O(log n) без обращений к Telegram. Новые участники дозагружаются
+по расписанию (список отдаётся от недавно вступивших), полная
+перезагрузка — реже; между ними состав обновляют события chat_member.
+
+Источник участников подменяемый: достаточно реализовать
+ParticipantSource.iter_member_ids (например, заглушкой со списком ID).
+"""
+import time
+import asyncio
+import heapq
+import logging
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left
+from typing import Any, AsyncIterator, Dict, Iterable, Optional
+from config import settings
+from utils.channel_helper import REQUIRED_CHANNELS, RequiredChannel
+
+logger = logging.getLogger(__name__)
+
+# Дозагрузка останавливается после стольких уже известных участников подряд
+KNOWN_STREAK_LIMIT = 200
+
+
+class ParticipantSource(ABC):
+    """Источник списка участников канала"""
+
+    async def connect(self):
+        """Подготовить соединение"""
+
+    async def close(self):
+        """Закрыть соединение"""
+
+    @abstractmethod
+    def iter_member_ids(self, channel: RequiredChannel) -> AsyncIterator[int]:
+        """
+        ID участников канала, начиная с недавно вступивших
+
+        Args:
+            channel: Обязательный канал
+        """
+
+
+class TelethonParticipantSource(ParticipantSource):
+    """Участники каналов через Telethon от имени пользователя-администратора"""
+
+    def __init__(self, api_id: int, api_hash: str, session: str):
+        """
+        Args:
+            api_id: api_id приложения
+            api_hash: api_hash приложения
+            session: StringSession пользователя
+        """
+        self.api_id = api_id
+        self.api_hash = api_hash
+        self.session = session
+        self._client = None
+
+    async def connect(self):
+        """Подключить клиент Telethon (импортируется только при включённом составе)"""
+        from telethon import TelegramClient
+        from telethon.sessions import StringSession
+
+        self._client = TelegramClient(StringSession(self.session), self.api_id, self.api_hash)
+        await self._client.connect()
+        if not await self._client.is_user_authorized():
+            raise RuntimeError("Сессия Telethon не авторизована (TELETHON_SESSION)")
+
+    async def close(self):
+        """Отключить клиент"""
+        if self._client is not None:
+            await self._client.disconnect()
+            self._client = None
+
+    async def iter_member_ids(self, channel: RequiredChannel) -> AsyncIterator[int]:
+        from telethon.tl.types import ChannelParticipantsRecent
+
+        entity = await self._client.get_entity(channel.username or channel.chat_id)
+        async for user in self._client.iter_participants(entity, filter=ChannelParticipantsRecent()):
+            yield user.id
+
+
+class ChannelRoster:
+    """Отсортированный массив ID участников одного канала"""
+
+    def __init__(self, member_ids: Iterable[int] = ()):
+        self._ids = array('q', sorted(set(member_ids)))
+        self.refreshed_at = time.time()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, user_id: int) -> bool:
+        index = bisect_left(self._ids, user_id)
+        return index < len(self._ids) and self._ids[index] == user_id
+
+    def merge(self, member_ids: Iterable[int]) -> int:
+        """
+        Добавить участников (слиянием отсортированных последовательностей)
+
+        Returns:
+            Сколько участников добавлено
+        """
+        before = len(self._ids)
+        merged = array('q')
+        for user_id in heapq.merge(self._ids, sorted(set(member_ids))):
+            if not merged or merged[-1] != user_id:
+                merged.append(user_id)
+        self._ids = merged
+        self.refreshed_at = time.time()
+        return len(merged) - before
+
+    def add(self, user_id: int):
+        """Отметить вступление участника"""
+        index = bisect_left(self._ids, user_id)
+        if index == len(self._ids) or self._ids[index] != user_id:
+            self._ids.insert(index, user_id)
+
+    def discard(self, user_id: int):
+        """Отметить выход участника"""
+        index = bisect_left(self._ids, user_id)
+        if index < len(self._ids) and self._ids[index] == user_id:
+            del self._ids[index]
+
+
+class RosterService:
+    """Состав обязательных каналов в памяти с периодическим обновлением"""
+
+    def __init__(self, source: ParticipantSource, refresh_interval: float, full_refresh_interval: float):
+        """
+        Args:
+            source: Источник участников
+            refresh_interval: Интервал дозагрузки новых участников в секундах
+            full_refresh_interval: Интервал полной перезагрузки в секундах
+        """
+        self.source = source
+        self.refresh_interval = refresh_interval
+        self.full_refresh_interval = full_refresh_interval
+        self._rosters: Dict[int, ChannelRoster] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def is_member(self, user_id: int, chat_id: int) -> Optional[bool]:
+        """
+        Членство по загруженному составу
+
+        Надёжен только положительный ответ: состав может быть неполным
+        (лимит загрузки), поэтому False означает «не найден», а не «не подписан».
+
+        Returns:
+            True/False или None, если состав канала ещё не загружен
+        """
+        roster = self._rosters.get(chat_id)
+        if roster is None:
+            return None
+        return user_id in roster
+
+    def apply(self, chat_id: int, user_id: int, is_member: bool):
+        """Учесть событие chat_member в загруженном составе"""
+        roster = self._rosters.get(chat_id)
+        if roster is None:
+            return
+        if is_member:
+            roster.add(user_id)
+        else:
+            roster.discard(user_id)
+
+    async def rebuild(self, channel: RequiredChannel) -> ChannelRoster:
+        """Полностью загрузить состав канала"""
+        started = time.monotonic()
+        roster = ChannelRoster([user_id async for user_id in self.source.iter_member_ids(channel)])
+        self._rosters[channel.chat_id] = roster
+        logger.info(f"👥 Состав канала {channel.label}: {len(roster)} участников за {time.monotonic() - started:.1f} с")
+        return roster
+
+    async def refresh(self, channel: RequiredChannel) -> int:
+        """
+        Дозагрузить недавно вступивших участников
+
+        Список идёт от новых к старым; загрузка останавливается, когда
+        подряд встречается KNOWN_STREAK_LIMIT уже известных участников.
+
+        Returns:
+            Сколько участников добавлено
+        """
+        roster = self._rosters.get(channel.chat_id)
+        if roster is None:
+            await self.rebuild(channel)
+            return len(self._rosters[channel.chat_id])
+
+        new_ids = []
+        known_streak = 0
+        async for user_id in self.source.iter_member_ids(channel):
+            if user_id in roster:
+                known_streak += 1
+                if known_streak >= KNOWN_STREAK_LIMIT:
+                    break
+            else:
+                known_streak = 0
+                new_ids.append(user_id)
+        added = roster.merge(new_ids)
+        logger.info(f"👥 Состав канала {channel.label}: +{added}, всего {len(roster)}")
+        return added
+
+    def start(self):
+        """Запустить загрузку и обновление состава"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановить обновление и закрыть источник"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.source.close()
+
+    async def _run(self):
+        """Цикл обновления: полная загрузка, затем дозагрузки"""
+        try:
+            await self.source.connect()
+        except Exception as e:
+            logger.error(f"❌ Состав каналов недоступен: {e}")
+            return
+
+        last_full = 0.0
+        while True:
+            full = time.monotonic() - last_full >= self.full_refresh_interval
+            for channel in list(REQUIRED_CHANNELS):
+                try:
+                    if full:
+                        await self.rebuild(channel)
+                    else:
+                        await self.refresh(channel)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка загрузки состава канала {channel.label}: {e}")
+            if full:
+                last_full = time.monotonic()
+            await asyncio.sleep(self.refresh_interval)
+
+    def stats(self) -> Dict[Any, Dict[str, Any]]:
+        """Размер и время обновления состава по каналам"""
+        return {
+            chat_id: {'members': len(roster), 'refreshed_at': roster.refreshed_at}
+            for chat_id, roster in self._rosters.items()
+        }
+
+
+def _create_roster_service() -> Optional[RosterService]:
+    """Сервис состава каналов, если заданы данные Telethon"""
+    if not settings.roster_enabled:
+        return None
+    logger.info("👥 Состав каналов загружается через Telethon")
+    return RosterService(
+        TelethonParticipantSource(settings.TELETHON_API_ID, settings.TELETHON_API_HASH, settings.TELETHON_SESSION),
+        refresh_interval=settings.ROSTER_REFRESH_MINUTES * 60,
+        full_refresh_interval=settings.ROSTER_FULL_REFRESH_HOURS * 3600
+    )
+
+
+# Глобальный сервис состава каналов (None — не настроен)
+roster_service: Optional[RosterService] = _create_roster_service()
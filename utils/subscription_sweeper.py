@@ -0,0 +1,215 @@
+"""
+Фоновая перепроверка сохранённого статуса подписки
+
+User.is_subscribed записывается только при регистрации и нажатии
+«Проверить», а потом устаревает, когда пользователи отписываются.
+Перепроверка обходит зарегистрированных пользователей пачками по id
+и сверяет членство в каналах, расходуя не больше заданной доли
+бюджета вызовов Bot API — остальное остаётся интерактивным запросам.
+"""
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from aiogram import Bot
+from config import settings
+from database.bulk import iter_user_ids
+from database.channel_members import channel_members
+from database.models import User
+from database.user_cache import get_user_state, update_user
+from middleware.load_shedding import load_monitor
+from utils.channel_helper import REQUIRED_CHANNELS
+from utils.membership import membership_cache
+from utils.roster import roster_service
+from utils.token_bucket import TokenBucket
+from utils.validators import check_channel_member
+
+logger = logging.getLogger(__name__)
+
+# Пауза после ошибки API (часто это RetryAfter — не стоит продолжать в том же темпе)
+ERROR_BACKOFF = 5.0
+
+
+@dataclass
+class SweepReport:
+    """Итоги одного прохода перепроверки"""
+    started_at: datetime = field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+    checked: int = 0
+    subscribed: int = 0  # Стали подписанными
+    unsubscribed: int = 0  # Отписались
+    errors: int = 0
+    api_calls: int = 0
+    duration: float = 0.0
+
+    @property
+    def changed(self) -> int:
+        return self.subscribed + self.unsubscribed
+
+    @property
+    def rate(self) -> float:
+        """Пользователей в секунду"""
+        return self.checked / self.duration if self.duration else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'checked': self.checked,
+            'changed': self.changed,
+            'subscribed': self.subscribed,
+            'unsubscribed': self.unsubscribed,
+            'errors': self.errors,
+            'api_calls': self.api_calls,
+            'duration': self.duration,
+            'rate': self.rate,
+        }
+
+
+class SubscriptionSweeper:
+    """Периодическая перепроверка подписки зарегистрированных пользователей"""
+
+    def __init__(self, api_rate: float, api_share: float, interval: float, batch_size: int = 200):
+        """
+        Args:
+            api_rate: Общий бюджет вызовов Bot API в секунду
+            api_share: Доля бюджета, доступная перепроверке
+            interval: Интервал между проходами в секундах (0 — только по запросу)
+            batch_size: Пользователей в одной пачке
+        """
+        self.bucket = TokenBucket(rate=api_rate * api_share, capacity=1)
+        self.interval = interval
+        self.batch_size = batch_size
+        self.current: Optional[SweepReport] = None
+        self.last_report: Optional[SweepReport] = None
+        self._bot: Optional[Bot] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    def start(self, bot: Bot):
+        """Запустить фоновую перепроверку"""
+        self._bot = bot
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановить фоновую перепроверку"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def trigger(self) -> bool:
+        """
+        Запустить проход вне расписания
+
+        Returns:
+            False если проход уже идёт или перепроверка не запущена
+        """
+        if self._task is None or self._task.done() or self.current is not None:
+            return False
+        self._wakeup.set()
+        return True
+
+    async def _run(self):
+        """Цикл перепроверки"""
+        while True:
+            try:
+                if self.interval:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+                else:
+                    await self._wakeup.wait()
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"❌ Ошибка перепроверки подписок: {e}", exc_info=True)
+                self.current = None
+
+    async def sweep(self) -> SweepReport:
+        """Один проход по всем зарегистрированным пользователям"""
+        report = self.current = SweepReport()
+        started = time.monotonic()
+        logger.info(f"🔄 Перепроверка подписок: старт (до {self.bucket.rate:.1f} вызовов API/с)")
+
+        async for batch in iter_user_ids(User.is_registered == True, User.is_active == True,
+                                         batch_size=self.batch_size):
+            await self._wait_for_capacity()
+            results = await asyncio.gather(*(self._check_user(user_id, report) for user_id in batch))
+            await self._write_changes(batch, results, report)
+            report.duration = time.monotonic() - started
+
+        report.finished_at = datetime.utcnow()
+        report.duration = time.monotonic() - started
+        self.last_report, self.current = report, None
+        logger.info(
+            f"✅ Перепроверка подписок: {report.checked} польз. за {report.duration:.0f} с "
+            f"({report.rate:.1f}/с, {report.api_calls} вызовов API), "
+            f"подписались {report.subscribed}, отписались {report.unsubscribed}, ошибок {report.errors}"
+        )
+        return report
+
+    async def _wait_for_capacity(self):
+        """Не начинать пачку, пока бот перегружен интерактивными запросами"""
+        while load_monitor.overloaded:
+            await asyncio.sleep(1)
+
+    async def _check_user(self, user_id: int, report: SweepReport) -> Optional[bool]:
+        """
+        Проверить подписку пользователя на все каналы (по одному вызову API за раз)
+
+        Returns:
+            True/False или None, если проверить не удалось
+        """
+        for channel in REQUIRED_CHANNELS:
+            # Состав канала подтверждает подписку без вызова API; отсутствие в нём
+            # ничего не доказывает (состав неполный, если упёрся в лимит загрузки)
+            if roster_service is not None and roster_service.is_member(user_id, channel.chat_id):
+                continue
+            await self.bucket.acquire()
+            report.api_calls += 1
+            result = await check_channel_member(self._bot, channel, user_id)
+            if result is None:
+                report.errors += 1
+                self.bucket.pause(ERROR_BACKOFF)
+                return None
+            if channel.tracked:
+                # Исправляет таблицу членства, если событие chat_member было пропущено
+                channel_members.record(channel.chat_id, user_id, 'member' if result else 'left', result)
+            if not result:
+                return False
+        return True
+
+    async def _write_changes(self, batch: List[int], results: List[Optional[bool]], report: SweepReport):
+        """Записать изменившиеся флаги (через очередь записи — одной пачкой)"""
+        for user_id, subscribed in zip(batch, results):
+            if subscribed is None:
+                continue
+            report.checked += 1
+            state = await get_user_state(user_id)
+            if state is None or state.is_subscribed == subscribed:
+                continue
+            await update_user(user_id, is_subscribed=subscribed)
+            # Старые ответы кэша членства противоречат свежей проверке
+            for channel in REQUIRED_CHANNELS:
+                membership_cache.invalidate(user_id, channel.chat_id)
+            if subscribed:
+                report.subscribed += 1
+            else:
+                report.unsubscribed += 1
+
+
+# Глобальная перепроверка подписок
+subscription_sweeper = SubscriptionSweeper(
+    api_rate=settings.BOT_API_RATE,
+    api_share=settings.SUBSCRIPTION_SWEEP_API_SHARE,
+    interval=settings.SUBSCRIPTION_SWEEP_INTERVAL_HOURS * 3600,
+    batch_size=settings.SUBSCRIPTION_SWEEP_BATCH
+)
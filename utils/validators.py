@@ -1,151 +1,121 @@
 """
 Валидация и проверки
 """
+import asyncio
 import logging
 from typing import Optional
 from aiogram import Bot
 from aiogram.types import ChatMember
-from config import settings
+from config import settings, ADMIN_ID_SET
+from utils.channel_helper import RequiredChannel, REQUIRED_CHANNELS, SUBSCRIBED_STATUSES
+from utils.membership import membership_cache
+from database.channel_members import channel_members
+from utils.roster import roster_service
 
 logger = logging.getLogger(__name__)
 
 
-def _normalize_channel_id(channel_id):
+async def check_channel_member(bot: Bot, channel: RequiredChannel, user_id: int) -> Optional[bool]:
     """
-    Преобразует ID канала в правильный формат для Telegram API
+    Проверка подписки на один канал через Bot API (по ID, при ошибке — по username)
+    
+    Без кэшей и таблицы членства: каждый вызов — запрос к Telegram.
     
     Args:
-        channel_id: ID канала (может быть строкой, числом или username)
+        bot: Экземпляр бота
+        channel: Обязательный канал
+        user_id: ID пользователя
         
     Returns:
-        Нормализованный ID канала (int для ID или str для username)
+        True если подписан, False если нет, None если проверить не удалось
     """
-    # Если это username (начинается с @), возвращаем как есть
-    if isinstance(channel_id, str) and channel_id.startswith('@'):
-        return channel_id
-    
-    # Если это строка с числом, преобразуем в int
-    if isinstance(channel_id, str):
-        # Убираем пробелы
-        channel_id = channel_id.strip()
-        # Если это username без @, добавляем @
-        if not channel_id.startswith('@') and not channel_id.lstrip('-').isdigit():
-            return f"@{channel_id}"
-        # Пытаемся преобразовать в число
+    try:
+        member = await bot.get_chat_member(chat_id=channel.chat_id, user_id=user_id)
+        subscribed = member.status in SUBSCRIBED_STATUSES
+        logger.info(f"   ✅ Канал {channel.label}: статус={member.status}, подписан={subscribed}")
+        return subscribed
+    except Exception as e:
+        logger.warning(f"   ⚠️ Ошибка проверки канала {channel.label} по ID ({channel.chat_id}): {e}")
+    
+    # Если не получилось по ID, пробуем через username (для ID, полученных при запуске, не нужно)
+    if not channel.resolved and channel.username and channel.username != channel.chat_id:
         try:
-            channel_id = int(channel_id)
-        except ValueError:
-            # Если не число, возможно это username без @
-            return f"@{channel_id}" if not channel_id.startswith('@') else channel_id
+            logger.info(f"   🔄 Пробуем канал через username: {channel.username}")
+            member = await bot.get_chat_member(chat_id=channel.username, user_id=user_id)
+            subscribed = member.status in SUBSCRIBED_STATUSES
+            logger.info(f"   ✅ Канал {channel.username}: статус={member.status}, подписан={subscribed}")
+            return subscribed
+        except Exception as e:
+            logger.error(f"   ❌ Ошибка проверки канала через username {channel.username}: {e}")
+    return None
+
+
+async def _lookup_channel(bot: Bot, channel: RequiredChannel, user_id: int) -> Optional[bool]:
+    """
+    Проверка подписки на один канал: по составу канала и таблице членства, для неизвестных — через API
+    
+    Args:
+        bot: Экземпляр бота
+        channel: Обязательный канал
+        user_id: ID пользователя
+        
+    Returns:
+        True если подписан, False если нет, None если проверить не удалось
+    """
+    # Состав загружается периодически: «есть в составе» надёжно, а «нет» может означать
+    # только что подписавшегося — такие проверяются дальше
+    if roster_service is not None and roster_service.is_member(user_id, channel.chat_id):
+        return True
     
-    # Если это положительное число, преобразуем в формат канала -100XXXXXXXXXX
-    if isinstance(channel_id, int) and channel_id > 0:
-        # Для каналов Telegram использует формат: -100 + ID
-        # Но нужно правильно сформировать число
-        # Например: 1541113270 -> -1001541113270
-        channel_str = str(channel_id)
-        return int(f"-100{channel_str}")
+    if not channel.tracked:
+        return await check_channel_member(bot, channel, user_id)
     
-    # Если уже отрицательное число, возвращаем как есть
-    return channel_id
+    subscribed = await channel_members.get(channel.chat_id, user_id)
+    if subscribed is not None:
+        return subscribed
+    
+    subscribed = await check_channel_member(bot, channel, user_id)
+    if subscribed is not None:
+        # Дальше статус будут обновлять события chat_member
+        channel_members.record(channel.chat_id, user_id, 'member' if subscribed else 'left', subscribed)
+    return subscribed
 
 
 async def check_channel_subscription(bot: Bot, user_id: int) -> bool:
     """
-    Проверка подписки пользователя на оба канала
+    Проверка подписки пользователя на все обязательные каналы
+    
+    Каналы проверяются одновременно через кэш членства; для каналов,
+    где бот — администратор, ответ берётся из таблицы членства.
+    При первом «не подписан» остальные проверки перестают ждать.
     
     Args:
         bot: Экземпляр бота
         user_id: ID пользователя
         
     Returns:
-        True если подписан на оба канала, иначе False
+        True если подписан на все каналы, иначе False
     """
+    logger.info(f"🔍 Проверка подписки пользователя {user_id} ({len(REQUIRED_CHANNELS)} каналов)")
+    tasks = [
+        asyncio.create_task(membership_cache.is_member(
+            user_id, channel.chat_id, lambda channel=channel: _lookup_channel(bot, channel, user_id)
+        ))
+        for channel in REQUIRED_CHANNELS
+    ]
     try:
-        # Получаем ID каналов из настроек
-        channel1_raw = settings.CHANNEL1_ID
-        channel2_raw = settings.CHANNEL2_ID
-        
-        # Нормализуем ID каналов
-        channel1_id = _normalize_channel_id(channel1_raw)
-        channel2_id = _normalize_channel_id(channel2_raw)
-        
-        logger.info(f"🔍 Проверка подписки пользователя {user_id}")
-        logger.info(f"   Канал 1: {channel1_raw} -> {channel1_id} (тип: {type(channel1_id).__name__})")
-        logger.info(f"   Канал 2: {channel2_raw} -> {channel2_id} (тип: {type(channel2_id).__name__})")
-        
-        # Проверяем первый канал
-        subscribed1 = False
-        channel1_checked = False
-        
-        # Сначала пробуем по ID
-        try:
-            member1 = await bot.get_chat_member(
-                chat_id=channel1_id,
-                user_id=user_id
-            )
-            subscribed1 = member1.status in ['member', 'administrator', 'creator']
-            logger.info(f"   ✅ Канал 1 (ID {channel1_id}): статус={member1.status}, подписан={subscribed1}")
-            channel1_checked = True
-        except Exception as e:
-            logger.warning(f"   ⚠️ Ошибка проверки канала 1 по ID ({channel1_id}): {e}")
-        
-        # Если не получилось по ID, пробуем через username
-        if not channel1_checked and hasattr(settings, 'CHANNEL1_USERNAME') and settings.CHANNEL1_USERNAME:
-            try:
-                username = settings.CHANNEL1_USERNAME.replace('@', '').strip()
-                if not username.startswith('@'):
-                    username = f"@{username}"
-                logger.info(f"   🔄 Пробуем канал 1 через username: {username}")
-                member1 = await bot.get_chat_member(chat_id=username, user_id=user_id)
-                subscribed1 = member1.status in ['member', 'administrator', 'creator']
-                logger.info(f"   ✅ Канал 1 (через username {username}): статус={member1.status}, подписан={subscribed1}")
-                channel1_checked = True
-            except Exception as e2:
-                logger.error(f"   ❌ Ошибка проверки канала 1 через username: {e2}")
-        
-        if not channel1_checked:
-            subscribed1 = False
-        
-        # Проверяем второй канал
-        subscribed2 = False
-        channel2_checked = False
-        
-        # Сначала пробуем по ID
-        try:
-            member2 = await bot.get_chat_member(
-                chat_id=channel2_id,
-                user_id=user_id
-            )
-            subscribed2 = member2.status in ['member', 'administrator', 'creator']
-            logger.info(f"   ✅ Канал 2 (ID {channel2_id}): статус={member2.status}, подписан={subscribed2}")
-            channel2_checked = True
-        except Exception as e:
-            logger.warning(f"   ⚠️ Ошибка проверки канала 2 по ID ({channel2_id}): {e}")
-        
-        # Если не получилось по ID, пробуем через username
-        if not channel2_checked and hasattr(settings, 'CHANNEL2_USERNAME') and settings.CHANNEL2_USERNAME:
-            try:
-                username = settings.CHANNEL2_USERNAME.replace('@', '').strip()
-                if not username.startswith('@'):
-                    username = f"@{username}"
-                logger.info(f"   🔄 Пробуем канал 2 через username: {username}")
-                member2 = await bot.get_chat_member(chat_id=username, user_id=user_id)
-                subscribed2 = member2.status in ['member', 'administrator', 'creator']
-                logger.info(f"   ✅ Канал 2 (через username {username}): статус={member2.status}, подписан={subscribed2}")
-                channel2_checked = True
-            except Exception as e2:
-                logger.error(f"   ❌ Ошибка проверки канала 2 через username: {e2}")
-        
-        if not channel2_checked:
-            subscribed2 = False
-        
-        result = subscribed1 and subscribed2
-        logger.info(f"   📊 Результат проверки: {result} (канал1={subscribed1}, канал2={subscribed2})")
-        return result
+        for completed in asyncio.as_completed(tasks):
+            if not await completed:
+                logger.info(f"   📊 Результат проверки: False")
+                return False
+        logger.info(f"   📊 Результат проверки: True")
+        return True
     except Exception as e:
         logger.error(f"❌ Критическая ошибка при проверке подписки: {e}", exc_info=True)
         return False
+    finally:
+        for task in tasks:
+            task.cancel()
 
 
 def is_admin(user_id: int) -> bool:
@@ -158,7 +128,7 @@ def is_admin(user_id: int) -> bool:
     Returns:
         True если администратор, иначе False
     """
-    return user_id in settings.admin_ids_list
+    return user_id in ADMIN_ID_SET
 
 
 def validate_text(text: str, max_length: int = 4096) -> bool: